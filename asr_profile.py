@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASR 解码参数评测脚本
+功能：用一段本地参考音频及其校对过的文本，对模型大小、compute_type、beam_size、VAD、
+     线程数（以及批量大小）做网格评测，记录实时率 RTF、进程内存峰值与字错率 CER，
+     输出排序报告，并推荐字错率达标的配置中最快的一组
+
+每组配置在新的子进程中加载模型并解码，进程内存峰值只反映该组配置（模型加载时间计入报告，但不计入 RTF）。
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import resource
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from prep_audio import SAMPLE_RATE
+from quote_verifier import normalize
+from transcribe import load_config, load_model, load_audio, decode
+
+
+# 计时前先解码一小段音频，排除首次推理的初始化开销
+WARMUP_SECONDS = 10
+
+
+def peak_rss_mb() -> float:
+    """当前进程的内存峰值（MB；Linux 的 ru_maxrss 单位为 KB，macOS 为字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def load_reference(path: str) -> str:
+    """
+    加载参考文本
+
+    Args:
+        path: 纯文本文件，或 transcript.json 格式的校对结果（拼接各片段文本）
+
+    Returns:
+        参考文本
+    """
+    reference_path = Path(path)
+    if reference_path.suffix == ".json":
+        with open(reference_path, "r", encoding="utf-8") as f:
+            return "".join(seg["text"] for seg in json.load(f)["segments"])
+    return reference_path.read_text(encoding="utf-8")
+
+
+def char_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    字错率 CER = 编辑距离 / 参考文本字数（去掉空白与标点后按字符比较）
+
+    Args:
+        reference: 参考文本
+        hypothesis: 转写文本
+
+    Returns:
+        字错率（可能大于 1）
+    """
+    ref = normalize(reference)
+    hyp = normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    # 按行滚动的 Levenshtein 距离
+    previous = list(range(len(hyp) + 1))
+    for i, ref_char in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_char != hyp_char)
+            ))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def build_grid(args, asr_config: dict) -> list:
+    """
+    展开评测网格；未指定的维度取 config.yaml 中的当前值
+
+    Returns:
+        [(模型组配置, [解码参数, ...]), ...]，模型组配置包含 model_size / compute_type / cpu_threads
+    """
+    models = args.models or [asr_config.get("model_path") or asr_config["model_size"]]
+    compute_types = args.compute_types or [asr_config["compute_type"]]
+    threads = args.threads or [asr_config.get("cpu_threads", 0)]
+    beam_sizes = args.beam_sizes or [asr_config.get("beam_size", 5)]
+    vad_filters = [v == "on" for v in args.vad] if args.vad else [asr_config.get("vad_filter", True)]
+    batch_sizes = args.batch_sizes or [asr_config.get("batch_size", 1)]
+
+    runs = []
+    for beam_size, vad_filter, batch_size in itertools.product(beam_sizes, vad_filters, batch_sizes):
+        # 批量解码总是按 VAD 切分，与 vad_filter=false 的组合重复
+        if batch_size > 1 and not vad_filter:
+            continue
+        runs.append({"beam_size": beam_size, "vad_filter": vad_filter, "batch_size": batch_size})
+
+    return [
+        ({"model_size": model, "compute_type": compute_type, "cpu_threads": cpu_threads}, runs)
+        for model, compute_type, cpu_threads in itertools.product(models, compute_types, threads)
+    ]
+
+
+def _profile_run(args: tuple) -> dict:
+    """
+    在子进程中加载模型并评测一组解码参数
+
+    ru_maxrss 是整个进程的内存峰值，因此每组配置使用独立的子进程。
+
+    Args:
+        args: (asr 配置, 模型组配置, 解码参数, 音频数组)
+
+    Returns:
+        评测结果（含转写文本 hypothesis）
+    """
+    asr_config, group, run, audio = args
+    # model_size 可以是模型名或本地模型目录，不再使用 model_path
+    run_config = {**asr_config, **group, **run, "model_path": None}
+    result = {**group, **run}
+    print(f"\n[评测] {describe_config(result)}")
+
+    start = time.perf_counter()
+    model = load_model(run_config, cpu_threads=group["cpu_threads"])
+    result["load_seconds"] = round(time.perf_counter() - start, 2)
+
+    segments, _ = decode(model, audio[:WARMUP_SECONDS * SAMPLE_RATE], run_config)
+    for _ in segments:
+        pass
+
+    start = time.perf_counter()
+    segments, _ = decode(model, audio, run_config)
+    texts = [seg.text.strip() for seg in segments]
+    result["decode_seconds"] = round(time.perf_counter() - start, 2)
+    result["segments"] = len(texts)
+    result["hypothesis"] = "".join(texts)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def profile(audio_path: str, reference: str, config: dict, grid: list) -> tuple:
+    """
+    执行网格评测
+
+    Args:
+        audio_path: 参考音频路径
+        reference: 参考文本
+        config: 配置字典
+        grid: build_grid 的结果
+
+    Returns:
+        (评测结果列表（附加 rtf 与 cer）, 音频时长)
+    """
+    asr_config = config["asr"]
+    audio = load_audio(audio_path, asr_config)
+    duration = len(audio) / SAMPLE_RATE
+    print(f"[音频] {Path(audio_path).name}: {duration:.1f} 秒，参考文本 {len(normalize(reference))} 字")
+
+    results = []
+    for group, runs in grid:
+        for run in runs:
+            # 每组配置使用新的子进程，内存峰值互不影响
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                try:
+                    result = executor.submit(_profile_run, (asr_config, group, run, audio)).result()
+                except Exception as e:
+                    result = {**group, **run, "error": str(e)}
+                    print(f"  ⚠ {describe_config(result)} 评测失败: {e}")
+                    results.append(result)
+                    continue
+
+            hypothesis = result.pop("hypothesis")
+            result["rtf"] = round(result["decode_seconds"] / duration, 4)
+            result["cer"] = round(char_error_rate(reference, hypothesis), 4)
+            print(f"  {describe_config(result)}: RTF {result['rtf']:.3f}，CER {result['cer']:.2%}")
+            results.append(result)
+
+    return results, duration
+
+
+def rank(results: list, max_cer: float) -> list:
+    """
+    排序：字错率达标的配置按 RTF 从快到慢在前，其余按字错率从低到高，失败的配置最后
+
+    Returns:
+        排序后的结果列表，每项附加 passed
+    """
+    for result in results:
+        result["passed"] = "cer" in result and result["cer"] <= max_cer
+    return sorted(results, key=lambda r: (
+        "cer" not in r,
+        not r["passed"],
+        r["rtf"] if r["passed"] else r.get("cer", 0)
+    ))
+
+
+def describe_config(result: dict) -> str:
+    """配置的单行描述"""
+    threads = result["cpu_threads"] or "自动"
+    vad = "开" if result["vad_filter"] else "关"
+    return (
+        f"{result['model_size']} / {result['compute_type']} / beam {result['beam_size']} / "
+        f"VAD {vad} / 线程 {threads} / batch {result['batch_size']}"
+    )
+
+
+def recommended_yaml(result: dict, asr_config: dict) -> str:
+    """推荐配置对应的 config.yaml asr 片段"""
+    return "\n".join([
+        "asr:",
+        f"  model_size: {result['model_size']}",
+        f"  device: {asr_config['device']}",
+        f"  compute_type: {result['compute_type']}",
+        f"  beam_size: {result['beam_size']}",
+        f"  vad_filter: {'true' if result['vad_filter'] else 'false'}",
+        f"  cpu_threads: {result['cpu_threads']}",
+        f"  batch_size: {result['batch_size']}"
+    ])
+
+
+def format_report(ranked: list, meta: dict, asr_config: dict) -> str:
+    """生成 Markdown 报告"""
+    lines = [
+        "# ASR 解码参数评测",
+        "",
+        f"- 参考音频：{meta['audio']}（{meta['duration']:.1f} 秒）",
+        f"- 设备：{asr_config['device']}",
+        f"- 字错率阈值：{meta['max_cer']:.1%}",
+        "- RTF 为解码耗时 / 音频时长（不含模型加载）；内存峰值为子进程常驻内存，不含显存",
+        "",
+        "| 排名 | 模型 | compute_type | beam | VAD | 线程 | batch | RTF | CER | 内存峰值 (MB) | 加载 (s) |",
+        "|---:|---|---|---:|---|---:|---:|---:|---:|---:|---:|"
+    ]
+    for i, r in enumerate(ranked, 1):
+        if "cer" not in r:
+            lines.append(
+                f"| - | {r['model_size']} | {r['compute_type']} | {r['beam_size']} | "
+                f"{'开' if r['vad_filter'] else '关'} | {r['cpu_threads'] or '自动'} | {r['batch_size']} | "
+                f"失败：{r.get('error', '')} | | | |"
+            )
+            continue
+        mark = "" if r["passed"] else "（未达标）"
+        lines.append(
+            f"| {i} | {r['model_size']} | {r['compute_type']} | {r['beam_size']} | "
+            f"{'开' if r['vad_filter'] else '关'} | {r['cpu_threads'] or '自动'} | {r['batch_size']} | "
+            f"{r['rtf']:.3f} | {r['cer']:.2%}{mark} | {r['peak_rss_mb']:.0f} | {r['load_seconds']:.1f} |"
+        )
+
+    lines.append("")
+    best = meta.get("recommended")
+    if best is not None:
+        lines += ["## 推荐配置", "", "```yaml", recommended_yaml(best, asr_config), "```", ""]
+    else:
+        lines += ["## 推荐配置", "", "没有字错率达标的配置，可放宽 --max-cer 或加入更大的模型。", ""]
+    return "\n".join(lines)
+
+
+def save_report(ranked: list, meta: dict, asr_config: dict, output_dir: str = "outputs") -> tuple:
+    """保存 asr_profile.json 与 asr_profile.md"""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    json_path = output_path / "asr_profile.json"
+    md_path = output_path / "asr_profile.md"
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({**meta, "results": ranked}, f, ensure_ascii=False, indent=2)
+    md_path.write_text(format_report(ranked, meta, asr_config), encoding="utf-8")
+    return json_path, md_path
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="ASR 解码参数评测（速度 / 内存 / 字错率）",
+        epilog="示例: python asr_profile.py audio/ref_16k.wav audio/ref.txt "
+               "--models small medium large-v3 --compute-types int8 int8_float16 --beam-sizes 1 5"
+    )
+    parser.add_argument("audio", help="参考音频（建议 3-10 分钟的代表性片段）")
+    parser.add_argument("reference", help="参考文本：纯文本，或校对过的 transcript.json")
+    parser.add_argument("--models", nargs="+", help="模型名或本地模型目录（默认取 asr 配置）")
+    parser.add_argument("--compute-types", nargs="+", help="compute_type，如 int8 int8_float16 float16")
+    parser.add_argument("--beam-sizes", nargs="+", type=int, help="beam_size，如 1 3 5")
+    parser.add_argument("--vad", nargs="+", choices=["on", "off"], help="是否启用 VAD")
+    parser.add_argument("--threads", nargs="+", type=int, help="CPU 推理线程数（0 表示自动）")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, help="批量解码的窗口数（1 表示不批量）")
+    parser.add_argument("--device", help="推理设备（默认取 asr.device）")
+    parser.add_argument("--max-cer", type=float, default=0.1, help="推荐配置允许的最大字错率（默认 0.1）")
+    parser.add_argument("--output-dir", default="outputs", help="报告输出目录（默认 outputs）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        config = load_config()
+        asr_config = config["asr"]
+        if args.device:
+            asr_config["device"] = args.device
+
+        reference = load_reference(args.reference)
+        grid = build_grid(args, asr_config)
+        total = sum(len(runs) for _, runs in grid)
+
+        print("=" * 60)
+        print(f"ASR 解码参数评测：{len(grid)} 个模型组，共 {total} 组参数")
+        print("=" * 60)
+
+        results, duration = profile(args.audio, reference, config, grid)
+        ranked = rank(results, args.max_cer)
+        passed = [r for r in ranked if r["passed"]]
+
+        meta = {
+            "audio": str(args.audio),
+            "duration": round(duration, 2),
+            "device": asr_config["device"],
+            "max_cer": args.max_cer,
+            "recommended": passed[0] if passed else None
+        }
+        json_path, md_path = save_report(ranked, meta, asr_config, args.output_dir)
+
+        print(f"\n{'=' * 60}")
+        if passed:
+            best = passed[0]
+            print(f"✓ 推荐配置（字错率 ≤ {args.max_cer:.1%} 中最快）：{describe_config(best)}")
+            print(f"  RTF {best['rtf']:.3f}，CER {best['cer']:.2%}，内存峰值 {best['peak_rss_mb']:.0f} MB")
+            print("\n" + recommended_yaml(best, asr_config))
+        else:
+            print(f"⚠ 没有字错率 ≤ {args.max_cer:.1%} 的配置")
+        print(f"\n  报告: {md_path}（明细: {json_path}）")
+        print("=" * 60)
+
+    except Exception as e:
+        print(f"\n✗ 评测失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
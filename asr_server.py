@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻 ASR 服务
+功能：启动时按 config.yaml 的 asr 配置加载一次 Whisper 模型，之后通过本地 HTTP 接收转写任务，
+     返回与 transcribe.save_transcript 写出内容相同的 JSON，省去每期节目重复加载模型的开销
+
+接口：
+  GET  /health      服务状态
+  POST /transcribe  {"audio_path": "...", "in_memory": false}，返回转写结果 JSON
+"""
+
+import sys
+import json
+import copy
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from transcribe import load_config, load_model, transcribe_audio
+
+
+class ASRRequestHandler(BaseHTTPRequestHandler):
+    """处理转写请求；模型由服务器对象持有，同一时间只执行一个转写任务"""
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+
+        server = self.server
+        self._send_json(200, {
+            "status": "busy" if server.job_lock.locked() else "idle",
+            "model": server.config["asr"].get("model_path") or server.config["asr"]["model_size"],
+            "jobs_done": server.jobs_done
+        })
+
+    def do_POST(self):
+        if self.path != "/transcribe":
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            audio_path = request["audio_path"]
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"请求格式错误: {e}"})
+            return
+
+        server = self.server
+        config = copy.deepcopy(server.config)
+        config["asr"]["in_memory"] = request.get("in_memory", config["asr"].get("in_memory", False))
+
+        try:
+            with server.job_lock:
+                start = time.time()
+                transcript = transcribe_audio(audio_path, config, model=server.model)
+                server.jobs_done += 1
+            print(f"[完成] {audio_path}（{time.time() - start:.1f}s）")
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+            return
+        except Exception as e:
+            print(f"[错误] 转写失败: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        self._send_json(200, transcript)
+
+    def log_message(self, format, *args):
+        print(f"[请求] {self.address_string()} {format % args}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="常驻 ASR 服务")
+    parser.add_argument("--host", default=None, help="监听地址（默认 asr.server_host 或 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=None, help="监听端口（默认 asr.server_port 或 8765）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        config = load_config()
+        asr_config = config["asr"]
+        host = args.host or asr_config.get("server_host", "127.0.0.1")
+        port = args.port or asr_config.get("server_port", 8765)
+
+        print("=" * 60)
+        print("常驻 ASR 服务")
+        print("=" * 60)
+
+        start = time.time()
+        model = load_model(asr_config)
+        print(f"  模型加载耗时: {time.time() - start:.1f}s")
+
+        server = ThreadingHTTPServer((host, port), ASRRequestHandler)
+        server.config = config
+        server.model = model
+        server.job_lock = threading.Lock()
+        server.jobs_done = 0
+
+        print(f"\n[监听] http://{host}:{port}")
+        print(f"  客户端: python transcribe.py <音频文件> --server http://{host}:{port}")
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        print("\n[退出] ASR 服务已停止")
+    except Exception as e:
+        print(f"\n✗ 启动失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
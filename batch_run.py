@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量处理脚本
+功能：对多期播客执行完整流程，每期节目使用独立输出目录（outputs/<文件名>/），
+     并按阶段流水线并行：第 N+1 期的预处理与转写与第 N 期的 Map/Reduce 同时进行，
+     使 GPU（ASR）和 LLM 服务都保持忙碌
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import prep_audio
+import transcribe
+import chunk_and_map
+import reduce_and_qc
+import generate_wechat_html
+import metrics
+import summary_parser
+import transcript_store
+from llm_cache import build_cache
+from progress_file import PROGRESS_FILE_NAME
+from transcribe import load_config, load_model, transcribe_audio, save_transcript, transcribe_metrics
+from chunk_and_map import (
+    create_chunks, map_chunks, save_map_results, open_llm_client, MapJournal, map_stage_metrics
+)
+from reduce_and_qc import (
+    load_maps, generate_reduce_summary, quality_check_failed_maps, quality_check_timestamps,
+    quality_check_quotes, extract_structured_data, format_summary_md, save_results
+)
+
+
+AUDIO_SUFFIXES = {".m4a", ".mp3", ".wav", ".aac", ".flac"}
+
+
+def collect_audio_files(inputs: list) -> list:
+    """
+    收集待处理的音频文件
+
+    Args:
+        inputs: 目录或文件路径列表
+
+    Returns:
+        去重后的音频文件路径列表
+
+    Raises:
+        ValueError: 不同文件的文件名（不含扩展名）相同。每期节目的输出目录与预处理得到的
+                    <文件名>_16k.wav 都按文件名命名，同名文件会互相覆盖
+    """
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            files.extend(
+                p for p in sorted(path.iterdir())
+                if p.suffix.lower() in AUDIO_SUFFIXES and not p.stem.endswith("_16k")
+            )
+        elif path.exists():
+            files.append(path)
+        else:
+            print(f"  警告：文件不存在，已跳过: {item}")
+    files = list(dict.fromkeys(p.resolve() for p in files))
+
+    by_stem = {}
+    for path in files:
+        by_stem.setdefault(path.stem, []).append(path)
+    duplicates = {stem: paths for stem, paths in by_stem.items() if len(paths) > 1}
+    if duplicates:
+        lines = [f"  {stem}: " + "，".join(str(p) for p in paths) for stem, paths in duplicates.items()]
+        raise ValueError("以下音频文件名（不含扩展名）重复，输出目录会互相覆盖，请重命名后再处理:\n"
+                         + "\n".join(lines))
+    return files
+
+
+class BatchRunner:
+    """
+    多期节目流水线
+
+    三个阶段各有独立线程池：
+      asr  - 音频预处理 + 转写（每个线程持有一份 Whisper 模型）
+      llm  - 分块、Map、Reduce 与质检（共享同一个 LLM 客户端）
+      html - 生成微信 HTML
+    某期节目完成一个阶段后立即提交到下一阶段的线程池；
+    各子步骤的阶段指纹未变化时直接复用已有产物（force=True 时忽略指纹）。
+    """
+
+    def __init__(self, config: dict, client, cache, output_root: Path,
+                 asr_workers: int, llm_workers: int, html_workers: int, force: bool = False):
+        self.config = config
+        self.force = force
+        self.client = client
+        self.cache = cache
+        self.output_root = output_root
+
+        self.asr_pool = ThreadPoolExecutor(max_workers=asr_workers, thread_name_prefix="asr")
+        self.llm_pool = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="llm")
+        self.html_pool = ThreadPoolExecutor(max_workers=html_workers, thread_name_prefix="html")
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._futures = []
+        self.results = {}
+
+    def _model(self):
+        """当前 ASR 线程的 Whisper 模型（分段并行模式下由进程池自行加载）"""
+        if self.config["asr"].get("num_workers", 1) > 1:
+            return None
+        if getattr(self._local, "model", None) is None:
+            self._local.model = load_model(self.config["asr"])
+        return self._local.model
+
+    def _submit(self, pool: ThreadPoolExecutor, fn, episode: dict):
+        with self._lock:
+            self._futures.append(pool.submit(self._run_stage, fn, episode))
+
+    def _run_stage(self, fn, episode: dict):
+        name = episode["name"]
+        stage = fn.__name__.replace("_stage_", "")
+        print(f"\n[批量] {name}: 开始 {stage}")
+        start = time.time()
+        try:
+            next_stage = fn(episode)
+        except Exception as e:
+            print(f"\n[批量] ✗ {name}: {stage} 失败: {e}")
+            episode["status"] = f"失败（{stage}）: {e}"
+            return
+        finally:
+            episode["timings"][stage] = round(time.time() - start, 2)
+
+        print(f"\n[批量] {name}: 完成 {stage}（{episode['timings'][stage]:.1f}s）")
+        if next_stage is None:
+            episode["status"] = "完成"
+        else:
+            pool, next_fn = next_stage
+            self._submit(pool, next_fn, episode)
+
+    def _fresh(self, manifest) -> bool:
+        if not self.force and manifest.is_fresh():
+            print(manifest.skip_message())
+            return True
+        return False
+
+    def _stage_asr(self, episode: dict):
+        config = self.config
+        output_dir = episode["output_dir"]
+        audio_path = episode["audio"]
+
+        if not config["asr"].get("in_memory", False):
+            manifest = prep_audio.stage_manifest(audio_path, output_dir)
+            if self._fresh(manifest):
+                audio_path = str(prep_audio.wav_path_for(audio_path))
+            else:
+                start = time.time()
+                audio_path = prep_audio.convert_audio(audio_path)
+                manifest.record()
+                metrics.record_stage(output_dir, "prep_audio", {
+                    "wall_seconds": round(time.time() - start, 2),
+                    "wav_bytes": Path(audio_path).stat().st_size
+                }, config)
+
+        manifest = transcribe.stage_manifest(audio_path, config, output_dir)
+        if self._fresh(manifest):
+            episode["transcript"] = transcript_store.load_transcript(output_dir)
+        else:
+            start = time.time()
+            transcript = transcribe_audio(
+                audio_path, config, model=self._model(), progress_path=output_dir / PROGRESS_FILE_NAME
+            )
+            save_transcript(transcript, output_dir / "transcript.json")
+            manifest.record()
+            metrics.record_stage(
+                output_dir, "transcribe", transcribe_metrics(transcript, time.time() - start, config), config
+            )
+            episode["transcript"] = transcript
+
+        return self.llm_pool, self._stage_llm
+
+    def _stage_llm(self, episode: dict):
+        config = self.config
+        output_dir = episode["output_dir"]
+        transcript = episode.pop("transcript")
+
+        manifest = chunk_and_map.stage_manifest(config, output_dir)
+        if self._fresh(manifest):
+            maps = load_maps(output_dir)
+        else:
+            start = time.time()
+            chunks = create_chunks(transcript, config)
+            journal = MapJournal(output_dir / "maps.journal.jsonl")
+            maps = map_chunks(self.client, chunks, config, self.cache, journal)
+            save_map_results(maps, output_dir)
+            metrics.record_stage(
+                output_dir, "chunk_and_map", map_stage_metrics(maps, time.time() - start), config
+            )
+            if all("error" not in m for m in maps):
+                manifest.record()
+
+        manifest = reduce_and_qc.stage_manifest(config, output_dir)
+        if not self._fresh(manifest):
+            start = time.time()
+            llm_log = []
+            summary = generate_reduce_summary(self.client, maps, config, self.cache, llm_log)
+            qc_issues = quality_check_failed_maps(maps)
+            qc_issues += quality_check_timestamps(summary, transcript)
+            qc_issues += quality_check_quotes(summary, maps, transcript, config, output_dir)
+            tree = summary_parser.parse_summary(format_summary_md(summary, qc_issues))
+            structured_data = extract_structured_data(summary, tree)
+            save_results(summary, structured_data, qc_issues, output_dir, tree)
+            manifest.record()
+            metrics.record_stage(output_dir, "reduce_and_qc", {
+                "wall_seconds": round(time.time() - start, 2),
+                "qc_issues": len(qc_issues),
+                **metrics.llm_summary(llm_log)
+            }, config)
+
+        return self.html_pool, self._stage_html
+
+    def _stage_html(self, episode: dict):
+        output_dir = episode["output_dir"]
+        manifest = generate_wechat_html.stage_manifest(self.config, output_dir)
+        if self._fresh(manifest):
+            return None
+
+        start = time.time()
+        tree = generate_wechat_html.load_summary_tree(output_dir)
+        html = generate_wechat_html.render_wechat_html(tree, self.config)
+        (output_dir / "summary_wechat.html").write_text(html, encoding="utf-8")
+        manifest.record()
+        metrics.record_stage(output_dir, "generate_wechat_html", {
+            "wall_seconds": round(time.time() - start, 3)
+        }, self.config)
+        return None
+
+    def run(self, audio_files: list) -> list:
+        """
+        处理全部节目，阻塞直到所有阶段结束
+
+        Returns:
+            每期节目的状态与各阶段耗时
+        """
+        episodes = []
+        for audio in audio_files:
+            output_dir = self.output_root / audio.stem
+            output_dir.mkdir(parents=True, exist_ok=True)
+            episode = {
+                "name": audio.stem,
+                "audio": str(audio),
+                "output_dir": output_dir,
+                "status": "未完成",
+                "timings": {}
+            }
+            episodes.append(episode)
+            self._submit(self.asr_pool, self._stage_asr, episode)
+
+        # 阶段完成时会追加新的 future，循环等待直到没有新任务
+        while True:
+            with self._lock:
+                pending = [f for f in self._futures if not f.done()]
+            if not pending:
+                break
+            wait(pending)
+
+        for pool in (self.asr_pool, self.llm_pool, self.html_pool):
+            pool.shutdown()
+
+        return [
+            {
+                "name": ep["name"],
+                "audio": ep["audio"],
+                "output_dir": str(ep["output_dir"]),
+                "status": ep["status"],
+                "timings": ep["timings"]
+            }
+            for ep in episodes
+        ]
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="批量处理多期播客",
+        epilog="示例: python batch_run.py audio/ --asr-workers 1 --llm-workers 2"
+    )
+    parser.add_argument("inputs", nargs="+", help="音频目录或音频文件")
+    parser.add_argument("--output-root", default="outputs", help="输出根目录（每期节目一个子目录）")
+    parser.add_argument("--asr-workers", type=int, default=None,
+                        help="并行转写的节目数（默认 batch.asr_workers 或 1）")
+    parser.add_argument("--llm-workers", type=int, default=None,
+                        help="并行 Map/Reduce 的节目数（默认 batch.llm_workers 或 2）")
+    parser.add_argument("--html-workers", type=int, default=None,
+                        help="并行生成 HTML 的节目数（默认 batch.html_workers 或 1）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="跳过 LLM 响应缓存读取（新结果仍会写入缓存）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行所有阶段")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        print("=" * 60)
+        print("批量处理")
+        print("=" * 60)
+
+        config = load_config()
+        batch_config = config.get("batch", {}) or {}
+        asr_workers = args.asr_workers or batch_config.get("asr_workers", 1)
+        llm_workers = args.llm_workers or batch_config.get("llm_workers", 2)
+        html_workers = args.html_workers or batch_config.get("html_workers", 1)
+
+        try:
+            audio_files = collect_audio_files(args.inputs)
+        except ValueError as e:
+            print(f"\n✗ {e}")
+            sys.exit(1)
+        if not audio_files:
+            print("\n✗ 未找到音频文件")
+            sys.exit(1)
+
+        print(f"\n[批量] 共 {len(audio_files)} 期节目")
+        print(f"  阶段并行数: ASR {asr_workers} / LLM {llm_workers} / HTML {html_workers}")
+
+        output_root = Path(args.output_root)
+        cache = build_cache(config, bypass=args.no_cache)
+        summarizer_config = config["summarizer"]
+
+        start = time.time()
+        with ExitStack() as stack:
+            # 各请求单独传入超时，这里取 Map 与 Reduce 中较长的一个
+            timeout = max(summarizer_config.get("timeout", 120), summarizer_config.get("reduce_timeout", 300))
+            client = open_llm_client(stack, config, timeout)
+
+            runner = BatchRunner(
+                config, client, cache, output_root,
+                asr_workers, llm_workers, html_workers, force=args.force
+            )
+            results = runner.run(audio_files)
+
+        cache.report()
+
+        report_path = output_root / "batch_report.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+        done = sum(1 for r in results if r["status"] == "完成")
+        print(f"\n{'=' * 60}")
+        print(f"✓ 批量处理结束（{time.time() - start:.1f}s）")
+        print(f"  完成: {done}/{len(results)}")
+        for r in results:
+            timings = "，".join(f"{k} {v:.0f}s" for k, v in r["timings"].items())
+            print(f"  - {r['name']}: {r['status']}  {timings}")
+        print(f"  报告: {report_path}")
+        print(f"{'=' * 60}")
+
+        if done < len(results):
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"\n✗ 处理失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟 LLM 服务
+功能：实现 OpenAI 兼容的 /v1/chat/completions（含 stream=True 的 SSE），按配置的首 token 延迟、
+     生成速度与失败率返回符合 Map / Reduce 模板格式的内容，供基准测试离线运行
+
+用法：
+  python benchmarks/mock_llm_server.py --port 8900 --latency 0.3 --tokens-per-sec 80
+  然后将 summarizer.base_url 指向 http://127.0.0.1:8900/v1
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chunk_and_map import estimate_tokens
+
+
+TERM_PATTERN = re.compile(r"[A-Z][A-Za-z]+|[一-鿿]+（[A-Za-z]+）")
+SENTENCE_PATTERN = re.compile(r"[^。？！\n]{8,60}[。？！]")
+PACK_SEPARATOR_PATTERN = re.compile(r"^=== 第 (\d+) 段 ===$", re.MULTILINE)
+CHUNK_PATTERN = re.compile(r"## Chunk \d+ \[([^\]]+)\]\n(.*?)(?=\n## Chunk |\Z)", re.DOTALL)
+
+
+def _time_range(text: str) -> str:
+    match = re.search(r"\[(\d{2}:\d{2}) - (\d{2}:\d{2})\]", text)
+    return f"{match.group(1)}-{match.group(2)}" if match else "00:00-00:00"
+
+
+def map_response(prompt: str) -> str:
+    """按 Map 模板格式，从原文中摘取句子作为要点与引文"""
+    text = prompt.split("【文本】", 1)[-1].split("请以如下格式输出", 1)[0]
+    time_range = _time_range(text)
+    sentences = SENTENCE_PATTERN.findall(text) or ["本段内容较少。"]
+    terms = list(dict.fromkeys(TERM_PATTERN.findall(text)))[:5]
+
+    lines = ["## 标题", f"讨论{sentences[0][:8]}", "", "## 要点"]
+    lines += [f"- {s}" for s in sentences[:6]]
+    lines += ["", "## 关键引文"]
+    lines += [f'> "{s.rstrip("。？！")}" [{time_range}]' for s in sentences[1:3]]
+    lines += ["", "## 名词术语"]
+    lines += [f"- {t}" for t in terms] or ["- 无"]
+    lines += ["", "## 问答（如有）", "无"]
+    return "\n".join(lines)
+
+
+def packed_map_response(prompt: str) -> str:
+    """多个小分块合并的 Map 请求：逐段按 Map 模板回复，并保留分隔行"""
+    text = prompt.split("【文本】", 1)[-1].split("请按段落顺序输出", 1)[0]
+    parts = PACK_SEPARATOR_PATTERN.split(text)[1:]
+    sections = [
+        f"=== 第 {n} 段 ===\n" + map_response(f"【文本】{body}")
+        for n, body in zip(parts[::2], parts[1::2])
+    ]
+    return "\n\n".join(sections)
+
+
+def _parse_chunks(prompt: str) -> list:
+    chunks = []
+    for time_range, body in CHUNK_PATTERN.findall(prompt):
+        title = re.search(r"## 标题\n(.+)", body)
+        chunks.append({
+            "range": time_range.replace(" ", ""),
+            "title": title.group(1).strip() if title else "未命名章节",
+            "points": re.findall(r"^- (.+)$", body, re.MULTILINE)[:3],
+            "quotes": re.findall(r'^> .+$', body, re.MULTILINE)[:1]
+        })
+    return chunks
+
+
+def reduce_response(prompt: str) -> str:
+    """按最终 Reduce 模板格式整合分段总结"""
+    chunks = _parse_chunks(prompt)
+    lines = ["# 播客总结", "", "## 一屏速览（3-5点）"]
+    lines += [f"- {c['points'][0]}" for c in chunks[:5] if c["points"]]
+    lines += ["", "## 时间轴目录"]
+    lines += [f"- [{c['range']}] {c['title']}" for c in chunks]
+    lines += ["", "## 深度要点"]
+    for c in chunks:
+        lines += ["", f"### {c['title']}"]
+        lines += [f"- {p}" for p in c["points"]]
+        lines += [f"  {q}" for q in c["quotes"]]
+    lines += ["", "## 结论/启示/行动建议", "- 持续关注行业变化", "- 建议结合自身业务评估", ""]
+    lines += ["## 人名/组织/术语表", "- **英伟达**（NVIDIA）- [00:00] - GPU 厂商"]
+    return "\n".join(lines)
+
+
+def intermediate_response(prompt: str) -> str:
+    """按中间 Reduce 模板格式合并一组分段总结"""
+    chunks = _parse_chunks(prompt)
+    lines = ["## 标题", chunks[0]["title"] if chunks else "合并章节", "", "## 时间轴"]
+    lines += [f"- [{c['range']}] {c['title']}" for c in chunks]
+    lines += ["", "## 要点"]
+    lines += [f"- {c['points'][0]}" for c in chunks if c["points"]]
+    lines += ["", "## 关键引文"]
+    lines += [q for c in chunks for q in c["quotes"]]
+    lines += ["", "## 名词术语", "- 英伟达（NVIDIA）"]
+    return "\n".join(lines)
+
+
+def build_response(messages: list) -> str:
+    """根据提示词类型生成回复"""
+    prompt = messages[-1]["content"] if messages else ""
+    if "【文本】" in prompt and PACK_SEPARATOR_PATTERN.search(prompt):
+        return packed_map_response(prompt)
+    if "【文本】" in prompt:
+        return map_response(prompt)
+    if "更紧凑的分段总结" in prompt:
+        return intermediate_response(prompt)
+    if "【分段总结】" in prompt:
+        return reduce_response(prompt)
+    return "好的。"
+
+
+def split_tokens(text: str) -> list:
+    """按 estimate_tokens 的口径把文本切成 token 片段（中文逐字，其他字符每 4 个一组）"""
+    pieces = []
+    buffer = ""
+    for ch in text:
+        if "一" <= ch <= "鿿" or ch in "，。？！：；（）":
+            if buffer:
+                pieces.append(buffer)
+                buffer = ""
+            pieces.append(ch)
+        else:
+            buffer += ch
+            if len(buffer) >= 4:
+                pieces.append(buffer)
+                buffer = ""
+    if buffer:
+        pieces.append(buffer)
+    return pieces
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容接口；延迟、速度与失败率由服务器对象上的属性控制"""
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok", "requests": self.server.request_count})
+        else:
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+            return
+
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with server.lock:
+            server.request_count += 1
+            fail = server.rng.random() < server.failure_rate
+            slow = server.rng.random() < server.straggler_rate
+        # 落后请求：首 token 延迟与生成速度都按倍数放慢
+        slowdown = server.straggler_factor if slow else 1.0
+
+        time.sleep(server.latency * slowdown)
+        if fail:
+            status = 429 if server.rng.random() < 0.5 else 500
+            self._send_json(status, {"error": {"message": "mock failure", "type": "server_error"}})
+            return
+
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in request.get("messages", []))
+        pieces = split_tokens(build_response(request.get("messages", [])))
+        pieces = pieces[:request.get("max_tokens") or len(pieces)]
+
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            self._stream(request, pieces, prompt_tokens, include_usage, slowdown)
+            return
+
+        time.sleep(len(pieces) / server.tokens_per_sec * slowdown)
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{server.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(pieces),
+                "total_tokens": prompt_tokens + len(pieces)
+            }
+        })
+
+    def _stream(self, request: dict, pieces: list, prompt_tokens: int, include_usage: bool,
+                slowdown: float = 1.0):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        base = {
+            "id": f"chatcmpl-mock-{server.request_count}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "mock")
+        }
+
+        def send(data: dict):
+            self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        # 每 20ms 发送一批，避免逐 token sleep 的调度误差
+        batch = max(1, int(server.tokens_per_sec * 0.02))
+        try:
+            for i in range(0, len(pieces), batch):
+                time.sleep(len(pieces[i:i + batch]) / server.tokens_per_sec * slowdown)
+                for piece in pieces[i:i + batch]:
+                    send(dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+            send(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if include_usage:
+                send(dict(base, choices=[], usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(pieces),
+                    "total_tokens": prompt_tokens + len(pieces)
+                }))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如失控检测中止）
+            pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            print(f"[请求] {self.address_string()} {format % args}")
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.2,
+                 tokens_per_sec: float = 200, failure_rate: float = 0.0,
+                 seed: int = 0, verbose: bool = False, straggler_rate: float = 0.0,
+                 straggler_factor: float = 4.0) -> ThreadingHTTPServer:
+    """
+    在后台线程启动模拟服务
+
+    Args:
+        host: 监听地址
+        port: 监听端口（0 表示随机空闲端口）
+        latency: 首 token 延迟（秒）
+        tokens_per_sec: 生成速度
+        failure_rate: 请求失败概率（返回 429 或 500）
+        seed: 失败抽样的随机种子
+        verbose: 是否打印请求日志
+        straggler_rate: 落后请求的概率
+        straggler_factor: 落后请求的放慢倍数
+
+    Returns:
+        服务器对象；base_url 属性为 OpenAI 客户端使用的地址，调用 shutdown() 停止
+    """
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.tokens_per_sec = tokens_per_sec
+    server.failure_rate = failure_rate
+    server.straggler_rate = straggler_rate
+    server.straggler_factor = straggler_factor
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.verbose = verbose
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务（OpenAI 兼容）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口（默认 8900）")
+    parser.add_argument("--latency", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=200, help="生成速度（tokens/s）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="请求失败概率（0-1）")
+    parser.add_argument("--straggler-rate", type=float, default=0.0, help="落后请求的概率（0-1）")
+    parser.add_argument("--straggler-factor", type=float, default=4.0, help="落后请求的放慢倍数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = start_server(
+        args.host, args.port, args.latency, args.tokens_per_sec, args.failure_rate, args.seed, verbose=True,
+        straggler_rate=args.straggler_rate, straggler_factor=args.straggler_factor
+    )
+    print(f"[监听] {server.base_url}")
+    print(f"  延迟 {args.latency}s，速度 {args.tokens_per_sec} tokens/s，失败率 {args.failure_rate:.0%}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("\n[退出] 模拟服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试
+功能：用合成转写与本地模拟 LLM 服务离线测量分块、Map 并发吞吐、Reduce、结构化提取与 HTML 生成（含从缓存章节树渲染）的耗时，
+     结果写为 JSON，便于不同版本之间对比
+
+用法：
+  python benchmarks/run_benchmarks.py
+  python benchmarks/run_benchmarks.py --minutes 30 90 --concurrency 1 4 8 --tokens-per-sec 100
+  python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+"""
+
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import contextlib
+from pathlib import Path
+from contextlib import ExitStack
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synthetic import make_transcript
+from mock_llm_server import start_server
+from chunk_and_map import create_chunks, map_chunks, open_llm_client
+from reduce_and_qc import generate_reduce_summary, extract_structured_data
+from generate_wechat_html import generate_wechat_html, render_wechat_html
+from summary_parser import parse_summary
+
+
+def bench_config(base_url: str, args) -> dict:
+    """基准测试使用的配置（与 config.yaml 结构相同，不读取本地配置文件）"""
+    return {
+        "summarizer": {
+            "base_url": base_url,
+            "api_key": "bench",
+            "model": "mock",
+            "map_max_tokens": 1000,
+            "reduce_max_tokens": 1800,
+            "temperature": 0.3,
+            "timeout": 60,
+            "reduce_timeout": 120,
+            "max_concurrency": 1,
+            "stream": args.stream,
+            "map_pack_below_tokens": args.pack_below_tokens,
+            "hedge_percentile": args.hedge_percentile
+        },
+        "chunking": {"target_tokens": 1400, "overlap_tokens": 80},
+        "wechat": {
+            "title_prefix": "基准测试｜",
+            "author": "bench",
+            "accent_color": "#d92b2b",
+            "quote_color": "#666",
+            "highlight_color": "#c0392b"
+        },
+        "metrics": {"enabled": False}
+    }
+
+
+def timed(fn, repeat: int = 1) -> tuple:
+    """
+    多次执行并计时（屏蔽被测函数的进度输出）
+
+    Returns:
+        (最后一次的返回值, 各次耗时列表)
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            durations.append(time.perf_counter() - start)
+    return result, durations
+
+
+def summarize(durations: list) -> dict:
+    """耗时统计（秒）"""
+    return {
+        "median_s": round(statistics.median(durations), 6),
+        "min_s": round(min(durations), 6),
+        "runs": len(durations)
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_episode(client, config: dict, minutes: float, args) -> dict:
+    """对一个时长的合成节目执行全部基准项"""
+    transcript = make_transcript(minutes, seed=args.seed)
+    result = {"segments": len(transcript["segments"])}
+    print(f"\n[基准] {minutes:g} 分钟节目（{result['segments']} 个片段）")
+
+    chunks, durations = timed(lambda: create_chunks(transcript, config), args.repeat)
+    result["create_chunks"] = dict(summarize(durations), chunks=len(chunks))
+    print(f"  create_chunks: {result['create_chunks']['median_s'] * 1000:.1f} ms，{len(chunks)} 块")
+
+    result["map"] = {}
+    maps = None
+    for concurrency in args.concurrency:
+        config["summarizer"]["max_concurrency"] = concurrency
+        maps, durations = timed(lambda: map_chunks(client, chunks, config))
+        wall = durations[0]
+        failed = sum(1 for m in maps if "error" in m)
+        result["map"][str(concurrency)] = {
+            "wall_s": round(wall, 3),
+            "chunks_per_s": round(len(chunks) / wall, 3),
+            "failed": failed,
+            "packed": sum(1 for m in maps if "pack" in m),
+            "hedged": sum(1 for m in maps if (m.get("llm_stats") or {}).get("hedge"))
+        }
+        print(f"  map（并发 {concurrency}）: {wall:.2f}s，{len(chunks) / wall:.2f} 块/s，失败 {failed}")
+    config["summarizer"]["max_concurrency"] = max(args.concurrency)
+
+    llm_log = []
+    summary, durations = timed(lambda: generate_reduce_summary(client, maps, config, llm_log=llm_log))
+    result["reduce"] = {"wall_s": round(durations[0], 3), "llm_requests": len(llm_log), "chars": len(summary)}
+    print(f"  generate_reduce_summary: {durations[0]:.2f}s，{len(llm_log)} 次请求")
+
+    structured, durations = timed(lambda: extract_structured_data(summary), args.repeat)
+    result["extract_structured_data"] = summarize(durations)
+    print(f"  extract_structured_data: {result['extract_structured_data']['median_s'] * 1000:.2f} ms")
+
+    html, durations = timed(lambda: generate_wechat_html(summary, config), args.repeat)
+    result["generate_wechat_html"] = dict(summarize(durations), html_bytes=len(html.encode("utf-8")))
+    print(f"  generate_wechat_html: {result['generate_wechat_html']['median_s'] * 1000:.1f} ms")
+
+    tree = parse_summary(summary)
+    _, durations = timed(lambda: render_wechat_html(tree, config), args.repeat)
+    result["render_wechat_html"] = summarize(durations)
+    print(f"  render_wechat_html（缓存章节树）: {result['render_wechat_html']['median_s'] * 1000:.2f} ms")
+
+    def end_to_end():
+        e2e_chunks = create_chunks(transcript, config)
+        e2e_maps = map_chunks(client, e2e_chunks, config)
+        e2e_summary = generate_reduce_summary(client, e2e_maps, config)
+        extract_structured_data(e2e_summary)
+        return generate_wechat_html(e2e_summary, config)
+
+    _, durations = timed(end_to_end)
+    result["end_to_end"] = {"wall_s": round(durations[0], 3), "concurrency": max(args.concurrency)}
+    print(f"  端到端（并发 {max(args.concurrency)}）: {durations[0]:.2f}s")
+
+    return result
+
+
+def compare(current: dict, baseline: dict, prefix: str = "") -> list:
+    """对比两份报告中同名的耗时指标，返回变化描述"""
+    lines = []
+    for key, value in current.items():
+        if key not in baseline:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(baseline[key], dict):
+            lines.extend(compare(value, baseline[key], name + "."))
+        elif key in ("median_s", "wall_s") and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            lines.append(f"  {name}: {baseline[key]:.4f}s → {value:.4f}s（{change:+.1f}%）")
+    return lines
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="离线基准测试")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[30, 90], help="合成节目时长（分钟）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="Map 并发数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-sec", type=float, default=2000, help="模拟生成速度")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模拟请求失败概率")
+    parser.add_argument("--straggler-rate", type=float, default=0.0, help="模拟落后请求的概率")
+    parser.add_argument("--straggler-factor", type=float, default=4.0, help="模拟落后请求的放慢倍数")
+    parser.add_argument("--hedge-percentile", type=float, default=0,
+                        help="Map 对冲的延迟分位数（summarizer.hedge_percentile，0 不对冲；需同时指定 --stream）")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求（summarizer.stream）")
+    parser.add_argument("--pack-below-tokens", type=int, default=0,
+                        help="合并小分块的阈值（summarizer.map_pack_below_tokens，0 不合并）")
+    parser.add_argument("--repeat", type=int, default=5, help="纯 CPU 项的重复次数（取中位数）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", default=None, help="报告路径（默认 benchmarks/results/bench-<时间>.json）")
+    parser.add_argument("--compare", metavar="BASELINE", help="与已有报告对比")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        print("=" * 60)
+        print("基准测试")
+        print("=" * 60)
+
+        server = start_server(
+            latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+            failure_rate=args.failure_rate, seed=args.seed,
+            straggler_rate=args.straggler_rate, straggler_factor=args.straggler_factor
+        )
+        print(f"[模拟服务] {server.base_url}（延迟 {args.latency}s，{args.tokens_per_sec:g} tokens/s，"
+              f"失败率 {args.failure_rate:.0%}）")
+
+        report = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "episodes": {}
+        }
+
+        with ExitStack() as stack:
+            config = bench_config(server.base_url, args)
+            with contextlib.redirect_stdout(io.StringIO()):
+                client = open_llm_client(stack, config, 120)
+            for minutes in args.minutes:
+                report["episodes"][f"{minutes:g}min"] = run_episode(client, config, minutes, args)
+
+        server.shutdown()
+
+        output_path = Path(args.output) if args.output else (
+            ROOT / "benchmarks" / "results" / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        print(f"\n{'=' * 60}")
+        print(f"✓ 报告: {output_path}")
+
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"\n[对比] 基线 {baseline.get('revision')}（{baseline.get('timestamp')}）:")
+            for line in compare(report["episodes"], baseline.get("episodes", {})):
+                print(line)
+        print(f"{'=' * 60}")
+
+    except Exception as e:
+        print(f"\n✗ 基准测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成转写数据
+功能：按指定时长生成结构与 transcribe.py 输出一致的中文转写结果（固定随机种子，可复现），
+     供基准测试使用，无需音频与 ASR 模型
+"""
+
+import sys
+import json
+import random
+import argparse
+from pathlib import Path
+
+
+SUBJECTS = ["我们", "这家公司", "创始人", "投资人", "很多团队", "大模型", "这个行业", "用户", "产品经理", "市场"]
+VERBS = ["其实在思考", "正在改变", "很难判断", "一直低估了", "重新定义了", "需要关注", "逐渐接受了", "开始押注"]
+OBJECTS = [
+    "商业模式的可持续性", "算力成本的下降速度", "开源社区的影响力", "出海市场的机会",
+    "组织管理的效率", "长期主义的价值", "数据飞轮的壁垒", "用户留存的关键指标",
+    "定价策略的选择", "供应链的稳定性", "人才密度的重要性", "第二增长曲线"
+]
+FILLERS = ["嗯", "对", "就是说", "你知道吗", "怎么讲呢", "其实", "坦白讲"]
+TERMS = ["OpenAI", "英伟达（NVIDIA）", "红杉资本（Sequoia）", "Transformer", "SaaS", "GPU", "A 轮融资"]
+
+
+def make_sentence(rng: random.Random) -> str:
+    """生成一句口语化的中文句子"""
+    parts = []
+    if rng.random() < 0.3:
+        parts.append(rng.choice(FILLERS) + "，")
+    parts.append(rng.choice(SUBJECTS) + rng.choice(VERBS) + rng.choice(OBJECTS))
+    if rng.random() < 0.25:
+        parts.append("，比如 " + rng.choice(TERMS))
+    if rng.random() < 0.4:
+        parts.append("，" + rng.choice(SUBJECTS) + rng.choice(VERBS) + rng.choice(OBJECTS))
+    parts.append(rng.choice(["。", "。", "？", "！"]))
+    return "".join(parts)
+
+
+def make_transcript(minutes: float, seed: int = 42) -> dict:
+    """
+    生成合成转写结果
+
+    Args:
+        minutes: 节目时长（分钟）
+        seed: 随机种子
+
+    Returns:
+        与 transcript.json 结构相同的字典
+    """
+    rng = random.Random(seed)
+    duration = minutes * 60
+    segments = []
+    t = 0.0
+    while t < duration:
+        length = rng.uniform(2.0, 8.0)
+        end = min(duration, t + length)
+        segments.append({
+            "id": len(segments) + 1,
+            "start": round(t, 2),
+            "end": round(end, 2),
+            "text": make_sentence(rng)
+        })
+        # 片段之间偶尔留出静音
+        t = end + (rng.uniform(0.2, 1.5) if rng.random() < 0.2 else 0.0)
+
+    return {"language": "zh", "duration": round(duration, 2), "segments": segments}
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生成合成转写数据")
+    parser.add_argument("--minutes", type=float, default=60, help="节目时长（分钟，默认 60）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--output", default="outputs/transcript.json", help="输出路径")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    transcript = make_transcript(args.minutes, args.seed)
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(transcript, f, ensure_ascii=False, indent=2)
+    print(f"✓ 已生成 {args.minutes:g} 分钟合成转写: {output_path}（{len(transcript['segments'])} 个片段）")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,9 +6,41 @@
 
 import os
 import sys
-import json
 from pathlib import Path
 
+import metrics
+import transcript_store
+from progress_file import read_progress, PROGRESS_FILE_NAME
+
+
+def format_seconds(seconds: float) -> str:
+    """秒数转换为 H:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def describe_progress(progress: dict) -> str:
+    """进度文件的单行描述"""
+    if progress["status"] == "failed":
+        return f"失败: {progress.get('error', '未知错误')}"
+    if progress["status"] == "done":
+        return f"已完成，{progress['segments']} 个片段，耗时 {format_seconds(progress['elapsed'])}"
+    if not progress.get("duration"):
+        return "加载模型 / 检测语言中..."
+
+    text = (
+        f"{progress.get('percent', 0):.1f}%（{format_seconds(progress['audio_seconds'])} / "
+        f"{format_seconds(progress['duration'])}），{progress['segments']} 个片段"
+    )
+    if progress.get("rtf") is not None:
+        text += f"，RTF {progress['rtf']:.3f}"
+    if progress.get("eta_seconds") is not None:
+        text += f"，预计剩余 {format_seconds(progress['eta_seconds'])}"
+    if progress.get("stale"):
+        text += "（长时间未更新，进程可能已中断）"
+    return text
+
+
 def check_progress():
     """检查转写进度"""
 
@@ -24,23 +56,28 @@ def check_progress():
 
     # 检查转写结果文件
     transcript_file = output_dir / "transcript.json"
-    if not transcript_file.exists():
+    progress = read_progress(output_dir / PROGRESS_FILE_NAME)
+    if progress and progress["status"] in ("running", "failed"):
+        print(f"\n[进行中] {progress['audio_file']}" if progress["status"] == "running" else "\n[X] 转写失败")
+        print(f"   {describe_progress(progress)}")
+    elif not transcript_file.exists():
         print("\n[进行中] 转写进行中...")
         print("   transcript.json 尚未生成")
         print("   这可能需要较长时间，请耐心等待")
     else:
         # 读取并显示转写结果信息
         try:
-            with open(transcript_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            # 只读查看：不生成或改写列式目录
+            meta = transcript_store.load_transcript_meta(output_dir)
+            duration = meta.get('duration') or 0
 
             print("\n[完成] 转写已完成！")
-            print(f"   语言: {data.get('language', 'N/A')}")
-            print(f"   时长: {data.get('duration', 0):.2f} 秒 ({data.get('duration', 0)/60:.1f} 分钟)")
-            print(f"   片段数: {len(data.get('segments', []))}")
+            print(f"   语言: {meta.get('language') or 'N/A'}")
+            print(f"   时长: {duration:.2f} 秒 ({duration/60:.1f} 分钟)")
+            print(f"   片段数: {meta.get('segment_count', 0)}")
 
-            # 显示前几个片段
-            segments = data.get('segments', [])
+            # 显示前几个片段（列式格式只解码预览用到的片段）
+            segments = transcript_store.load_transcript(output_dir, convert=False)["segments"]
             if segments:
                 print("\n前 3 个片段预览:")
                 for seg in segments[:3]:
@@ -53,6 +90,24 @@ def check_progress():
         except Exception as e:
             print(f"\n[警告] 读取转写文件时出错: {e}")
 
+    # 批量处理时每期节目有独立的输出目录
+    episode_progress = sorted(output_dir.glob(f"*/{PROGRESS_FILE_NAME}"))
+    if episode_progress:
+        print("\n[批量] 各期节目转写进度:")
+        for path in episode_progress:
+            episode = read_progress(path)
+            if episode:
+                print(f"   {path.parent.name}: {describe_progress(episode)}")
+
+    # 性能指标
+    stage_metrics = metrics.load_metrics(output_dir)
+    if stage_metrics:
+        print("\n[指标] 各阶段性能（metrics.json）:")
+        for line in metrics.format_summary(stage_metrics):
+            print(f"   {line}")
+        for name, size in stage_metrics.get("artifacts", {}).items():
+            print(f"   {name}: {size / 1024:.1f} KB")
+
     # 检查日志文件
     log_file = Path("transcribe.log")
     if log_file.exists():
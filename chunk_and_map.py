@@ -5,14 +5,31 @@
 功能：将转写文本分块，并对每块调用 LLM 生成结构化摘要
 """
 
+import os
+import re
 import json
+import time
+import hashlib
+import argparse
+import threading
 from pathlib import Path
 from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import httpx
 import yaml
 from openai import OpenAI
 
+import llm_retry
+import llm_router
+import llm_stream
+import metrics
+import transcript_store
+from llm_cache import LLMCache, build_cache
+from llm_hedge import Hedger, build_hedger
+from stage_manifest import StageManifest, text_digest
+
+
+MAP_SYSTEM_PROMPT = "你是专业的播客内容分析助手。"
 
 MAP_PROMPT_TEMPLATE = """你是中文播客速记与事实型总结助手。仅依据【文本】输出结构化结果，禁止臆测。
 
@@ -49,6 +66,49 @@ MAP_PROMPT_TEMPLATE = """你是中文播客速记与事实型总结助手。仅
 答：[回答]
 """
 
+# 多个小分块合并为一次请求时使用；每段以分隔行开头，回复按同样的分隔行拆回各分块
+MAP_PACK_SEPARATOR = "=== 第 {n} 段 ==="
+
+MAP_PACK_SEPARATOR_PATTERN = re.compile(r"^\s*=+\s*第\s*(\d+)\s*段\s*=+\s*$", re.MULTILINE)
+
+MAP_PACK_PROMPT_TEMPLATE = """你是中文播客速记与事实型总结助手。下面有 {count} 段彼此独立的【文本】，每段以"=== 第 N 段 ==="开头。
+请逐段、仅依据该段内容输出结构化结果，禁止臆测，不要把不同段落的内容合并。
+
+每段要求：
+1) 本段标题（≤12字）
+2) 本段要点（5-8条；要"事实+观点"）
+3) 关键引文（原句；附出现的时间范围，如[12:31-12:50]）
+4) 名词/人名/公司（中英对照；若无则空）
+5) 若出现问答，请用"问：/答："列出
+
+【文本】
+{texts}
+
+请按段落顺序输出，每段结果之前单独一行写出对应的分隔行，格式如下：
+
+=== 第 1 段 ===
+## 标题
+[本段标题]
+
+## 要点
+- [要点1]
+- [要点2]
+...
+
+## 关键引文
+> "[引文内容]" [时间范围]
+
+## 名词术语
+- [中文名]（[英文名]）
+
+## 问答（如有）
+问：[问题]
+答：[回答]
+
+=== 第 2 段 ===
+...
+"""
+
 
 def load_config():
     """加载配置文件"""
@@ -56,14 +116,9 @@ def load_config():
         return yaml.safe_load(f)
 
 
-def load_transcript():
-    """加载转写结果"""
-    transcript_path = Path("outputs/transcript.json")
-    if not transcript_path.exists():
-        raise FileNotFoundError("未找到 outputs/transcript.json，请先运行 transcribe.py")
-
-    with open(transcript_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+def load_transcript(output_dir: str = "outputs"):
+    """加载转写结果（内存映射的列式格式，见 transcript_store）"""
+    return transcript_store.load_transcript(output_dir)
 
 
 def format_time(seconds: float) -> str:
@@ -73,64 +128,243 @@ def format_time(seconds: float) -> str:
     return f"{minutes:02d}:{secs:02d}"
 
 
-def create_chunks(transcript: dict, target_chars: int, overlap_chars: int) -> list:
+def estimate_tokens(text: str) -> int:
     """
-    将转写结果分块
+    粗略估算文本的 token 数
+
+    中日韩字符按每字 1 个 token 计，其余字符按约 4 个字符 1 个 token 计。
+    """
+    cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
 
-    Args:
-        transcript: 转写结果字典
-        target_chars: 目标字符数
-        overlap_chars: 重叠字符数
+
+def build_token_counter(config: dict):
+    """
+    创建 token 计数函数
+
+    配置了 chunking.tokenizer（tokenizer.json 路径或 HuggingFace 模型名）且安装了
+    tokenizers 包时使用模型分词器精确计数，否则退回 estimate_tokens 估算。
 
     Returns:
-        分块列表，每块包含 {id, text, start_time, end_time, segment_ids}
+        接收文本、返回 token 数的函数
     """
-    segments = transcript["segments"]
-    chunks = []
-    current_chunk = {
-        "text": "",
-        "start_time": 0,
-        "end_time": 0,
-        "segment_ids": []
-    }
+    tokenizer_name = config.get("chunking", {}).get("tokenizer")
+    if not tokenizer_name:
+        return estimate_tokens
 
-    print(f"[分块] 目标大小: {target_chars} 字符，重叠: {overlap_chars} 字符")
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        print("  警告：未安装 tokenizers，使用估算 token 数（pip install tokenizers）")
+        return estimate_tokens
 
-    for seg in segments:
-        # 如果当前 chunk 为空，初始化起始时间
-        if not current_chunk["text"]:
-            current_chunk["start_time"] = seg["start"]
+    try:
+        if tokenizer_name.endswith(".json"):
+            tokenizer = Tokenizer.from_file(tokenizer_name)
+        else:
+            tokenizer = Tokenizer.from_pretrained(tokenizer_name)
+    except Exception as e:
+        print(f"  警告：加载分词器 {tokenizer_name} 失败（{e}），使用估算 token 数")
+        return estimate_tokens
+
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
 
-        current_chunk["text"] += seg["text"]
-        current_chunk["end_time"] = seg["end"]
-        current_chunk["segment_ids"].append(seg["id"])
 
-        # 检查是否达到目标大小
-        if len(current_chunk["text"]) >= target_chars:
-            chunks.append(current_chunk.copy())
-            print(f"  Chunk {len(chunks)}: {len(current_chunk['text'])} 字符, "
-                  f"{format_time(current_chunk['start_time'])} - {format_time(current_chunk['end_time'])}")
+class ChunkBuilder:
+    """
+    增量分块器
+
+    逐个接收转写片段，按 token 数累计，达到目标大小时立即产出一个完整分块，
+    便于在转写尚未结束时就开始 Map 摘要。分块只在片段边界切分，块间重叠
+    以完整片段保留，重叠片段的时间与 id 计入下一块。
+    """
+
+    def __init__(self, target_tokens: int, overlap_tokens: int, max_tokens: int = None,
+                 count_tokens=estimate_tokens):
+        """
+        Args:
+            target_tokens: 目标 token 数（达到即切分）
+            overlap_tokens: 块间重叠 token 上限（以完整片段计）
+            max_tokens: 单块 token 硬上限（加入片段会超出时先切分），默认不限制
+            count_tokens: token 计数函数
+        """
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.count = 0
+
+        # 当前块中的片段及其 token 数
+        self.segments = []
+        self.tokens = 0
+        # 上次切分后新加入的片段数（不含重叠片段）
+        self.new_segments = 0
+
+    @classmethod
+    def from_config(cls, config: dict, count_tokens=None):
+        """按 config.yaml 的 chunking 配置创建分块器"""
+        target_tokens, overlap_tokens, max_tokens = chunking_params(config)
+        return cls(target_tokens, overlap_tokens, max_tokens,
+                   count_tokens or build_token_counter(config))
+
+    def _emit(self) -> dict:
+        segments = [seg for seg, _ in self.segments]
+        chunk = {
+            "text": "".join(seg["text"] for seg in segments),
+            "start_time": segments[0]["start"],
+            "end_time": segments[-1]["end"],
+            "segment_ids": [seg["id"] for seg in segments],
+            "token_count": self.tokens
+        }
+
+        self.count += 1
+        print(f"  Chunk {self.count}: {chunk['token_count']} tokens, {len(chunk['text'])} 字符, "
+              f"{format_time(chunk['start_time'])} - {format_time(chunk['end_time'])}")
+
+        # 从末尾保留不超过 overlap_tokens 的完整片段作为下一块开头
+        keep = 0
+        kept_tokens = 0
+        for _, tokens in reversed(self.segments):
+            if kept_tokens + tokens > self.overlap_tokens or keep + 1 >= len(self.segments):
+                break
+            keep += 1
+            kept_tokens += tokens
+
+        self.segments = self.segments[len(self.segments) - keep:] if keep else []
+        self.tokens = kept_tokens
+        self.new_segments = 0
+        return chunk
+
+    def add(self, seg: dict):
+        """
+        加入一个转写片段
+
+        Args:
+            seg: 片段字典 {id, start, end, text}
+
+        Returns:
+            产生完成的分块时返回该分块，否则返回 None
+        """
+        tokens = self.count_tokens(seg["text"])
+        chunk = None
+
+        # 加入后会超出硬上限时，先把已有内容切成一块
+        if (self.max_tokens and self.new_segments
+                and self.tokens + tokens > self.max_tokens):
+            chunk = self._emit()
+            # 重叠片段加上新片段仍超限时放弃重叠
+            if self.tokens + tokens > self.max_tokens:
+                self.segments = []
+                self.tokens = 0
+
+        self.segments.append((seg, tokens))
+        self.tokens += tokens
+        self.new_segments += 1
+
+        if chunk is None and self.tokens >= self.target_tokens:
+            chunk = self._emit()
+
+        return chunk
+
+    def finish(self):
+        """
+        结束输入
+
+        Returns:
+            剩余内容组成的最后一个分块；只剩重叠片段或无内容时返回 None
+        """
+        if not self.new_segments:
+            return None
+        if not "".join(seg["text"] for seg, _ in self.segments).strip():
+            return None
+        return self._emit()
+
+
+def chunking_params(config: dict) -> tuple:
+    """
+    解析分块参数
+
+    目标大小优先取 chunking.target_tokens（兼容旧的 target_chars）；配置了
+    chunking.context_window 时，单块上限为 上下文窗口 - 提示词开销 - map_max_tokens，
+    目标大小不超过该上限。
+
+    Returns:
+        (target_tokens, overlap_tokens, max_tokens)，max_tokens 可能为 None
+    """
+    chunking_config = config.get("chunking", {})
+    target_tokens = chunking_config.get("target_tokens", chunking_config.get("target_chars", 1400))
+    overlap_tokens = chunking_config.get("overlap_tokens", chunking_config.get("overlap_chars", 80))
+
+    max_tokens = None
+    context_window = chunking_config.get("context_window")
+    if context_window:
+        prompt_overhead = chunking_config.get("prompt_overhead")
+        if prompt_overhead is None:
+            # 模板 + 系统提示 + 时间范围行，另加少量对话格式开销
+            prompt_overhead = estimate_tokens(MAP_SYSTEM_PROMPT + MAP_PROMPT_TEMPLATE) + 32
+        map_max_tokens = config.get("summarizer", {}).get("map_max_tokens", 0)
+        max_tokens = context_window - prompt_overhead - map_max_tokens
+        if max_tokens <= 0:
+            raise ValueError(
+                f"chunking.context_window ({context_window}) 不足以容纳提示词 ({prompt_overhead}) "
+                f"与 map_max_tokens ({map_max_tokens})"
+            )
+        target_tokens = min(target_tokens, max_tokens)
 
-            # 创建新 chunk，保留重叠部分
-            overlap_text = current_chunk["text"][-overlap_chars:] if overlap_chars > 0 else ""
-            current_chunk = {
-                "text": overlap_text,
-                "start_time": seg["end"],
-                "end_time": seg["end"],
-                "segment_ids": []
-            }
+    overlap_tokens = min(overlap_tokens, target_tokens // 2)
+    return target_tokens, overlap_tokens, max_tokens
+
+
+def create_chunks(transcript: dict, config: dict) -> list:
+    """
+    将转写结果分块
+
+    Args:
+        transcript: 转写结果字典
+        config: 配置字典（使用 chunking 配置）
+
+    Returns:
+        分块列表，每块包含 {text, start_time, end_time, segment_ids, token_count}
+    """
+    builder = ChunkBuilder.from_config(config)
+    limit = f"，上限: {builder.max_tokens} tokens" if builder.max_tokens else ""
+    print(f"[分块] 目标大小: {builder.target_tokens} tokens，重叠: {builder.overlap_tokens} tokens{limit}")
+
+    chunks = []
+    for seg in transcript["segments"]:
+        chunk = builder.add(seg)
+        if chunk is not None:
+            chunks.append(chunk)
 
     # 添加最后一个 chunk
-    if current_chunk["text"].strip():
-        chunks.append(current_chunk)
-        print(f"  Chunk {len(chunks)}: {len(current_chunk['text'])} 字符, "
-              f"{format_time(current_chunk['start_time'])} - {format_time(current_chunk['end_time'])}")
+    last_chunk = builder.finish()
+    if last_chunk is not None:
+        chunks.append(last_chunk)
 
     print(f"\n  总计: {len(chunks)} 个块")
     return chunks
 
 
-def summarize_chunk(client: OpenAI, chunk: dict, chunk_id: int, config: dict) -> dict:
+def chunk_time_range(chunk: dict) -> str:
+    """分块的时间范围标注，如 [01:05 - 03:40]"""
+    return f"[{format_time(chunk['start_time'])} - {format_time(chunk['end_time'])}]"
+
+
+def map_result(chunk: dict, chunk_id: int, summary: str, **extra) -> dict:
+    """组装一个分块的 Map 结果（maps.json 中的一项）"""
+    return {
+        "chunk_id": chunk_id,
+        "time_range": chunk_time_range(chunk),
+        "start_time": chunk["start_time"],
+        "end_time": chunk["end_time"],
+        "char_count": len(chunk["text"]),
+        "summary": summary,
+        **extra
+    }
+
+
+def summarize_chunk(client: OpenAI, chunk: dict, chunk_id: int, config: dict,
+                    cache: LLMCache = None, hedger: Hedger = None) -> dict:
     """
     对单个 chunk 生成摘要
 
@@ -139,6 +373,8 @@ def summarize_chunk(client: OpenAI, chunk: dict, chunk_id: int, config: dict) ->
         chunk: 分块数据
         chunk_id: 块 ID
         config: 配置字典
+        cache: LLM 响应缓存（可选）
+        hedger: 对冲策略（可选），请求耗时过长时发送重复请求
 
     Returns:
         摘要结果
@@ -146,66 +382,392 @@ def summarize_chunk(client: OpenAI, chunk: dict, chunk_id: int, config: dict) ->
     summarizer_config = config["summarizer"]
 
     # 添加时间信息到文本中
-    time_range = f"[{format_time(chunk['start_time'])} - {format_time(chunk['end_time'])}]"
-    text_with_time = f"{time_range}\n\n{chunk['text']}"
+    text_with_time = f"{chunk_time_range(chunk)}\n\n{chunk['text']}"
 
     prompt = MAP_PROMPT_TEMPLATE.format(text=text_with_time)
 
+    model = summarizer_config["model"]
+    max_tokens = summarizer_config["map_max_tokens"]
+    temperature = summarizer_config.get("temperature", 0.3)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(prompt, MAP_SYSTEM_PROMPT, model, max_tokens, temperature)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"\n[Map {chunk_id+1}] 命中缓存 ({len(chunk['text'])} 字符)")
+            return map_result(chunk, chunk_id, cached)
+
     print(f"\n[Map {chunk_id+1}] 生成摘要 ({len(chunk['text'])} 字符)...")
 
-    try:
-        response = client.chat.completions.create(
-            model=summarizer_config["model"],
-            messages=[
-                {"role": "system", "content": "你是专业的播客内容分析助手。"},
+    def request(cancel=None, route=None):
+        return llm_stream.complete(
+            client,
+            [
+                {"role": "system", "content": MAP_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=summarizer_config["map_max_tokens"],
-            temperature=summarizer_config.get("temperature", 0.3),
-            timeout=summarizer_config.get("timeout", 120)
+            model, max_tokens, temperature,
+            timeout=summarizer_config.get("timeout", 120),
+            config=config,
+            label=f"Map {chunk_id+1}",
+            max_sections=summarizer_config.get("map_max_sections", 8),
+            cancel=cancel,
+            route=route
         )
 
-        summary_text = response.choices[0].message.content.strip()
+    try:
+        if hedger is not None:
+            summary_text, stats = hedger.run(request, f"Map {chunk_id+1}")
+        else:
+            summary_text, stats = request()
 
-        result = {
-            "chunk_id": chunk_id,
-            "time_range": time_range,
-            "start_time": chunk["start_time"],
-            "end_time": chunk["end_time"],
-            "char_count": len(chunk["text"]),
-            "summary": summary_text
-        }
+        # 提前中止的输出不写入缓存，下次运行重新生成
+        if cache_key is not None and not stats["aborted"]:
+            cache.put(cache_key, summary_text, model)
+
+        result = map_result(chunk, chunk_id, summary_text, llm_stats=stats)
 
         # 显示摘要预览
         lines = summary_text.split("\n")
         preview = "\n".join(lines[:5])
-        print(f"  生成成功 (预览):\n{preview}\n  ...")
+        print(f"  生成成功（{llm_stream.format_stats(stats)}）(预览):\n{preview}\n  ...")
 
         return result
 
     except Exception as e:
         print(f"  ✗ 生成失败: {e}")
-        return {
-            "chunk_id": chunk_id,
-            "time_range": time_range,
-            "start_time": chunk["start_time"],
-            "end_time": chunk["end_time"],
-            "char_count": len(chunk["text"]),
-            "summary": f"[摘要生成失败: {str(e)}]",
-            "error": str(e)
-        }
+        return map_result(chunk, chunk_id, f"[摘要生成失败: {str(e)}]", error=str(e))
+
 
+def pack_chunks(pending: list, config: dict) -> list:
+    """
+    把待处理的小分块打包成多分块请求
 
-def save_map_results(maps: list):
+    token 数低于 summarizer.map_pack_below_tokens 的相邻小分块依次装入同一个包，
+    直到达到 map_pack_max_chunks 个或文本合计超过 map_pack_max_tokens（默认分块目标大小）；
+    配置了 chunking.context_window 时，还保证 文本 + 提示词开销 + 各段输出预算 不超过窗口。
+
+    Args:
+        pending: [(chunk_id, chunk), ...]
+        config: 配置字典
+
+    Returns:
+        任务列表，每项为 [(chunk_id, chunk), ...]；只有一个分块的任务按原方式单独请求
+    """
+    summarizer_config = config["summarizer"]
+    below_tokens = summarizer_config.get("map_pack_below_tokens", 0)
+    if not below_tokens:
+        return [[item] for item in pending]
+
+    max_chunks = max(1, summarizer_config.get("map_pack_max_chunks", 4))
+    max_tokens = summarizer_config.get("map_pack_max_tokens") or chunking_params(config)[0]
+    context_window = config.get("chunking", {}).get("context_window")
+    prompt_overhead = estimate_tokens(MAP_SYSTEM_PROMPT + MAP_PACK_PROMPT_TEMPLATE) + 32
+    map_max_tokens = summarizer_config.get("map_max_tokens", 0)
+
+    def fits(pack: list, chunk: dict) -> bool:
+        tokens = sum(c["token_count"] for _, c in pack) + chunk["token_count"]
+        if len(pack) + 1 > max_chunks or tokens > max_tokens:
+            return False
+        if context_window:
+            # 每段另有分隔行与时间范围行
+            prompt_tokens = prompt_overhead + tokens + 24 * (len(pack) + 1)
+            return prompt_tokens + map_max_tokens * (len(pack) + 1) <= context_window
+        return True
+
+    tasks = []
+    pack = []
+    for i, chunk in pending:
+        if chunk["token_count"] >= below_tokens:
+            if pack:
+                tasks.append(pack)
+                pack = []
+            tasks.append([(i, chunk)])
+            continue
+        if pack and not fits(pack, chunk):
+            tasks.append(pack)
+            pack = []
+        pack.append((i, chunk))
+    if pack:
+        tasks.append(pack)
+
+    return tasks
+
+
+def split_packed_response(text: str, count: int) -> list:
+    """
+    按分隔行把打包请求的回复拆回各段
+
+    Returns:
+        长度为 count 的列表；缺失或为空的段为 None
+    """
+    sections = {}
+    matches = list(MAP_PACK_SEPARATOR_PATTERN.finditer(text))
+    for k, match in enumerate(matches):
+        n = int(match.group(1))
+        end = matches[k + 1].start() if k + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        # 同一段号重复出现时以第一次为准
+        if 1 <= n <= count and n not in sections and body:
+            sections[n] = body
+    return [sections.get(n) for n in range(1, count + 1)]
+
+
+def summarize_packed(client: OpenAI, items: list, config: dict, cache: LLMCache = None) -> list:
+    """
+    把多个小分块合并为一次请求生成摘要，再按分隔行拆回各分块
+
+    回复中缺失的段（或请求失败、输出被提前中止时无法确认完整的段）改为单独请求。
+    每个拆出的结果附带 pack 字段（同包的 chunk_id 列表、是否命中缓存），
+    本次请求的 llm_stats 只记在第一个拆出的结果上，避免重复计数。
+
+    Args:
+        client: OpenAI 客户端
+        items: [(chunk_id, chunk), ...]
+        config: 配置字典
+        cache: LLM 响应缓存（可选）
+
+    Returns:
+        各分块的摘要结果
+    """
+    summarizer_config = config["summarizer"]
+    chunk_ids = [i for i, _ in items]
+    label = f"Map {'+'.join(str(i + 1) for i in chunk_ids)}"
+
+    texts = "\n\n".join(
+        f"{MAP_PACK_SEPARATOR.format(n=k + 1)}\n{chunk_time_range(chunk)}\n\n{chunk['text']}"
+        for k, (_, chunk) in enumerate(items)
+    )
+    prompt = MAP_PACK_PROMPT_TEMPLATE.format(count=len(items), texts=texts)
+
+    model = summarizer_config["model"]
+    max_tokens = summarizer_config["map_max_tokens"] * len(items)
+    temperature = summarizer_config.get("temperature", 0.3)
+
+    cache_key = None
+    cached = None
+    if cache is not None:
+        cache_key = cache.make_key(prompt, MAP_SYSTEM_PROMPT, model, max_tokens, temperature)
+        cached = cache.get(cache_key)
+
+    stats = None
+    if cached is not None:
+        print(f"\n[{label}] 命中缓存（{len(items)} 个小分块合并）")
+        response = cached
+    else:
+        chars = sum(len(chunk["text"]) for _, chunk in items)
+        print(f"\n[{label}] 合并 {len(items)} 个小分块生成摘要 ({chars} 字符)...")
+        try:
+            response, stats = llm_stream.complete(
+                client,
+                [
+                    {"role": "system", "content": MAP_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                model, max_tokens, temperature,
+                timeout=summarizer_config.get("timeout", 120),
+                config=config,
+                label=label,
+                max_sections=summarizer_config.get("map_max_sections", 8) * len(items)
+            )
+        except Exception as e:
+            print(f"  ✗ 合并请求失败: {e}，改为逐块请求")
+            return [summarize_chunk(client, chunk, i, config, cache) for i, chunk in items]
+
+    sections = split_packed_response(response, len(items))
+    if stats and stats["aborted"]:
+        # 中止位置之前的最后一段可能不完整
+        found = [k for k, section in enumerate(sections) if section is not None]
+        if found:
+            sections[found[-1]] = None
+
+    results = []
+    fallback = []
+    pack = {"chunk_ids": chunk_ids, "cached": cached is not None}
+    for (i, chunk), section in zip(items, sections):
+        if section is None:
+            fallback.append((i, chunk))
+            continue
+        extra = {"pack": pack}
+        if stats and not results:
+            extra["llm_stats"] = stats
+        results.append(map_result(chunk, i, section, **extra))
+
+    if fallback:
+        print(f"  ⚠ [{label}] 回复中缺少 {len(fallback)} 段，改为单独请求")
+        results.extend(summarize_chunk(client, chunk, i, config, cache) for i, chunk in fallback)
+    elif cache_key is not None and cached is None and not stats["aborted"]:
+        cache.put(cache_key, response, model)
+
+    if stats and len(fallback) < len(items):
+        print(f"  生成成功（{llm_stream.format_stats(stats)}），拆分为 {len(items) - len(fallback)} 段")
+
+    return results
+
+
+class MapJournal:
+    """
+    Map 结果日志（JSONL）
+
+    每个分块完成后立即追加一行并落盘，进程中断后可用 --resume 重新加载已完成的分块。
+    每条记录附带分块文本的哈希，分块方式变化后旧记录自动失效。
+    """
+
+    def __init__(self, path: str = "outputs/maps.journal.jsonl", resume: bool = False):
+        """
+        Args:
+            path: 日志文件路径
+            resume: 是否保留已有日志（False 时清空重新记录）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        if not resume:
+            self.path.write_text("", encoding="utf-8")
+        elif self.path.exists() and self.path.stat().st_size > 0:
+            # 补齐被中断的最后一行，避免新记录接在残行之后
+            with open(self.path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    @staticmethod
+    def chunk_hash(chunk: dict) -> str:
+        """分块内容哈希（文本与时间范围）"""
+        key = f"{chunk['start_time']}|{chunk['end_time']}|{chunk['text']}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def load_completed(self, chunks: list) -> dict:
+        """
+        读取已成功完成且与当前分块一致的结果
+
+        Args:
+            chunks: 当前分块列表
+
+        Returns:
+            {chunk_id: map_result}
+        """
+        if not self.path.exists():
+            return {}
+
+        records = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中断时可能留下不完整的最后一行
+                    continue
+                # 同一分块以最后一条记录为准
+                records[record["result"]["chunk_id"]] = record
+
+        completed = {}
+        for i, chunk in enumerate(chunks):
+            record = records.get(i)
+            if (record and "error" not in record["result"]
+                    and record["chunk_hash"] == self.chunk_hash(chunk)):
+                completed[i] = record["result"]
+        return completed
+
+    def append(self, chunk: dict, result: dict):
+        """追加一条 Map 结果并立即落盘"""
+        line = json.dumps(
+            {"chunk_hash": self.chunk_hash(chunk), "result": result},
+            ensure_ascii=False
+        )
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def map_chunks(client: OpenAI, chunks: list, config: dict, cache: LLMCache = None,
+               journal: MapJournal = None) -> list:
+    """
+    并发执行 Map 阶段
+
+    使用线程池包装同一个 OpenAI 客户端，同时在途的请求数不超过
+    summarizer.max_concurrency（默认 1，即与逐块顺序执行一致；配置了多个端点时默认为各端点并发上限之和）。
+    配置了 summarizer.map_pack_below_tokens 时，相邻的小分块合并为一次请求（见 pack_chunks）；
+    配置了 summarizer.hedge_percentile 时，耗时过长的单块请求会发送对冲请求（见 llm_hedge）。
+
+    Args:
+        client: OpenAI 客户端
+        chunks: 分块列表
+        config: 配置字典
+        cache: LLM 响应缓存（可选）
+        journal: Map 结果日志（可选），已完成的分块直接复用，新结果逐条追加
+
+    Returns:
+        按 chunk_id 排序的摘要结果列表
+    """
+    max_concurrency = llm_router.total_concurrency(config)
+
+    maps = []
+    pending = list(enumerate(chunks))
+    if journal is not None:
+        completed = journal.load_completed(chunks)
+        if completed:
+            print(f"\n[恢复] 复用已完成的分块: {len(completed)}/{len(chunks)}")
+        maps.extend(completed.values())
+        pending = [(i, chunk) for i, chunk in pending if i not in completed]
+
+    tasks = pack_chunks(pending, config)
+    packed = sum(len(task) for task in tasks if len(task) > 1)
+    if packed:
+        print(f"\n[Map] {packed} 个小分块合并为 {sum(1 for task in tasks if len(task) > 1)} 个请求")
+
+    # 合并请求的耗时与单块请求不可比，只对单块请求对冲
+    hedger = build_hedger(client, config, sum(1 for task in tasks if len(task) == 1))
+
+    def run(task: list) -> list:
+        if len(task) == 1:
+            i, chunk = task[0]
+            results = [summarize_chunk(client, chunk, i, config, cache, hedger)]
+        else:
+            results = summarize_packed(client, task, config, cache)
+        if journal is not None:
+            chunk_by_id = dict(task)
+            for result in results:
+                journal.append(chunk_by_id[result["chunk_id"]], result)
+        return results
+
+    if max_concurrency == 1 or len(tasks) <= 1:
+        for task in tasks:
+            maps.extend(run(task))
+    else:
+        print(f"\n[Map] 并发执行，最大并发数: {max_concurrency}")
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            futures = [executor.submit(run, task) for task in tasks]
+            for future in as_completed(futures):
+                maps.extend(future.result())
+
+    if hedger is not None:
+        print(f"\n[Map] {hedger.report()}")
+
+    # 保持与顺序执行一致的输出顺序
+    maps.sort(key=lambda m: m["chunk_id"])
+    return maps
+
+
+def save_map_results(maps: list, output_dir: str = "outputs"):
     """保存 Map 结果"""
     # 保存 JSON
-    maps_json_path = Path("outputs/maps.json")
+    maps_json_path = Path(output_dir) / "maps.json"
+    maps_json_path.parent.mkdir(parents=True, exist_ok=True)
     with open(maps_json_path, "w", encoding="utf-8") as f:
         json.dump(maps, f, ensure_ascii=False, indent=2)
     print(f"\n[保存] Map 汇总: {maps_json_path}")
 
     # 保存每个 chunk 的 Markdown
-    chunks_dir = Path("outputs/chunks")
+    chunks_dir = Path(output_dir) / "chunks"
     chunks_dir.mkdir(parents=True, exist_ok=True)
 
     for map_result in maps:
@@ -221,7 +783,99 @@ def save_map_results(maps: list):
     print(f"[保存] 分块摘要: {chunks_dir}/ ({len(maps)} 个文件)")
 
 
+def open_llm_client(stack: ExitStack, config: dict, timeout: float):
+    """
+    创建 LLM 客户端并注册到 ExitStack
+
+    配置了 summarizer.endpoints 时使用多端点路由器（见 llm_router），
+    否则连接 summarizer.base_url；两者都包装了重试与自适应并发（见 llm_retry），
+    调用方式与 OpenAI 客户端相同。
+
+    Args:
+        stack: 负责关闭连接的 ExitStack
+        config: 配置字典
+        timeout: 请求超时（秒）
+
+    Returns:
+        llm_retry.ResilientClient
+    """
+    summarizer_config = config["summarizer"]
+    if summarizer_config.get("endpoints"):
+        client = llm_router.build_router(stack, config, timeout)
+    else:
+        proxy_url = (
+            summarizer_config.get("proxy")
+            or summarizer_config.get("http_proxy")
+            or summarizer_config.get("https_proxy")
+        )
+        # 重试统一由 llm_retry 处理，关闭 SDK 内部重试
+        client = llm_router.build_openai_client(
+            stack, summarizer_config["base_url"], summarizer_config["api_key"], timeout,
+            proxy=proxy_url, max_retries=0
+        )
+
+        print(f"\n[连接] LLM 服务: {summarizer_config['base_url']}")
+        print(f"  模型: {summarizer_config['model']}")
+        if proxy_url:
+            print(f"  代理: {proxy_url}")
+
+    return llm_retry.wrap_client(client, config, llm_router.total_concurrency(config))
+
+
+def _is_cached(map_result: dict) -> bool:
+    """Map 结果是否来自缓存（合并请求中只有第一段带 llm_stats，按 pack 字段判断）"""
+    if "error" in map_result:
+        return False
+    if "pack" in map_result:
+        return map_result["pack"]["cached"]
+    return not map_result.get("llm_stats")
+
+
+def map_stage_metrics(maps: list, wall_seconds: float) -> dict:
+    """Map 阶段的性能指标（写入 metrics.json）"""
+    return {
+        "wall_seconds": round(wall_seconds, 2),
+        "chunks": len(maps),
+        "failed_chunks": sum(1 for m in maps if "error" in m),
+        "cached_chunks": sum(1 for m in maps if _is_cached(m)),
+        "packed_chunks": sum(1 for m in maps if "pack" in m),
+        "hedged_chunks": sum(1 for m in maps if (m.get("llm_stats") or {}).get("hedge")),
+        **metrics.llm_summary([m.get("llm_stats") for m in maps])
+    }
+
+
+def stage_manifest(config: dict, output_dir: str = "outputs") -> StageManifest:
+    """Map 阶段指纹：转写结果 + 分块与 Map 生成参数 + 提示词"""
+    return StageManifest(
+        "chunk_and_map", output_dir,
+        inputs=[Path(output_dir) / "transcript.json"],
+        outputs=[Path(output_dir) / "maps.json"],
+        config=config,
+        config_keys=[
+            "chunking", "summarizer.model", "summarizer.map_max_tokens", "summarizer.temperature",
+            "summarizer.map_pack_below_tokens", "summarizer.map_pack_max_chunks",
+            "summarizer.map_pack_max_tokens", "summarizer.map_max_sections",
+            *llm_stream.GUARD_CONFIG_KEYS
+        ],
+        extra={"prompt": text_digest(MAP_SYSTEM_PROMPT + MAP_PROMPT_TEMPLATE + MAP_PACK_PROMPT_TEMPLATE)}
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="分块与 Map 摘要")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="跳过 LLM 响应缓存读取（新结果仍会写入缓存）")
+    parser.add_argument("--resume", action="store_true",
+                        help="从 <输出目录>/maps.journal.jsonl 恢复，只重跑缺失或失败的分块")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     try:
         print("=" * 60)
         print("分块与 Map 摘要")
@@ -229,56 +883,38 @@ def main():
 
         # 加载配置和转写结果
         config = load_config()
-        transcript = load_transcript()
 
-        # 创建分块
-        chunks = create_chunks(
-            transcript,
-            config["chunking"]["target_chars"],
-            config["chunking"]["overlap_chars"]
-        )
+        manifest = stage_manifest(config, args.output_dir)
+        if not args.force and not args.resume and manifest.is_fresh():
+            print(manifest.skip_message())
+            print(f"  下一步: python reduce_and_qc.py")
+            return
 
-        # 初始化 OpenAI 客户端
-        summarizer_config = config["summarizer"]
-        http_client_kwargs = {
-            "base_url": summarizer_config["base_url"],
-            "timeout": summarizer_config.get("timeout", 120),
-            "follow_redirects": True
-        }
-        proxy_url = (
-            summarizer_config.get("proxy")
-            or summarizer_config.get("http_proxy")
-            or summarizer_config.get("https_proxy")
-        )
-        if proxy_url:
-            http_client_kwargs["proxy"] = proxy_url
+        start = time.time()
+        transcript = load_transcript(args.output_dir)
 
-        maps = []
-        with ExitStack() as stack:
-            http_client = stack.enter_context(httpx.Client(**http_client_kwargs))
-            client = stack.enter_context(
-                OpenAI(
-                    base_url=summarizer_config["base_url"],
-                    api_key=summarizer_config["api_key"],
-                    http_client=http_client
-                )
-            )
+        cache = build_cache(config, bypass=args.no_cache)
 
-            print(f"\n[连接] LLM 服务: {summarizer_config['base_url']}")
-            print(f"  模型: {summarizer_config['model']}")
-            if proxy_url:
-                print(f"  代理: {proxy_url}")
+        # 创建分块
+        chunks = create_chunks(transcript, config)
+
+        with ExitStack() as stack:
+            # 初始化 OpenAI 客户端
+            client = open_llm_client(stack, config, config["summarizer"].get("timeout", 120))
 
             # 对每个 chunk 生成摘要
-            for i, chunk in enumerate(chunks):
-                map_result = summarize_chunk(client, chunk, i, config)
-                maps.append(map_result)
+            journal = MapJournal(Path(args.output_dir) / "maps.journal.jsonl", resume=args.resume)
+            maps = map_chunks(client, chunks, config, cache, journal)
 
         # 保存结果
-        save_map_results(maps)
+        save_map_results(maps, args.output_dir)
+        metrics.record_stage(args.output_dir, "chunk_and_map", map_stage_metrics(maps, time.time() - start), config)
+        cache.report()
 
-        # 统计
+        # 统计；有失败分块时不记录指纹，下次运行会重试
         success_count = sum(1 for m in maps if "error" not in m)
+        if success_count == len(maps):
+            manifest.record()
         print(f"\n{'=' * 60}")
         print(f"✓ Map 阶段完成")
         print(f"  成功: {success_count}/{len(maps)}")
@@ -6,10 +6,15 @@
 """
 
 import re
+import json
+import time
+import argparse
 from pathlib import Path
 import yaml
-import markdown2
-from bs4 import BeautifulSoup
+
+import metrics
+import summary_parser
+from stage_manifest import StageManifest
 
 
 def load_config():
@@ -18,36 +23,60 @@ def load_config():
         return yaml.safe_load(f)
 
 
-def load_summary():
+def load_summary(output_dir: str = "outputs"):
     """加载摘要文件"""
-    summary_path = Path("outputs/summary.md")
+    summary_path = Path(output_dir) / "summary.md"
     if not summary_path.exists():
-        raise FileNotFoundError("未找到 outputs/summary.md，请先运行 reduce_and_qc.py")
+        raise FileNotFoundError(f"未找到 {summary_path}，请先运行 reduce_and_qc.py")
 
     return summary_path.read_text(encoding="utf-8")
 
 
-def extract_quotes(md_text: str) -> list:
+def load_summary_tree(output_dir: str = "outputs") -> dict:
+    """
+    加载摘要章节树
+
+    summary.json 中缓存的章节树不比 summary.md 旧时直接使用；
+    summary.json 缺失、来自旧版本或 summary.md 被手动修改过时，重新解析 summary.md。
+    """
+    summary_md_path = Path(output_dir) / "summary.md"
+    summary_json_path = Path(output_dir) / "summary.json"
+    if not summary_md_path.exists():
+        raise FileNotFoundError(f"未找到 {summary_md_path}，请先运行 reduce_and_qc.py")
+
+    if summary_json_path.exists() and summary_json_path.stat().st_mtime >= summary_md_path.stat().st_mtime:
+        try:
+            with open(summary_json_path, "r", encoding="utf-8") as f:
+                tree = json.load(f).get("tree")
+        except json.JSONDecodeError:
+            tree = None
+        if summary_parser.is_current(tree):
+            return tree
+
+    print("[解析] summary.json 中的章节树缺失或已过期，重新解析 summary.md")
+    return summary_parser.parse_summary(load_summary(output_dir))
+
+
+def extract_quotes(tree: dict) -> list:
     """
     提取金句（引文中长度适中且有感染力的句子）
 
     Args:
-        md_text: Markdown 文本
+        tree: 摘要章节树
 
     Returns:
         金句列表
     """
     quotes = []
 
-    # 提取引用块中的内容
-    blockquote_pattern = r'> ["\"](.{15,100}?)["\"]'
-    matches = re.findall(blockquote_pattern, md_text)
-
-    for match in matches:
+    for quote in summary_parser.all_quotes(tree):
+        text = quote["text"]
+        if not 15 <= len(text) <= 100:
+            continue
         # 过滤：包含感叹号、问号或重要关键词
-        if any(char in match for char in ['！', '？', '。']) or \
-           any(keyword in match for keyword in ['关键', '重要', '核心', '本质', '启示']):
-            quotes.append(match.strip())
+        if any(char in text for char in ['！', '？', '。']) or \
+           any(keyword in text for keyword in ['关键', '重要', '核心', '本质', '启示']):
+            quotes.append(text)
 
     # 去重并限制数量
     quotes = list(dict.fromkeys(quotes))[:5]
@@ -55,54 +84,55 @@ def extract_quotes(md_text: str) -> list:
     return quotes
 
 
-def enhance_html(html: str, config: dict) -> BeautifulSoup:
+# 单遍扫描：HTML 标签整体匹配（标签内部的文本不会被当作时间戳），其余位置匹配时间戳
+HTML_TOKEN_PATTERN = re.compile(
+    r'<(?P<tag>blockquote|ul|ol)(?P<attrs>\s[^>]*)?>'
+    r'|<[^>]*>'
+    r'|(?P<timestamp>\[\d{1,2}:\d{2}(?::\d{2})?\])'
+)
+
+TIMESTAMP_STYLE = "color:#888;font-size:0.85em;font-family:monospace;"
+LIST_STYLE = "line-height: 1.8; margin: 0.5em 0;"
+
+
+def enhance_html(html: str, config: dict) -> str:
     """
     增强 HTML 样式
 
+    对 Markdown 转换出的 HTML 做一次线性扫描，同时为引用块、列表添加样式并高亮时间戳，
+    不构建 DOM 树，输出保持紧凑。
+
     Args:
         html: 原始 HTML
         config: 配置字典
 
     Returns:
-        增强后的 BeautifulSoup 对象
+        增强后的 HTML 字符串
     """
-    soup = BeautifulSoup(html, "html.parser")
     wechat_config = config["wechat"]
+    blockquote_style = (
+        f"border-left: 3px solid {wechat_config['quote_color']}; "
+        f"padding-left: 12px; "
+        f"color: {wechat_config['quote_color']}; "
+        f"font-style: italic; "
+        f"margin: 1em 0; "
+        f"background-color: #f9f9f9; "
+        f"padding: 10px 12px; "
+        f"border-radius: 4px;"
+    )
+    tag_styles = {"blockquote": blockquote_style, "ul": LIST_STYLE, "ol": LIST_STYLE}
 
-    # 美化引用块
-    for blockquote in soup.find_all("blockquote"):
-        blockquote["style"] = (
-            f"border-left: 3px solid {wechat_config['quote_color']}; "
-            f"padding-left: 12px; "
-            f"color: {wechat_config['quote_color']}; "
-            f"font-style: italic; "
-            f"margin: 1em 0; "
-            f"background-color: #f9f9f9; "
-            f"padding: 10px 12px; "
-            f"border-radius: 4px;"
-        )
-
-    # 美化时间戳
-    for text_node in soup.find_all(string=re.compile(r'\[\d{1,2}:\d{2}')):
-        # 查找包含时间戳的文本节点
-        text = str(text_node)
-        new_html = re.sub(
-            r'(\[\d{1,2}:\d{2}(?::\d{2})?\])',
-            r'<span style="color:#888;font-size:0.85em;font-family:monospace;">\1</span>',
-            text
-        )
-        if new_html != text:
-            new_soup = BeautifulSoup(new_html, "html.parser")
-            text_node.replace_with(new_soup)
-
-    # 美化列表
-    for ul in soup.find_all("ul"):
-        ul["style"] = "line-height: 1.8; margin: 0.5em 0;"
-
-    for ol in soup.find_all("ol"):
-        ol["style"] = "line-height: 1.8; margin: 0.5em 0;"
+    def replace(match: re.Match) -> str:
+        if match.group("timestamp"):
+            return f'<span style="{TIMESTAMP_STYLE}">{match.group("timestamp")}</span>'
+        tag = match.group("tag")
+        if tag:
+            # 与原有 style 属性冲突时以新样式为准
+            attrs = re.sub(r'\sstyle="[^"]*"', "", match.group("attrs") or "")
+            return f'<{tag}{attrs} style="{tag_styles[tag]}">'
+        return match.group(0)
 
-    return soup
+    return HTML_TOKEN_PATTERN.sub(replace, html)
 
 
 def generate_quote_blocks(quotes: list, config: dict) -> str:
@@ -150,7 +180,7 @@ def generate_quote_blocks(quotes: list, config: dict) -> str:
 
 def generate_wechat_html(md_text: str, config: dict) -> str:
     """
-    生成完整的微信公众号 HTML
+    由 Markdown 文本生成完整的微信公众号 HTML
 
     Args:
         md_text: Markdown 文本
@@ -159,28 +189,32 @@ def generate_wechat_html(md_text: str, config: dict) -> str:
     Returns:
         完整 HTML 字符串
     """
-    wechat_config = config["wechat"]
+    return render_wechat_html(summary_parser.parse_summary(md_text), config)
 
-    # 提取标题（第一个 # 标题）
-    title_match = re.search(r'^# (.+)$', md_text, re.MULTILINE)
-    if title_match:
-        raw_title = title_match.group(1).strip()
-        # 移除标题行，避免重复
-        md_text = md_text.replace(title_match.group(0), '', 1)
-    else:
-        raw_title = "播客总结"
 
-    title = f"{wechat_config['title_prefix']}{raw_title}"
+def render_wechat_html(tree: dict, config: dict) -> str:
+    """
+    由摘要章节树生成完整的微信公众号 HTML
+
+    Args:
+        tree: 摘要章节树（summary_parser.parse_summary 的结果）
+        config: 配置字典
 
-    # 转换 Markdown 到 HTML
-    html = markdown2.markdown(md_text, extras=["tables", "fenced-code-blocks"])
+    Returns:
+        完整 HTML 字符串
+    """
+    wechat_config = config["wechat"]
 
-    # 增强样式
-    soup = enhance_html(html, config)
+    # 标题取第一个 # 标题，正文中不再重复
+    title = f"{wechat_config['title_prefix']}{tree['title'] or '播客总结'}"
+
+    # 拼接各章节已渲染的 HTML 并增强样式
+    html = tree["preamble_html"] + "".join(section["html"] for section in tree["sections"])
+    body_html = enhance_html(html, config)
 
     # 提取金句
     print("[金句] 检测中...")
-    quotes = extract_quotes(md_text)
+    quotes = extract_quotes(tree)
     print(f"  发现 {len(quotes)} 条金句")
 
     # 生成金句区块
@@ -301,7 +335,7 @@ a {{
 
 {quote_blocks}
 
-{soup.prettify()}
+{body_html}
 
 <div class="footer">
     <p>—— 完 ——</p>
@@ -315,7 +349,32 @@ a {{
     return full_html
 
 
+def stage_manifest(config: dict, output_dir: str = "outputs") -> StageManifest:
+    """HTML 阶段指纹：摘要 Markdown 与章节树 + wechat 配置"""
+    output_path = Path(output_dir)
+    inputs = [output_path / "summary.md"]
+    if (output_path / "summary.json").exists():
+        inputs.append(output_path / "summary.json")
+    return StageManifest(
+        "generate_wechat_html", output_dir,
+        inputs=inputs,
+        outputs=[Path(output_dir) / "summary_wechat.html"],
+        config=config,
+        config_keys=["wechat"]
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生成微信公众号 HTML")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     try:
         print("=" * 60)
         print("生成微信公众号 HTML")
@@ -323,17 +382,30 @@ def main():
 
         # 加载配置和摘要
         config = load_config()
-        md_text = load_summary()
 
-        print(f"\n[加载] 摘要长度: {len(md_text)} 字符")
+        manifest = stage_manifest(config, args.output_dir)
+        if not args.force and manifest.is_fresh():
+            print(manifest.skip_message())
+            return
+
+        start = time.time()
+        tree = load_summary_tree(args.output_dir)
+
+        print(f"\n[加载] 摘要章节: {len(tree['sections'])} 个")
 
         # 生成 HTML
         print("[生成] 转换为 HTML...")
-        html = generate_wechat_html(md_text, config)
+        html = render_wechat_html(tree, config)
+        render_seconds = time.time() - start
 
         # 保存
-        output_path = Path("outputs/summary_wechat.html")
+        output_path = Path(args.output_dir) / "summary_wechat.html"
         output_path.write_text(html, encoding="utf-8")
+        manifest.record()
+        metrics.record_stage(args.output_dir, "generate_wechat_html", {
+            "wall_seconds": round(time.time() - start, 3),
+            "render_seconds": round(render_seconds, 3)
+        }, config)
 
         print(f"\n[保存] 微信 HTML: {output_path}")
         print(f"  文件大小: {len(html)} 字符")
@@ -342,7 +414,7 @@ def main():
         print(f"\n{'=' * 60}")
         print("✓ HTML 生成完成")
         print("\n使用方法：")
-        print("  1. 用浏览器打开 outputs/summary_wechat.html")
+        print(f"  1. 用浏览器打开 {output_path}")
         print("  2. 全选页面内容 (Ctrl+A / Cmd+A)")
         print("  3. 复制 (Ctrl+C / Cmd+C)")
         print("  4. 粘贴到微信公众号后台编辑器")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存
+功能：按内容寻址（prompt、system、模型与采样参数的哈希）在磁盘上缓存 LLM 响应，
+     支持按条目数/总大小/过期时间淘汰，并统计命中率
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+
+class LLMCache:
+    """
+    磁盘 LLM 响应缓存
+
+    每个条目保存为 <cache_dir>/<key 前两位>/<key>.json，写入时先写临时文件再原子替换，
+    命中时刷新文件修改时间，淘汰时按修改时间从旧到新删除（近似 LRU）。
+    """
+
+    def __init__(self, cache_dir: str = "cache/llm", enabled: bool = True, bypass: bool = False,
+                 max_entries: int = 5000, max_size_mb: float = 500, max_age_days: float = 30):
+        """
+        Args:
+            cache_dir: 缓存目录
+            enabled: 是否启用缓存（False 时既不读也不写）
+            bypass: 跳过缓存读取，但仍写入新结果（用于强制刷新）
+            max_entries: 最大条目数
+            max_size_mb: 最大总大小（MB）
+            max_age_days: 条目最长保留天数
+        """
+        self.cache_dir = Path(cache_dir)
+        self.enabled = enabled
+        self.bypass = bypass
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, system: str, model: str, max_tokens: int, temperature: float) -> str:
+        """根据请求内容生成缓存键"""
+        payload = json.dumps(
+            {
+                "prompt": prompt,
+                "system": system,
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            },
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """
+        查询缓存
+
+        Returns:
+            命中时返回响应文本，否则返回 None
+        """
+        if not self.enabled or self.bypass:
+            if self.enabled:
+                with self._lock:
+                    self.misses += 1
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if self.max_age and time.time() - entry.get("created", 0) > self.max_age:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 刷新修改时间，淘汰时按最近使用排序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key: str, response: str, model: str = ""):
+        """写入缓存"""
+        if not self.enabled:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "key": key,
+            "model": model,
+            "created": time.time(),
+            "response": response
+        }
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.writes += 1
+
+    def evict(self) -> int:
+        """
+        淘汰过期条目，并在超出条目数或总大小上限时删除最久未使用的条目
+
+        Returns:
+            删除的条目数
+        """
+        if not self.enabled or not self.cache_dir.exists():
+            return 0
+
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self.max_age and now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            count -= 1
+            total_bytes -= size
+            removed += 1
+
+        return removed
+
+    def report(self):
+        """打印命中统计并执行淘汰"""
+        if not self.enabled:
+            return
+        removed = self.evict()
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        print(f"\n[缓存] 命中: {self.hits}，未命中: {self.misses}（命中率 {hit_rate:.0f}%），"
+              f"新写入: {self.writes}")
+        if removed:
+            print(f"  淘汰旧条目: {removed}")
+
+
+def build_cache(config: dict, bypass: bool = False) -> LLMCache:
+    """根据 config.yaml 的 cache 配置创建缓存"""
+    cache_config = config.get("cache", {}) or {}
+    return LLMCache(
+        cache_dir=cache_config.get("dir", "cache/llm"),
+        enabled=cache_config.get("enabled", True),
+        bypass=bypass,
+        max_entries=cache_config.get("max_entries", 5000),
+        max_size_mb=cache_config.get("max_size_mb", 500),
+        max_age_days=cache_config.get("max_age_days", 30)
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Map 请求对冲
+功能：某个分块的请求耗时超过本次运行已完成请求的延迟分位数时，再发送一个相同的请求
+     （配置了多个端点时优先发往其他端点），取先完成的结果并取消另一个，
+     用有限的额外负载（对冲预算）压低长尾分块拖慢整期节目的时间
+
+只在流式模式下启用：落后的一方在收到下一个事件时关闭流，服务端随即停止生成，
+释放端点与自适应并发的名额；非流式请求无法中途取消，对冲会让整次重复请求跑完。
+"""
+
+import math
+import time
+import queue
+import threading
+
+import numpy as np
+
+
+class Hedger:
+    """
+    对冲策略（在一次 Map 阶段内共享）
+
+    阈值为本次运行已完成分块耗时的 percentile 分位数，样本少于 min_samples 时不对冲；
+    对冲请求总数不超过 ceil(budget × 请求总数)。
+    """
+
+    def __init__(self, percentile: float, total_requests: int, budget: float = 0.1,
+                 min_samples: int = 5, routed: bool = False):
+        """
+        Args:
+            percentile: 触发对冲的延迟分位数（如 90）
+            total_requests: 本次运行的请求总数（用于计算预算）
+            budget: 允许对冲的请求比例
+            min_samples: 计算分位数所需的最少已完成请求数
+            routed: 客户端是否为多端点路由器（是则对冲请求避开原请求所在端点）
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedges = math.ceil(budget * total_requests)
+        self.routed = routed
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies = []
+        self._lock = threading.Lock()
+
+    def threshold(self):
+        """当前的对冲阈值（秒）；样本不足时返回 None"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return float(np.percentile(self._latencies, self.percentile))
+
+    def _record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedges >= self.max_hedges:
+                return False
+            self.hedges += 1
+            return True
+
+    def run(self, request, label: str = "LLM"):
+        """
+        执行一次可对冲的请求
+
+        Args:
+            request: request(cancel, route) -> (文本, 统计信息)；cancel 为 threading.Event，
+                     置位后流式请求应尽快中止；route 为传给路由器的端点提示（未使用路由器时为 None）
+            label: 日志前缀
+
+        Returns:
+            先成功完成的请求结果；发生过对冲时统计信息附加 hedge（"primary" 或 "hedge"）
+        """
+        results = queue.Queue()
+        start = time.time()
+
+        def launch(name: str, route) -> threading.Event:
+            cancel = threading.Event()
+
+            def target():
+                try:
+                    results.put((name, request(cancel, route), None))
+                except Exception as e:
+                    results.put((name, None, e))
+
+            threading.Thread(target=target, daemon=True).start()
+            return cancel
+
+        primary_route = {} if self.routed else None
+        cancels = {"primary": launch("primary", primary_route)}
+        pending = 1
+        hedged = False
+
+        while True:
+            timeout = None
+            if not hedged:
+                threshold = self.threshold()
+                # 样本不足时定期重新检查阈值
+                timeout = 0.5 if threshold is None else max(0.05, threshold - (time.time() - start))
+
+            try:
+                name, result, error = results.get(timeout=timeout)
+            except queue.Empty:
+                if threshold is not None and time.time() - start >= threshold and self._take_budget():
+                    hedged = True
+                    route = None
+                    if primary_route is not None:
+                        route = {"avoid": [primary_route.get("endpoint")]}
+                    print(f"  [{label}] 已等待 {time.time() - start:.1f}s"
+                          f"（超过本次运行 p{self.percentile:g} {threshold:.1f}s），发送对冲请求")
+                    cancels["hedge"] = launch("hedge", route)
+                    pending += 1
+                continue
+
+            pending -= 1
+            if error is not None:
+                if pending == 0:
+                    raise error
+                # 另一个请求仍在进行，等待它的结果
+                continue
+
+            for other, cancel in cancels.items():
+                if other != name:
+                    cancel.set()
+            self._record(time.time() - start)
+
+            text, stats = result
+            if hedged:
+                stats["hedge"] = name
+                if name == "hedge":
+                    with self._lock:
+                        self.hedge_wins += 1
+                print(f"  [{label}] 对冲结果：{'对冲请求' if name == 'hedge' else '原请求'}先完成")
+            return text, stats
+
+    def report(self):
+        """对冲统计的单行描述"""
+        return f"对冲 {self.hedges} 次（上限 {self.max_hedges}），其中 {self.hedge_wins} 次对冲请求先完成"
+
+
+def build_hedger(client, config: dict, total_requests: int):
+    """
+    按 summarizer 配置创建对冲策略
+
+    Returns:
+        Hedger；未开启（summarizer.hedge_percentile 为 0）或未使用流式请求时返回 None
+    """
+    summarizer_config = config["summarizer"]
+    percentile = summarizer_config.get("hedge_percentile", 0)
+    if not percentile:
+        return None
+    if not summarizer_config.get("stream", False):
+        print("  提示：对冲需要 summarizer.stream: true（非流式请求无法取消，落后的请求会一直占用名额），本次不对冲")
+        return None
+    return Hedger(
+        percentile,
+        total_requests,
+        budget=summarizer_config.get("hedge_budget", 0.1),
+        min_samples=summarizer_config.get("hedge_min_samples", 5),
+        routed=getattr(client, "endpoints", None) is not None
+    )
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 请求重试与自适应并发
+功能：对超时、429 与 5xx 等可恢复错误按带抖动的指数退避重试；
+     AIMD 限流器根据延迟与错误率动态调整同时在途的请求数，服务跟得上时逐步加并发，
+     延迟升高或出错时减半，在不压垮共享后端的前提下获得最大可持续吞吐
+"""
+
+import time
+import random
+import threading
+
+import httpx
+import openai
+
+
+# 可恢复错误：连接失败 / 超时（APITimeoutError 是 APIConnectionError 的子类）、429、5xx，
+# 以及流式读取过程中断开的连接
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def retry_after_seconds(error: Exception):
+    """429 / 503 响应中的 Retry-After（秒），没有时返回 None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def latency_signal(stats: dict):
+    """
+    自适应并发使用的延迟信号（与输出长度无关，Map、合并请求与 Reduce 可共用一个基线）
+
+    流式请求取首 token 延迟；非流式请求取每个输出 token 的平均耗时；
+    服务端未返回 token 数时返回 None（只按错误调整）。
+    """
+    if stats.get("ttft") is not None:
+        return stats["ttft"]
+    tokens = stats.get("completion_tokens")
+    if tokens and stats.get("elapsed"):
+        return stats["elapsed"] / tokens
+    return None
+
+
+class RetryPolicy:
+    """带抖动的指数退避：第 n 次重试前等待 uniform(0, min(max_delay, base_delay × 2^n))"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 rng: random.Random = None):
+        """
+        Args:
+            max_retries: 最大重试次数（0 表示不重试）
+            base_delay: 首次重试的退避上限（秒）
+            max_delay: 单次退避上限（秒）
+            rng: 随机数生成器（默认使用全局 random）
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random
+
+    def delay(self, attempt: int, error: Exception = None) -> float:
+        """第 attempt 次（从 0 开始）重试前的等待时间；服务端给出 Retry-After 时不短于它"""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class AIMDLimiter:
+    """
+    AIMD 自适应并发限流器
+
+    每个成功且延迟正常的请求使上限增加 1/上限（约每轮增加 1）；请求出现可恢复错误，
+    或延迟超过近期基线的 latency_factor 倍时，上限乘以 decrease_factor。
+    同一轮（约一个基线延迟）内最多下调一次，避免一批同时失败的请求把上限压到最低。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: int = None,
+                 decrease_factor: float = 0.5, latency_factor: float = 2.0):
+        """
+        Args:
+            max_limit: 并发上限的最大值
+            min_limit: 并发上限的最小值
+            initial: 初始并发上限（默认 max_limit 的一半）
+            decrease_factor: 拥塞时的乘性下调系数
+            latency_factor: 延迟超过基线的倍数视为拥塞（0 表示只按错误判断）
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(max(self.min_limit, min(self.max_limit, initial or self.max_limit // 2)))
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.inflight = 0
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """等待直到在途请求数低于当前上限"""
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+
+    def release(self, latency: float = None, ok: bool = True):
+        """
+        请求结束
+
+        Args:
+            latency: 延迟信号（秒，见 latency_signal）；None 表示不参与判断
+            ok: 是否成功（False 表示可恢复错误，视为拥塞）
+        """
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+            if ok and latency is None:
+                # 没有延迟信号（如不可重试的错误、已取消的请求）：只归还名额，不调整上限
+                return
+            old_limit = int(self.limit)
+
+            congested = not ok
+            if ok and latency is not None:
+                if self.baseline is not None and self.latency_factor:
+                    congested = latency > self.baseline * self.latency_factor
+                self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+
+            now = time.time()
+            if congested:
+                if now - self._last_decrease >= max(self.baseline or 0.0, 1.0):
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            if int(self.limit) != old_limit:
+                reason = "延迟升高或出错" if congested else "服务跟得上"
+                print(f"  [限流] 并发上限 {old_limit} → {int(self.limit)}（{reason}）")
+            self._cond.notify_all()
+
+
+class ResilientClient:
+    """
+    为 LLM 客户端（OpenAI 客户端或 LLMRouter）加上重试与自适应并发
+
+    chat.completions.create 直接转发给内部客户端；llm_stream.complete 通过
+    call_with_retry() 执行整次请求（含流式接收），因此流式读取中途断开也会重试。
+    """
+
+    def __init__(self, client, policy: RetryPolicy, limiter: AIMDLimiter = None):
+        self.client = client
+        self.chat = client.chat
+        self.policy = policy
+        self.limiter = limiter
+
+    def call_with_retry(self, fn, label: str = "LLM"):
+        """
+        执行一次请求，遇到可恢复错误时退避重试
+
+        Args:
+            fn: 无参函数，返回 (文本, 统计信息)（llm_stream 的单次请求）
+            label: 日志前缀
+
+        Returns:
+            fn 的返回值；统计信息中附加 retries（重试次数）
+        """
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                text, stats = fn()
+            except Exception as e:
+                retryable = is_retryable(e)
+                if self.limiter is not None:
+                    # 不可恢复的错误（如 400）与服务负载无关，不参与调整
+                    self.limiter.release(ok=not retryable)
+                if not retryable or attempt >= self.policy.max_retries:
+                    raise
+                delay = self.policy.delay(attempt, e)
+                attempt += 1
+                print(f"  ⚠ [{label}] {type(e).__name__}: {e}，{delay:.1f}s 后重试"
+                      f"（{attempt}/{self.policy.max_retries}）")
+                time.sleep(delay)
+                continue
+
+            if self.limiter is not None:
+                self.limiter.release(latency_signal(stats))
+            stats["retries"] = attempt
+            return text, stats
+
+    def __getattr__(self, name):
+        # 其余属性（如路由器的 endpoints / report）转发给内部客户端
+        return getattr(self.client, name)
+
+
+def wrap_client(client, config: dict, max_concurrency: int):
+    """
+    按 summarizer 配置包装客户端
+
+    Args:
+        client: OpenAI 客户端或 LLMRouter
+        config: 配置字典
+        max_concurrency: 并发上限的最大值（自适应并发的上界）
+
+    Returns:
+        ResilientClient
+    """
+    summarizer_config = config["summarizer"]
+    policy = RetryPolicy(
+        max_retries=summarizer_config.get("max_retries", 3),
+        base_delay=summarizer_config.get("retry_base_delay", 1.0),
+        max_delay=summarizer_config.get("retry_max_delay", 30.0)
+    )
+
+    limiter = None
+    if summarizer_config.get("adaptive_concurrency", False):
+        limiter = AIMDLimiter(
+            max_limit=max_concurrency,
+            min_limit=summarizer_config.get("adaptive_min_concurrency", 1),
+            latency_factor=summarizer_config.get("adaptive_latency_factor", 2.0)
+        )
+        print(f"  自适应并发: 初始 {int(limiter.limit)}，范围 {limiter.min_limit}-{limiter.max_limit}")
+
+    return ResilientClient(client, policy, limiter)
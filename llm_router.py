@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多端点 LLM 路由
+功能：把请求分发到 summarizer.endpoints 中的多个 OpenAI 兼容服务（Ollama、vLLM 等），
+     按权重选择在途请求最少的端点，定期健康检查，端点失败或超时时暂停分配并自动转发到其他端点
+
+路由器提供与 OpenAI 客户端相同的 chat.completions.create 接口，调用方无需区分单端点与多端点。
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+from contextlib import ExitStack
+
+import httpx
+import openai
+from openai import OpenAI
+
+
+# 连接失败、超时与 5xx：端点暂停分配并转发到其他端点
+FAILOVER_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+# 429：端点过载，转发到其他端点但不暂停分配
+BUSY_ERRORS = (openai.RateLimitError,)
+
+
+def build_openai_client(stack: ExitStack, base_url: str, api_key: str, timeout: float,
+                        proxy: str = None, max_retries: int = None) -> OpenAI:
+    """
+    创建 OpenAI 客户端并把连接注册到 ExitStack
+
+    Args:
+        stack: 负责关闭连接的 ExitStack
+        base_url: API 地址
+        api_key: API Key
+        timeout: 请求超时（秒）
+        proxy: 代理地址（可选）
+        max_retries: SDK 内部重试次数（默认使用 SDK 的设置）
+
+    Returns:
+        OpenAI 客户端
+    """
+    http_client_kwargs = {
+        "base_url": base_url,
+        "timeout": timeout,
+        "follow_redirects": True
+    }
+    if proxy:
+        http_client_kwargs["proxy"] = proxy
+
+    http_client = stack.enter_context(httpx.Client(**http_client_kwargs))
+    client_kwargs = {"base_url": base_url, "api_key": api_key, "http_client": http_client}
+    if max_retries is not None:
+        client_kwargs["max_retries"] = max_retries
+    return stack.enter_context(OpenAI(**client_kwargs))
+
+
+class Endpoint:
+    """一个 LLM 服务端点及其运行状态（由 LLMRouter 加锁维护）"""
+
+    def __init__(self, name: str, client: OpenAI, model: str = None, weight: float = 1.0,
+                 max_concurrency: int = 1):
+        """
+        Args:
+            name: 端点名（日志与统计使用）
+            client: 该端点的 OpenAI 客户端
+            model: 该端点使用的模型名（为空时沿用请求中的 model）
+            weight: 权重，越大分到的请求越多
+            max_concurrency: 该端点同时在途的请求上限
+        """
+        self.name = name
+        self.client = client
+        self.model = model
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.down_until = 0.0
+        self.last_error = None
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        """是否在轮转中（未暂停分配）"""
+        return now >= self.down_until
+
+
+class RoutedStream:
+    """流式响应的包装：流结束或关闭时才释放端点的在途名额"""
+
+    def __init__(self, stream, router: "LLMRouter", endpoint: Endpoint):
+        self._stream = stream
+        self._router = router
+        self._endpoint = endpoint
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+        self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._stream.close()
+            self._router.release(self._endpoint)
+
+
+class LLMRouter:
+    """
+    多端点路由器
+
+    选择端点时只考虑在轮转中且未达到并发上限的端点，取 在途请求数 / 权重 最小者；
+    全部端点都已满时等待名额释放。请求遇到连接失败、超时或 5xx 时，该端点暂停分配
+    cooldown 秒（健康检查通过后提前恢复），请求转发到尚未尝试过的端点；
+    所有端点都失败后抛出最后一个错误。
+    """
+
+    def __init__(self, endpoints: list, health_interval: float = 15, health_timeout: float = 5,
+                 cooldown: float = 30):
+        """
+        Args:
+            endpoints: Endpoint 列表
+            health_interval: 健康检查间隔（秒，0 表示不做健康检查）
+            health_timeout: 健康检查超时（秒）
+            cooldown: 端点失败后暂停分配的时长（秒）
+        """
+        self.endpoints = endpoints
+        self.health_timeout = health_timeout
+        self.cooldown = cooldown
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+
+        # 与 OpenAI 客户端相同的调用方式：router.chat.completions.create(...)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+        self._health_thread = None
+        if health_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(health_interval,), daemon=True
+            )
+            self._health_thread.start()
+
+    def acquire(self, exclude: list = (), avoid: list = ()) -> Endpoint:
+        """
+        占用一个端点的在途名额
+
+        Args:
+            exclude: 本次请求已尝试过的端点
+            avoid: 尽量避开的端点名（有其他空闲端点时不选）
+
+        Returns:
+            选中的端点；没有可尝试的端点时返回 None
+        """
+        with self._cond:
+            while True:
+                candidates = [e for e in self.endpoints if e not in exclude]
+                if not candidates:
+                    return None
+                now = time.time()
+                # 全部端点都暂停分配时仍然尝试（由请求本身报告错误）
+                in_rotation = [e for e in candidates if e.available(now)] or candidates
+                free = [e for e in in_rotation if e.outstanding < e.max_concurrency]
+                if free:
+                    free = [e for e in free if e.name not in avoid] or free
+                    endpoint = min(free, key=lambda e: (e.outstanding / e.weight, -e.weight))
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+                self._cond.wait(timeout=1.0)
+
+    def release(self, endpoint: Endpoint):
+        """释放端点的在途名额"""
+        with self._cond:
+            endpoint.outstanding -= 1
+            self._cond.notify_all()
+
+    def mark_down(self, endpoint: Endpoint, error: Exception):
+        """端点失败：暂停分配 cooldown 秒"""
+        with self._cond:
+            was_available = endpoint.available(time.time())
+            endpoint.failures += 1
+            endpoint.last_error = str(error)
+            endpoint.down_until = time.time() + self.cooldown
+        if was_available:
+            print(f"  ⚠ [路由] 端点 {endpoint.name} 不可用（{error}），暂停分配")
+
+    def mark_up(self, endpoint: Endpoint):
+        """端点恢复：重新加入轮转"""
+        with self._cond:
+            was_down = not endpoint.available(time.time())
+            endpoint.down_until = 0.0
+            self._cond.notify_all()
+        if was_down:
+            print(f"  [路由] 端点 {endpoint.name} 已恢复")
+
+    def create(self, **kwargs):
+        """
+        发送 chat.completions 请求（参数与 OpenAI 客户端相同）
+
+        stream=True 时返回的流在结束或 close() 之前一直占用端点名额。
+        可额外传入 route 字典：route["avoid"] 为尽量避开的端点名列表，
+        选中的端点名写入 route["endpoint"]（对冲请求据此发往其他端点）。
+        """
+        route = kwargs.pop("route", None)
+        avoid = (route or {}).get("avoid") or ()
+        tried = []
+        last_error = None
+        while True:
+            endpoint = self.acquire(tried, avoid)
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            if route is not None:
+                route["endpoint"] = endpoint.name
+
+            request = dict(kwargs)
+            if endpoint.model:
+                request["model"] = endpoint.model
+
+            try:
+                response = endpoint.client.chat.completions.create(**request)
+            except FAILOVER_ERRORS as e:
+                self.release(endpoint)
+                self.mark_down(endpoint, e)
+                last_error = e
+            except BUSY_ERRORS as e:
+                self.release(endpoint)
+                last_error = e
+            except Exception:
+                self.release(endpoint)
+                raise
+            else:
+                if kwargs.get("stream"):
+                    return RoutedStream(response, self, endpoint)
+                self.release(endpoint)
+                return response
+
+            if len(tried) < len(self.endpoints):
+                print(f"  [路由] {endpoint.name} 请求失败（{type(last_error).__name__}），转发到其他端点")
+
+    def check_health(self):
+        """对每个端点请求一次 /models，按结果暂停或恢复分配"""
+        for endpoint in self.endpoints:
+            if self._stop.is_set():
+                return
+            try:
+                endpoint.client.with_options(timeout=self.health_timeout, max_retries=0).models.list()
+            except Exception as e:
+                self.mark_down(endpoint, e)
+            else:
+                self.mark_up(endpoint)
+
+    def _health_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    def report(self):
+        """打印各端点的请求统计"""
+        print("\n[路由] 端点统计:")
+        for endpoint in self.endpoints:
+            state = "可用" if endpoint.available(time.time()) else "暂停"
+            print(f"  {endpoint.name}: {endpoint.requests} 次请求，失败 {endpoint.failures}（{state}）")
+
+    def close(self):
+        """停止健康检查"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=self.health_timeout + 1)
+
+
+def total_concurrency(config: dict) -> int:
+    """
+    LLM 请求的默认并发数
+
+    显式配置的 summarizer.max_concurrency 优先；配置了多个端点时为各端点并发上限之和；否则为 1。
+    """
+    summarizer_config = config["summarizer"]
+    if summarizer_config.get("max_concurrency"):
+        return max(1, int(summarizer_config["max_concurrency"]))
+    endpoints = summarizer_config.get("endpoints") or []
+    return max(1, sum(int(e.get("max_concurrency", 1)) for e in endpoints))
+
+
+def build_router(stack: ExitStack, config: dict, timeout: float) -> LLMRouter:
+    """
+    按 summarizer.endpoints 创建路由器并注册到 ExitStack
+
+    每个端点未配置的 api_key / proxy 沿用 summarizer 中的同名配置。端点客户端关闭 SDK 内部重试，
+    失败的请求立即转发到其他端点。
+
+    Args:
+        stack: 负责关闭连接的 ExitStack
+        config: 配置字典
+        timeout: 请求超时（秒）
+
+    Returns:
+        LLMRouter
+    """
+    summarizer_config = config["summarizer"]
+    default_proxy = (
+        summarizer_config.get("proxy")
+        or summarizer_config.get("http_proxy")
+        or summarizer_config.get("https_proxy")
+    )
+
+    endpoints = []
+    for i, endpoint_config in enumerate(summarizer_config["endpoints"]):
+        client = build_openai_client(
+            stack,
+            endpoint_config["base_url"],
+            endpoint_config.get("api_key", summarizer_config.get("api_key", "")),
+            timeout,
+            proxy=endpoint_config.get("proxy", default_proxy),
+            max_retries=0
+        )
+        endpoints.append(Endpoint(
+            name=endpoint_config.get("name", f"#{i + 1} {endpoint_config['base_url']}"),
+            client=client,
+            model=endpoint_config.get("model"),
+            weight=float(endpoint_config.get("weight", 1.0)),
+            max_concurrency=int(endpoint_config.get("max_concurrency", 1))
+        ))
+
+    router = LLMRouter(
+        endpoints,
+        health_interval=summarizer_config.get("health_check_interval", 15),
+        health_timeout=summarizer_config.get("health_check_timeout", 5),
+        cooldown=summarizer_config.get("endpoint_cooldown", 30)
+    )
+    stack.callback(router.close)
+    # ExitStack 后进先出：先打印统计再停止健康检查
+    stack.callback(router.report)
+
+    print(f"\n[连接] LLM 路由: {len(endpoints)} 个端点")
+    for endpoint in endpoints:
+        model = endpoint.model or summarizer_config["model"]
+        print(f"  {endpoint.name}: 模型 {model}，权重 {endpoint.weight:g}，并发上限 {endpoint.max_concurrency}")
+
+    return router
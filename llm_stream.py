@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM 流式调用
+功能：以 stream=True 调用 chat.completions，记录首 token 延迟（TTFT）与生成速度，
+     定期显示生成进度，并在出现重复循环或章节数超限时提前中止，避免退化输出一直生成到 max_tokens
+"""
+
+import sys
+import time
+
+
+# 中止原因
+ABORT_REPETITION = "repetition"
+ABORT_SECTIONS = "sections"
+ABORT_CANCELLED = "cancelled"
+
+
+class RequestCancelled(Exception):
+    """请求已被取消（对冲请求的落后一方），不再发送新的请求；不属于可重试错误"""
+
+
+class StreamGuard:
+    """
+    流式输出的失控检测
+
+    重复检测：输出末尾一段文本若以某个周期 p 完全重复（长度至少 max(min_chars, p × min_count)），
+    视为陷入循环；章节检测：二级标题（"## "）数量超过上限。
+    """
+
+    def __init__(self, max_sections: int = 0, repeat_min_chars: int = 80,
+                 repeat_min_count: int = 4, repeat_max_period: int = 200, check_every: int = 32):
+        """
+        Args:
+            max_sections: 二级标题数量上限（0 表示不限制）
+            repeat_min_chars: 判定为循环的最短重复长度
+            repeat_min_count: 判定为循环的最少重复次数
+            repeat_max_period: 检测的最长重复单元
+            check_every: 每新增多少字符检测一次重复
+        """
+        self.max_sections = max_sections
+        self.repeat_min_chars = repeat_min_chars
+        self.repeat_min_count = repeat_min_count
+        self.repeat_max_period = repeat_max_period
+        self.check_every = check_every
+        self._checked_len = 0
+        self._sections = 0
+        self._line_start = 0
+
+    def _find_repetition(self, text: str):
+        """返回循环开始的位置（保留一个重复单元），未发现循环时返回 None"""
+        for period in range(1, self.repeat_max_period + 1):
+            span = max(self.repeat_min_chars, period * self.repeat_min_count)
+            if span > len(text):
+                break
+            tail = text[-span:]
+            if tail[:-period] == tail[period:] and tail.strip():
+                cut = len(text) - span + period
+                # 尽量截断在行尾，避免留下半个重复单元
+                newline = text.rfind("\n", cut - period, cut)
+                return newline if newline > 0 else cut
+        return None
+
+    def check(self, text: str):
+        """
+        检查当前累计输出
+
+        Returns:
+            (中止原因, 截断位置)；无需中止时返回 (None, None)
+        """
+        if self.max_sections:
+            # 只扫描新增的完整行
+            while True:
+                newline = text.find("\n", self._line_start)
+                if newline < 0:
+                    break
+                if text.startswith("## ", self._line_start):
+                    self._sections += 1
+                    if self._sections > self.max_sections:
+                        return ABORT_SECTIONS, self._line_start
+                self._line_start = newline + 1
+
+        if len(text) - self._checked_len >= self.check_every:
+            self._checked_len = len(text)
+            cut = self._find_repetition(text)
+            if cut is not None:
+                return ABORT_REPETITION, cut
+
+        return None, None
+
+
+# 影响生成结果的失控检测配置（流式模式下会中止并截断输出），需计入阶段指纹；
+# 各阶段另行加入自己的 *_max_sections
+GUARD_CONFIG_KEYS = [
+    "summarizer.stream", "summarizer.repeat_min_chars",
+    "summarizer.repeat_min_count", "summarizer.repeat_max_period"
+]
+
+
+def build_guard(config: dict, max_sections: int = 0) -> StreamGuard:
+    """按 summarizer 配置创建失控检测器"""
+    summarizer_config = config["summarizer"]
+    return StreamGuard(
+        max_sections=max_sections,
+        repeat_min_chars=summarizer_config.get("repeat_min_chars", 80),
+        repeat_min_count=summarizer_config.get("repeat_min_count", 4),
+        repeat_max_period=summarizer_config.get("repeat_max_period", 200)
+    )
+
+
+def complete(client, messages: list, model: str, max_tokens: int, temperature: float,
+             timeout: float, config: dict, label: str = "LLM", max_sections: int = 0,
+             cancel=None, route: dict = None):
+    """
+    执行一次 chat.completions 请求
+
+    summarizer.stream 为 true 时流式接收并做失控检测，否则一次性返回（与原行为一致）。
+    客户端带有重试与自适应并发（llm_retry.ResilientClient）时，整次请求在其控制下执行。
+
+    Args:
+        client: OpenAI 客户端
+        messages: 消息列表
+        model: 模型名
+        max_tokens: 最大生成 token 数
+        temperature: 温度
+        timeout: 请求超时（秒）
+        config: 配置字典
+        label: 日志前缀（如 "Map 3"）
+        max_sections: 二级标题数量上限（0 表示不限制）
+        cancel: threading.Event（可选），置位后流式接收立即中止，尚未发出或等待重试的请求
+                不再发送（抛出 RequestCancelled）；用于对冲请求的落后一方
+        route: 传给多端点路由器的端点提示（可选，见 llm_router.LLMRouter.create）
+
+    Returns:
+        (生成文本, 统计信息)；统计信息包含 ttft、elapsed、prompt_tokens、
+        completion_tokens、tokens_per_s、aborted（经过重试控制时另有 retries）
+    """
+    def attempt():
+        # 每次发送前检查（包括重试前与等待并发名额之后），已取消的请求不再打到后端
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelled(f"{label} 已取消")
+        return _complete_once(client, messages, model, max_tokens, temperature,
+                              timeout, config, label, max_sections, cancel, route)
+
+    call = getattr(client, "call_with_retry", None)
+    return call(attempt, label) if call is not None else attempt()
+
+
+def _complete_once(client, messages: list, model: str, max_tokens: int, temperature: float,
+                   timeout: float, config: dict, label: str, max_sections: int, cancel, route):
+    """发送一次请求并接收完整响应（参数同 complete）"""
+    summarizer_config = config["summarizer"]
+    start = time.time()
+
+    extra = {}
+    if route is not None:
+        extra["route"] = route
+
+    if not summarizer_config.get("stream", False):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout,
+            **extra
+        )
+        elapsed = time.time() - start
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "completion_tokens", None)
+        stats = {
+            "ttft": None,
+            "elapsed": round(elapsed, 3),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": tokens,
+            "tokens_per_s": round(tokens / elapsed, 1) if tokens and elapsed > 0 else None,
+            "aborted": None
+        }
+        return response.choices[0].message.content.strip(), stats
+
+    echo = summarizer_config.get("stream_echo", False)
+    progress_interval = summarizer_config.get("stream_progress_interval", 10)
+    guard = build_guard(config, max_sections)
+
+    if summarizer_config.get("stream_usage", False):
+        # 要求服务端在最后一个事件中返回 usage（部分本地服务不支持该参数）
+        extra["stream_options"] = {"include_usage": True}
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=timeout,
+        stream=True,
+        **extra
+    )
+
+    text = ""
+    ttft = None
+    deltas = 0
+    usage_tokens = None
+    prompt_tokens = None
+    aborted = None
+    last_progress = start
+
+    try:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                aborted = ABORT_CANCELLED
+                break
+            usage = getattr(chunk, "usage", None)
+            if usage is not None and getattr(usage, "completion_tokens", None):
+                usage_tokens = usage.completion_tokens
+                prompt_tokens = getattr(usage, "prompt_tokens", None)
+            if not chunk.choices:
+                continue
+
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+
+            now = time.time()
+            if ttft is None:
+                ttft = now - start
+            deltas += 1
+            text += delta
+
+            if echo:
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+            elif now - last_progress >= progress_interval:
+                last_progress = now
+                rate = deltas / (now - start - ttft) if now - start > ttft else 0
+                print(f"  [{label}] 已生成 {deltas} tokens（{rate:.1f} tokens/s）")
+
+            reason, cut = guard.check(text)
+            if reason:
+                aborted = reason
+                text = text[:cut]
+                break
+    finally:
+        # 提前中止时关闭连接，服务端随之停止生成
+        stream.close()
+
+    if echo:
+        print()
+
+    elapsed = time.time() - start
+    # 多数服务每个增量对应一个 token；服务端返回 usage 时以其为准
+    tokens = usage_tokens or deltas
+    generation_time = elapsed - (ttft or 0)
+    stats = {
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "elapsed": round(elapsed, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": tokens,
+        "tokens_per_s": round(tokens / generation_time, 1) if tokens and generation_time > 0 else None,
+        "aborted": aborted
+    }
+
+    if aborted == ABORT_REPETITION:
+        print(f"  ⚠ [{label}] 检测到重复输出，已在 {tokens} tokens 处中止")
+    elif aborted == ABORT_SECTIONS:
+        print(f"  ⚠ [{label}] 章节数超过 {max_sections}，已在 {tokens} tokens 处中止")
+
+    return text.strip(), stats
+
+
+def format_stats(stats: dict) -> str:
+    """统计信息的单行描述"""
+    parts = []
+    if stats.get("ttft") is not None:
+        parts.append(f"TTFT {stats['ttft']:.2f}s")
+    parts.append(f"耗时 {stats['elapsed']:.1f}s")
+    if stats.get("completion_tokens"):
+        parts.append(f"{stats['completion_tokens']} tokens")
+    if stats.get("tokens_per_s"):
+        parts.append(f"{stats['tokens_per_s']} tokens/s")
+    return "，".join(parts)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能指标
+功能：各阶段结束时把耗时、ASR 实时率、LLM 延迟分位数与 token 吞吐、产物大小等写入
+     <output_dir>/metrics.json，并同步生成 Prometheus textfile collector 格式的 metrics.prom
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+METRICS_JSON = "metrics.json"
+METRICS_PROM = "metrics.prom"
+
+# 统计大小的产物
+ARTIFACTS = [
+    "transcript.json", "transcript.col", "maps.json", "summary.md",
+    "summary.json", "quote_check.json", "summary_wechat.html"
+]
+
+_lock = threading.Lock()
+
+
+def _path_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size
+
+
+def artifact_sizes(output_dir: Path) -> dict:
+    """各产物的字节数（不存在的产物不列出）"""
+    return {
+        name: _path_size(output_dir / name)
+        for name in ARTIFACTS
+        if (output_dir / name).exists()
+    }
+
+
+def llm_summary(stats_list: list) -> dict:
+    """
+    汇总一组 LLM 请求的统计信息（llm_stream.complete 返回的 stats）
+
+    Args:
+        stats_list: 统计信息列表（缓存命中等没有统计的项为 None，会被忽略）
+
+    Returns:
+        请求数、延迟与 TTFT 分位数、token 数与吞吐
+    """
+    stats_list = [s for s in stats_list if s]
+    summary = {"llm_requests": len(stats_list)}
+    if not stats_list:
+        return summary
+
+    latencies = np.array([s["elapsed"] for s in stats_list])
+    for q in (50, 90, 99):
+        summary[f"llm_latency_p{q}_seconds"] = round(float(np.percentile(latencies, q)), 3)
+
+    ttfts = [s["ttft"] for s in stats_list if s.get("ttft") is not None]
+    if ttfts:
+        for q in (50, 90, 99):
+            summary[f"llm_ttft_p{q}_seconds"] = round(float(np.percentile(ttfts, q)), 3)
+
+    prompt_tokens = sum(s.get("prompt_tokens") or 0 for s in stats_list)
+    completion_tokens = sum(s.get("completion_tokens") or 0 for s in stats_list)
+    if prompt_tokens:
+        summary["llm_prompt_tokens"] = prompt_tokens
+    if completion_tokens:
+        summary["llm_completion_tokens"] = completion_tokens
+        rates = [s["tokens_per_s"] for s in stats_list if s.get("tokens_per_s")]
+        if rates:
+            summary["llm_tokens_per_second_mean"] = round(float(np.mean(rates)), 1)
+
+    summary["llm_aborted"] = sum(1 for s in stats_list if s.get("aborted"))
+    summary["llm_retries"] = sum(s.get("retries") or 0 for s in stats_list)
+    return summary
+
+
+def load_metrics(output_dir: str = "outputs") -> dict:
+    """读取 metrics.json，不存在时返回 None"""
+    path = Path(output_dir) / METRICS_JSON
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_atomic(path: Path, text: str):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(metrics: dict, episode: str) -> str:
+    """
+    转换为 Prometheus 文本格式
+
+    每个阶段的数值指标输出为 podcast_<指标名>{episode, stage}，
+    产物大小输出为 podcast_artifact_bytes{episode, artifact}。
+    """
+    episode_label = _escape_label(episode)
+    series = {}
+    for stage, values in metrics.get("stages", {}).items():
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            series.setdefault(f"podcast_{key}", []).append(
+                f'{{episode="{episode_label}",stage="{stage}"}} {value}'
+            )
+
+    lines = []
+    for name in sorted(series):
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{sample}" for sample in series[name])
+
+    if metrics.get("artifacts"):
+        lines.append("# TYPE podcast_artifact_bytes gauge")
+        for artifact, size in sorted(metrics["artifacts"].items()):
+            lines.append(f'podcast_artifact_bytes{{episode="{episode_label}",artifact="{artifact}"}} {size}')
+
+    lines.append("# TYPE podcast_metrics_updated_timestamp_seconds gauge")
+    lines.append(f'podcast_metrics_updated_timestamp_seconds{{episode="{episode_label}"}} {metrics["updated_at"]}')
+    return "\n".join(lines) + "\n"
+
+
+def record_stage(output_dir: str, stage: str, values: dict, config: dict = None):
+    """
+    记录一个阶段的指标并刷新 metrics.json / metrics.prom
+
+    Args:
+        output_dir: 本期节目的输出目录
+        stage: 阶段名
+        values: 指标（数值型会导出到 Prometheus，其他类型只保存在 JSON 中）
+        config: 配置字典；配置了 metrics.textfile_dir 时额外写入 node_exporter 的 textfile 目录
+    """
+    output_dir = Path(output_dir)
+    metrics_config = (config or {}).get("metrics", {}) or {}
+    if not metrics_config.get("enabled", True):
+        return
+
+    episode = output_dir.resolve().name
+    with _lock:
+        metrics = load_metrics(output_dir) or {"episode": episode, "stages": {}}
+        metrics["stages"][stage] = {k: v for k, v in values.items() if v is not None}
+        metrics["artifacts"] = artifact_sizes(output_dir)
+        metrics["updated_at"] = int(time.time())
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(output_dir / METRICS_JSON, json.dumps(metrics, ensure_ascii=False, indent=2))
+
+        prom_text = to_prometheus(metrics, episode)
+        _write_atomic(output_dir / METRICS_PROM, prom_text)
+
+        textfile_dir = metrics_config.get("textfile_dir")
+        if textfile_dir:
+            Path(textfile_dir).mkdir(parents=True, exist_ok=True)
+            _write_atomic(Path(textfile_dir) / f"podcast_{episode}.prom", prom_text)
+
+
+def format_summary(metrics: dict) -> list:
+    """metrics.json 的可读摘要（每个阶段一行）"""
+    lines = []
+    for stage, values in metrics.get("stages", {}).items():
+        parts = [f"{values.get('wall_seconds', 0):.1f}s"]
+        if "rtf" in values:
+            parts.append(f"RTF {values['rtf']:.3f}")
+        if "chunks" in values:
+            parts.append(f"{values['chunks']} 块")
+        if values.get("llm_requests"):
+            parts.append(f"{values['llm_requests']} 次请求")
+        if "llm_latency_p50_seconds" in values:
+            parts.append(
+                f"延迟 p50/p90 {values['llm_latency_p50_seconds']:.1f}/{values['llm_latency_p90_seconds']:.1f}s"
+            )
+        if "llm_ttft_p50_seconds" in values:
+            parts.append(f"TTFT p50 {values['llm_ttft_p50_seconds']:.2f}s")
+        if "llm_completion_tokens" in values:
+            parts.append(f"{values['llm_completion_tokens']} tokens")
+        if "llm_tokens_per_second_mean" in values:
+            parts.append(f"{values['llm_tokens_per_second_mean']} tokens/s")
+        lines.append(f"{stage}: " + "，".join(parts))
+    return lines
@@ -6,9 +6,52 @@
 """
 
 import sys
+import time
+import wave
+import argparse
 import subprocess
 from pathlib import Path
 
+import yaml
+import numpy as np
+
+import metrics
+from stage_manifest import StageManifest
+
+
+SAMPLE_RATE = 16000
+
+# 每次从 ffmpeg 管道读取的字节数
+PIPE_READ_BYTES = 1 << 20
+
+
+def load_config():
+    """加载配置文件"""
+    config_path = Path("config.yaml")
+    if not config_path.exists():
+        raise FileNotFoundError("未找到 config.yaml 配置文件")
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def wav_path_for(input_path: str) -> Path:
+    """输出文件名：原文件名_16k.wav"""
+    input_file = Path(input_path)
+    return input_file.parent / f"{input_file.stem}_16k.wav"
+
+
+def stage_manifest(input_path: str, output_dir: str = "outputs") -> StageManifest:
+    """预处理阶段指纹：输入音频 + 固定的转换参数"""
+    return StageManifest(
+        "prep_audio", output_dir,
+        inputs=[input_path],
+        outputs=[wav_path_for(input_path)],
+        config={},
+        config_keys=[],
+        extra={"ffmpeg": f"-ar {SAMPLE_RATE} -ac 1 -c:a pcm_s16le"}
+    )
+
 
 def convert_audio(input_path: str) -> str:
     """
@@ -25,8 +68,7 @@ def convert_audio(input_path: str) -> str:
     if not input_file.exists():
         raise FileNotFoundError(f"输入文件不存在: {input_path}")
 
-    # 生成输出文件名：原文件名_16k.wav
-    output_file = input_file.parent / f"{input_file.stem}_16k.wav"
+    output_file = wav_path_for(input_file)
 
     print(f"[准备] 输入文件: {input_file}")
     print(f"[准备] 输出文件: {output_file}")
@@ -67,16 +109,116 @@ def convert_audio(input_path: str) -> str:
         raise
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("用法: python prep_audio.py <音频文件路径>")
-        print("示例: python prep_audio.py audio/demo.m4a")
-        sys.exit(1)
+def decode_audio_pcm(input_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    使用 ffmpeg 将音频解码为内存中的 16kHz 单声道 float32 数组，不写中间 WAV 文件
+
+    ffmpeg 将原始 PCM（s16le）写到标准输出，这里分块读取到内存后一次性转换。
+
+    Args:
+        input_path: 输入音频文件路径（.m4a / .wav 等 ffmpeg 支持的格式）
+        sample_rate: 目标采样率
+
+    Returns:
+        取值范围 [-1, 1] 的 float32 数组
+    """
+    input_file = Path(input_path)
+
+    if not input_file.exists():
+        raise FileNotFoundError(f"输入文件不存在: {input_path}")
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-i", str(input_file),
+        "-ar", str(sample_rate),  # 采样率 16kHz
+        "-ac", "1",               # 单声道
+        "-f", "s16le",            # 原始 PCM 16-bit
+        "-loglevel", "error",
+        "-"                       # 输出到标准输出
+    ]
+
+    print(f"[解码] 内存解码: {input_file}")
+
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        print("[错误] 未找到 ffmpeg，请先安装:")
+        print("  macOS: brew install ffmpeg")
+        print("  Ubuntu: sudo apt install ffmpeg")
+        print("  Windows: 下载 https://ffmpeg.org/download.html")
+        raise
 
-    input_audio = sys.argv[1]
+    buffer = bytearray()
+    while True:
+        block = process.stdout.read(PIPE_READ_BYTES)
+        if not block:
+            break
+        buffer += block
+
+    stderr = process.stderr.read().decode("utf-8", errors="ignore")
+    if process.wait() != 0:
+        print(f"[错误] ffmpeg 执行失败:")
+        print(f"  stderr: {stderr}")
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+
+    # s16le 每个采样 2 字节，丢弃可能的不完整尾字节
+    usable = len(buffer) - len(buffer) % 2
+    audio = np.frombuffer(buffer[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+    print(f"[完成] 解码 {len(audio) / sample_rate:.2f} 秒音频 ({usable / 1024 / 1024:.1f} MB PCM)")
+    return audio
+
+
+def write_wav(audio: np.ndarray, output_path: str, sample_rate: int = SAMPLE_RATE):
+    """
+    将内存中的 float32 音频保存为 16-bit WAV（调试用）
+
+    Args:
+        audio: float32 音频数组
+        output_path: 输出 WAV 文件路径
+        sample_rate: 采样率
+    """
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(str(output_path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    print(f"[保存] 调试 WAV: {output_path}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="音频预处理",
+        epilog="示例: python prep_audio.py audio/demo.m4a"
+    )
+    parser.add_argument("audio", help="音频文件路径")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（用于保存阶段指纹，默认 outputs）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    input_audio = args.audio
 
     try:
+        config = load_config()
+        manifest = stage_manifest(input_audio, args.output_dir)
+        if not args.force and manifest.is_fresh():
+            print(manifest.skip_message())
+            print(f"  下一步可执行: python transcribe.py {wav_path_for(input_audio)}")
+            return
+
+        start = time.time()
         output_wav = convert_audio(input_audio)
+        manifest.record()
+        metrics.record_stage(args.output_dir, "prep_audio", {
+            "wall_seconds": round(time.time() - start, 2),
+            "wav_bytes": Path(output_wav).stat().st_size
+        }, config)
         print(f"\n✓ 预处理完成: {output_wav}")
         print(f"  下一步可执行: python transcribe.py {output_wav}")
 
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转写进度文件
+功能：转写过程中定期把已解码的音频时长、片段数、当前实时率与预计剩余时间原子写入一个小 JSON 文件，
+     check_progress.py 只需读取该文件即可知道长任务进行到哪里
+"""
+
+import os
+import json
+import time
+from pathlib import Path
+
+
+PROGRESS_FILE_NAME = "transcribe_progress.json"
+
+# 超过该秒数未更新的 running 状态视为可能已中断
+STALE_SECONDS = 120
+
+
+class ProgressWriter:
+    """
+    转写进度写入器
+
+    update() 按时间间隔节流，finish()/fail() 总会写入最终状态；
+    每次写入都先写临时文件再 os.replace，读取方不会读到半个文件。
+    """
+
+    def __init__(self, path: str, audio_file: str, interval: float = 2.0):
+        """
+        Args:
+            path: 进度文件路径
+            audio_file: 正在转写的音频文件
+            interval: 两次写入的最小间隔（秒）
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self.start = time.time()
+        self._last_write = 0.0
+        self.state = {
+            "status": "running",
+            "audio_file": str(audio_file),
+            "pid": os.getpid(),
+            "started_at": int(self.start),
+            "duration": None,
+            "audio_seconds": 0.0,
+            "segments": 0
+        }
+
+    def _write(self):
+        now = time.time()
+        elapsed = now - self.start
+        audio_seconds = self.state["audio_seconds"]
+        duration = self.state["duration"]
+
+        self.state["elapsed"] = round(elapsed, 1)
+        self.state["updated_at"] = int(now)
+        self.state["rtf"] = round(elapsed / audio_seconds, 4) if audio_seconds else None
+        if duration:
+            self.state["percent"] = round(min(100.0, audio_seconds / duration * 100), 1)
+            self.state["eta_seconds"] = (
+                round(max(0.0, duration - audio_seconds) * self.state["rtf"], 1)
+                if self.state["rtf"] is not None else None
+            )
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._last_write = now
+
+    def set_duration(self, duration: float):
+        """模型返回 info.duration 后调用"""
+        self.state["duration"] = round(duration, 2)
+        self._write()
+
+    def update(self, audio_seconds: float, segments: int):
+        """
+        记录当前进度（距上次写入不足 interval 时只更新内存）
+
+        Args:
+            audio_seconds: 已解码到的音频位置（秒）
+            segments: 已产生的片段数
+        """
+        self.state["audio_seconds"] = round(audio_seconds, 2)
+        self.state["segments"] = segments
+        if time.time() - self._last_write >= self.interval:
+            self._write()
+
+    def finish(self):
+        """转写完成"""
+        self.state["status"] = "done"
+        if self.state["duration"]:
+            self.state["audio_seconds"] = self.state["duration"]
+        self._write()
+
+    def fail(self, error: str):
+        """转写失败"""
+        self.state["status"] = "failed"
+        self.state["error"] = error
+        self._write()
+
+
+def read_progress(path: str) -> dict:
+    """
+    读取进度文件
+
+    Returns:
+        进度字典（running 状态且长时间未更新时附加 stale=True）；文件不存在或损坏时返回 None
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if progress.get("status") == "running":
+        progress["stale"] = time.time() - progress.get("updated_at", 0) > STALE_SECONDS
+    return progress
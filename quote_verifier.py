@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引文核验脚本
+功能：对转写文本建立一次字符 n-gram 倒排索引，核验 maps.json 与 summary.md 中的每条
+     "关键引文"是否真的出现在转写中，并给出实际出现的时间范围，标记疑似编造或时间错位的引文
+
+每条引文只查询其中最稀有的若干个 n-gram 来定位候选位置，再对少量候选窗口做模糊比对，
+无需对整篇转写逐条做子串扫描。
+"""
+
+import re
+import sys
+import json
+import bisect
+import argparse
+from pathlib import Path
+from difflib import SequenceMatcher
+from collections import defaultdict
+
+import yaml
+
+import transcript_store
+
+
+# > "引文内容" [12:31-12:50] 或 [12:31]；允许缩进（列表项下的引用块），引号兼容中英文，时间可省略
+QUOTE_PATTERN = re.compile(
+    r'^[ \t]*>\s*["“「](?P<text>.+?)["”」]\s*'
+    r'(?:\[(?P<start>\d{1,2}:\d{2}(?::\d{2})?)'
+    r'(?:\s*[-–~至]\s*(?P<end>\d{1,2}:\d{2}(?::\d{2})?))?\])?',
+    re.MULTILINE
+)
+
+
+def load_config():
+    """加载配置文件"""
+    with open("config.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def parse_timestamp(text: str) -> int:
+    """MM:SS 或 HH:MM:SS 转换为秒"""
+    seconds = 0
+    for part in text.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数转换为 MM:SS（超过一小时为 HH:MM:SS）"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def normalize(text: str) -> str:
+    """去掉空白与标点并统一小写，只保留用于比对的文字"""
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def extract_quotes(text: str, source: str) -> list:
+    """
+    提取 Markdown 中的引文
+
+    Args:
+        text: Markdown 文本
+        source: 来源标记（如 "summary.md"、"chunk 3"）
+
+    Returns:
+        [{source, text, cited_start, cited_end}]，未标注时间时 cited_* 为 None；
+        只标注单个时间点时 cited_start 与 cited_end 相同
+    """
+    quotes = []
+    for match in QUOTE_PATTERN.finditer(text):
+        cited_start = parse_timestamp(match.group("start")) if match.group("start") else None
+        cited_end = parse_timestamp(match.group("end")) if match.group("end") else cited_start
+        quotes.append({
+            "source": source,
+            "text": match.group("text").strip(),
+            "cited_start": cited_start,
+            "cited_end": cited_end
+        })
+    return quotes
+
+
+class TranscriptIndex:
+    """
+    转写文本的字符 n-gram 倒排索引
+
+    所有片段规范化后首尾相接成一个字符串，记录每个片段的起始偏移，
+    命中位置可通过二分查找映射回片段及其时间。
+    """
+
+    def __init__(self, transcript, ngram: int = 3):
+        """
+        Args:
+            transcript: 转写结果（JSON 字典或 ColumnarTranscript）
+            ngram: n-gram 长度
+        """
+        self.ngram = ngram
+        self.seg_offsets = []
+        self.seg_times = []
+
+        parts = []
+        offset = 0
+        for seg in transcript["segments"]:
+            norm = normalize(seg["text"])
+            if not norm:
+                continue
+            self.seg_offsets.append(offset)
+            self.seg_times.append((seg["start"], seg["end"]))
+            parts.append(norm)
+            offset += len(norm)
+        self.text = "".join(parts)
+
+        postings = defaultdict(list)
+        for pos in range(len(self.text) - ngram + 1):
+            postings[self.text[pos:pos + ngram]].append(pos)
+        self.postings = postings
+
+    def _segment_at(self, pos: int) -> int:
+        return bisect.bisect_right(self.seg_offsets, pos) - 1
+
+    def _candidates(self, query: str, max_grams: int, max_candidates: int) -> list:
+        """用最稀有的 n-gram 投票选出候选起始位置"""
+        n = self.ngram
+        grams = {}
+        for i in range(len(query) - n + 1):
+            gram = query[i:i + n]
+            if gram in self.postings and gram not in grams:
+                grams[gram] = i
+        if not grams:
+            return []
+
+        rarest = sorted(grams, key=lambda g: len(self.postings[g]))[:max_grams]
+
+        # 同一对齐位置附近的命中合并计票
+        bucket_size = max(1, len(query) // 4)
+        votes = defaultdict(int)
+        starts = {}
+        for gram in rarest:
+            offset = grams[gram]
+            for pos in self.postings[gram]:
+                start = pos - offset
+                bucket = start // bucket_size
+                votes[bucket] += 1
+                starts.setdefault(bucket, start)
+
+        best = sorted(votes, key=lambda b: votes[b], reverse=True)[:max_candidates]
+        return [starts[b] for b in best]
+
+    def locate_all(self, quote: str, max_grams: int = 8, max_candidates: int = 6) -> list:
+        """
+        在转写中查找引文的所有候选出现位置（同一句话可能在节目中出现多次）
+
+        Args:
+            quote: 引文原文
+            max_grams: 参与定位的最稀有 n-gram 数
+            max_candidates: 做模糊比对的候选窗口数
+
+        Returns:
+            [{similarity, start, end}]，按相似度从高到低排列，同一时间范围只保留一次
+        """
+        query = normalize(quote)
+        if len(query) < self.ngram:
+            return []
+
+        found = {}
+        slack = max(self.ngram, len(query) // 4)
+        for start in self._candidates(query, max_grams, max_candidates):
+            lo = max(0, start - slack)
+            window = self.text[lo:start + len(query) + slack]
+            matcher = SequenceMatcher(None, query, window, autojunk=False)
+            blocks = [b for b in matcher.get_matching_blocks() if b.size]
+            if not blocks:
+                continue
+
+            similarity = round(sum(b.size for b in blocks) / len(query), 3)
+            first = self._segment_at(lo + blocks[0].b)
+            last = self._segment_at(lo + blocks[-1].b + blocks[-1].size - 1)
+            span = (self.seg_times[first][0], self.seg_times[last][1])
+            if similarity > found.get(span, -1.0):
+                found[span] = similarity
+
+        return sorted(
+            ({"similarity": sim, "start": start, "end": end} for (start, end), sim in found.items()),
+            key=lambda c: c["similarity"], reverse=True
+        )
+
+    def locate(self, quote: str, max_grams: int = 8, max_candidates: int = 6) -> dict:
+        """
+        在转写中查找引文的最佳匹配位置（参数同 locate_all）
+
+        Returns:
+            {similarity, start, end}，找不到任何候选时 similarity 为 0、start/end 为 None
+        """
+        candidates = self.locate_all(quote, max_grams, max_candidates)
+        return candidates[0] if candidates else {"similarity": 0.0, "start": None, "end": None}
+
+
+def time_distance(candidate: dict, cited_start: float, cited_end: float) -> float:
+    """候选出现位置与标注时间范围之间的间隔（秒，有重叠时为 0）"""
+    return max(0.0, candidate["start"] - cited_end, cited_start - candidate["end"])
+
+
+def verify_quotes(index: TranscriptIndex, quotes: list,
+                  min_similarity: float = 0.6, time_tolerance: float = 30) -> list:
+    """
+    核验引文
+
+    Args:
+        index: 转写索引
+        quotes: extract_quotes 的结果
+        min_similarity: 低于该相似度视为转写中不存在（疑似编造）
+        time_tolerance: 标注时间与实际时间允许相差的秒数
+
+    Returns:
+        每条引文的核验结果，status 为 ok / misplaced / not_found / too_short
+    """
+    results = []
+    for quote in quotes:
+        result = dict(quote)
+        if len(normalize(quote["text"])) < index.ngram:
+            result.update({"status": "too_short", "similarity": None, "actual_start": None, "actual_end": None})
+            results.append(result)
+            continue
+
+        candidates = index.locate_all(quote["text"])
+        matches = [c for c in candidates if c["similarity"] >= min_similarity]
+
+        if not matches:
+            found = candidates[0] if candidates else {"similarity": 0.0, "start": None, "end": None}
+            result["status"] = "not_found"
+        elif quote["cited_start"] is None:
+            found = matches[0]
+            result["status"] = "ok"
+        else:
+            # 同一句话出现多次时，任一处落在标注时间附近即视为正确；取离标注时间最近的一处
+            found = min(matches, key=lambda c: (
+                time_distance(c, quote["cited_start"], quote["cited_end"]), -c["similarity"]
+            ))
+            in_range = time_distance(found, quote["cited_start"], quote["cited_end"]) <= time_tolerance
+            result["status"] = "ok" if in_range else "misplaced"
+
+        result.update({
+            "similarity": found["similarity"],
+            "actual_start": found["start"],
+            "actual_end": found["end"]
+        })
+        results.append(result)
+    return results
+
+
+def describe_issue(result: dict) -> str:
+    """将核验失败的引文转换为质检提醒文本"""
+    text = result["text"] if len(result["text"]) <= 30 else result["text"][:30] + "…"
+    if result["status"] == "not_found":
+        return f"引文「{text}」（{result['source']}）在转写中未找到（相似度 {result['similarity']:.0%}），疑似编造"
+    actual = f"{format_timestamp(result['actual_start'])}-{format_timestamp(result['actual_end'])}"
+    cited = format_timestamp(result["cited_start"])
+    if result["cited_end"] != result["cited_start"]:
+        cited += f"-{format_timestamp(result['cited_end'])}"
+    return f"引文「{text}」（{result['source']}）标注时间 [{cited}]，实际出现在 [{actual}]"
+
+
+def check_outputs(transcript, maps: list, summary: str, config: dict) -> list:
+    """
+    核验 Map 结果与最终摘要中的全部引文
+
+    Args:
+        transcript: 转写结果
+        maps: Map 结果列表
+        summary: 最终摘要 Markdown
+        config: 配置字典（读取 qc 配置段）
+
+    Returns:
+        核验结果列表
+    """
+    qc_config = config.get("qc", {}) or {}
+    index = TranscriptIndex(transcript, qc_config.get("quote_ngram", 3))
+
+    quotes = []
+    for m in maps:
+        if "error" not in m:
+            quotes.extend(extract_quotes(m["summary"], f"chunk {m['chunk_id']}"))
+    quotes.extend(extract_quotes(summary, "summary.md"))
+
+    return verify_quotes(
+        index, quotes,
+        min_similarity=qc_config.get("quote_min_similarity", 0.6),
+        time_tolerance=qc_config.get("quote_time_tolerance", 30)
+    )
+
+
+def save_report(results: list, output_dir: str = "outputs") -> Path:
+    """保存核验报告 quote_check.json"""
+    report_path = Path(output_dir) / "quote_check.json"
+    counts = defaultdict(int)
+    for r in results:
+        counts[r["status"]] += 1
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"counts": counts, "quotes": results}, f, ensure_ascii=False, indent=2)
+    return report_path
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="核验摘要中的引文",
+        epilog="示例: python quote_verifier.py --output-dir outputs"
+    )
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+
+    try:
+        config = load_config()
+        transcript = transcript_store.load_transcript(output_dir)
+
+        with open(output_dir / "maps.json", "r", encoding="utf-8") as f:
+            maps = json.load(f)
+        summary_path = output_dir / "summary.md"
+        summary = summary_path.read_text(encoding="utf-8") if summary_path.exists() else ""
+
+        print(f"[核验] 引文核验（{len(transcript['segments'])} 个片段）...")
+        results = check_outputs(transcript, maps, summary, config)
+        report_path = save_report(results, output_dir)
+
+        issues = [r for r in results if r["status"] in ("not_found", "misplaced")]
+        for r in issues:
+            print(f"  ⚠ {describe_issue(r)}")
+
+        print(f"\n✓ 共核验 {len(results)} 条引文，问题 {len(issues)} 条")
+        print(f"  报告: {report_path}")
+
+    except Exception as e:
+        print(f"\n✗ 处理失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,14 +16,28 @@ if sys.platform == "win32":
         sys.stderr.reconfigure(encoding='utf-8')
 
 import json
+import time
+import argparse
 from pathlib import Path
 from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
-import httpx
 import yaml
 import re
 from openai import OpenAI
 
+import llm_router
+import llm_stream
+import metrics
+import quote_verifier
+import summary_parser
+import transcript_store
+from llm_cache import LLMCache, build_cache
+from stage_manifest import StageManifest, text_digest
+from chunk_and_map import format_time, estimate_tokens, open_llm_client
+
+
+REDUCE_SYSTEM_PROMPT = "你是专业的播客内容整合分析助手。"
 
 REDUCE_PROMPT_TEMPLATE = """下面是若干分段总结，请整合为对整期播客的**全量覆盖**总结：
 
@@ -73,76 +87,287 @@ REDUCE_PROMPT_TEMPLATE = """下面是若干分段总结，请整合为对整期
 """
 
 
+INTERMEDIATE_REDUCE_PROMPT_TEMPLATE = """下面是同一期播客中连续的若干分段总结（覆盖 {time_range}），请将它们合并为一份更紧凑的分段总结，供后续整合使用：
+
+要求：
+1) 仅依据分段总结内容，严禁编造
+2) 保留所有重要事实与观点，合并重复信息
+3) 关键引文保持原句及原有时间范围（如[12:31-12:50]），不得修改时间戳
+4) 按时间顺序列出各小节的时间范围与标题
+
+请以如下格式输出：
+
+## 标题
+[合并后的标题]
+
+## 时间轴
+- [MM:SS-MM:SS] [小节标题]
+- ...
+
+## 要点
+- [要点1]
+- [要点2]
+...
+
+## 关键引文
+> "[引文内容]" [时间范围]
+
+## 名词术语
+- [中文名]（[英文名]）
+- ...
+
+【分段总结】
+{maps}
+"""
+
+
 def load_config():
     """加载配置文件"""
     with open("config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 
-def load_maps():
+def load_maps(output_dir: str = "outputs"):
     """加载 Map 结果"""
-    maps_path = Path("outputs/maps.json")
+    maps_path = Path(output_dir) / "maps.json"
     if not maps_path.exists():
-        raise FileNotFoundError("未找到 outputs/maps.json，请先运行 chunk_and_map.py")
+        raise FileNotFoundError(f"未找到 {maps_path}，请先运行 chunk_and_map.py")
 
     with open(maps_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def load_transcript():
+def load_transcript(output_dir: str = "outputs"):
     """加载转写结果（用于质检）"""
-    transcript_path = Path("outputs/transcript.json")
-    with open(transcript_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return transcript_store.load_transcript(output_dir)
 
 
 def format_maps_for_reduce(maps: list) -> str:
-    """将 Map 结果格式化为 Reduce 输入"""
+    """将 Map 结果格式化为 Reduce 输入（生成失败的分块不计入，避免错误信息被当作内容）"""
     formatted = ""
     for m in maps:
+        if "error" in m:
+            continue
         formatted += f"\n## Chunk {m['chunk_id']} {m['time_range']}\n\n"
         formatted += m['summary']
         formatted += "\n\n" + "="*60 + "\n"
     return formatted
 
 
-def generate_reduce_summary(client: OpenAI, maps: list, config: dict) -> str:
+def call_reduce_llm(client: OpenAI, prompt: str, max_tokens: int, config: dict,
+                    cache: LLMCache = None, llm_log: list = None) -> str:
+    """
+    调用 LLM 执行一次 Reduce 请求（优先查询缓存）
+
+    Args:
+        client: OpenAI 客户端
+        prompt: 完整提示词
+        max_tokens: 最大生成 token 数
+        config: 配置字典
+        cache: LLM 响应缓存（可选）
+        llm_log: 请求统计列表（可选），实际发出请求时追加 llm_stream 的统计信息
+
+    Returns:
+        生成的文本
+    """
+    summarizer_config = config["summarizer"]
+    model = summarizer_config["model"]
+    temperature = summarizer_config.get("temperature", 0.3)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(prompt, REDUCE_SYSTEM_PROMPT, model, max_tokens, temperature)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Reduce 阶段需要更长的超时时间
+    reduce_timeout = summarizer_config.get("reduce_timeout", 300)  # 默认 5 分钟
+
+    text, stats = llm_stream.complete(
+        client,
+        [
+            {"role": "system", "content": REDUCE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model, max_tokens, temperature,
+        timeout=reduce_timeout,
+        config=config,
+        label="Reduce",
+        max_sections=summarizer_config.get("reduce_max_sections", 0)
+    )
+    print(f"  [Reduce] {llm_stream.format_stats(stats)}")
+    if llm_log is not None:
+        llm_log.append(stats)
+
+    if cache_key is not None and not stats["aborted"]:
+        cache.put(cache_key, text, model)
+
+    return text
+
+
+def group_maps_by_budget(maps: list, budget_tokens: int, max_fan_in: int) -> list:
+    """
+    按 token 预算将连续的分段总结分组
+
+    Args:
+        maps: 分段总结列表（按时间顺序）
+        budget_tokens: 每组输入的 token 上限
+        max_fan_in: 每组最多包含的分段数
+
+    Returns:
+        分组列表，每组为连续的分段总结列表
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for m in maps:
+        tokens = estimate_tokens(format_maps_for_reduce([m]))
+        if current and (current_tokens + tokens > budget_tokens or len(current) >= max_fan_in):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(m)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+def reduce_map_group(client: OpenAI, group: list, group_id: int, level: int, config: dict,
+                     cache: LLMCache = None, llm_log: list = None) -> dict:
+    """
+    将一组连续的分段总结合并为一个中间分段总结
+
+    Args:
+        client: OpenAI 客户端
+        group: 连续的分段总结列表
+        group_id: 本层分组序号
+        level: 归约层级（从 1 开始）
+        config: 配置字典
+        cache: LLM 响应缓存（可选）
+        llm_log: 请求统计列表（可选）
+
+    Returns:
+        与 Map 结果结构相同的中间结果，时间范围覆盖整组
+    """
+    summarizer_config = config["summarizer"]
+
+    start_time = group[0]["start_time"]
+    end_time = group[-1]["end_time"]
+    time_range = f"[{format_time(start_time)} - {format_time(end_time)}]"
+
+    if len(group) == 1:
+        return dict(group[0], chunk_id=group_id)
+
+    prompt = INTERMEDIATE_REDUCE_PROMPT_TEMPLATE.format(
+        time_range=time_range,
+        maps=format_maps_for_reduce(group)
+    )
+    max_tokens = summarizer_config.get(
+        "reduce_intermediate_max_tokens", summarizer_config["reduce_max_tokens"]
+    )
+
+    print(f"  [L{level}-{group_id}] 合并 {len(group)} 个分段 {time_range}...")
+    summary = call_reduce_llm(client, prompt, max_tokens, config, cache, llm_log)
+
+    return {
+        "chunk_id": group_id,
+        "time_range": time_range,
+        "start_time": start_time,
+        "end_time": end_time,
+        "char_count": sum(m["char_count"] for m in group),
+        "summary": summary
+    }
+
+
+def tree_reduce_maps(client: OpenAI, maps: list, config: dict, cache: LLMCache = None,
+                     llm_log: list = None) -> list:
+    """
+    多级归约：按 token 预算分组并发合并，直至所有分段可放入一次最终 Reduce 请求
+
+    Args:
+        client: OpenAI 客户端
+        maps: Map 结果列表
+        config: 配置字典
+        cache: LLM 响应缓存（可选）
+        llm_log: 请求统计列表（可选）
+
+    Returns:
+        可直接用于最终 Reduce 的分段总结列表
+    """
+    summarizer_config = config["summarizer"]
+    budget_tokens = summarizer_config.get("reduce_input_tokens", 12000)
+    max_fan_in = max(2, summarizer_config.get("reduce_fan_in", 8))
+    max_concurrency = llm_router.total_concurrency(config)
+
+    items = maps
+    level = 0
+    while estimate_tokens(format_maps_for_reduce(items)) > budget_tokens:
+        groups = group_maps_by_budget(items, budget_tokens, max_fan_in)
+        if len(groups) == len(items):
+            print(f"  ⚠ 单个分段已超出预算 ({budget_tokens} tokens)，无法继续合并")
+            break
+
+        level += 1
+        print(f"\n[Reduce L{level}] {len(items)} 个分段 → {len(groups)} 组"
+              f"（预算 {budget_tokens} tokens，最大扇入 {max_fan_in}）")
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            items = list(executor.map(
+                lambda args: reduce_map_group(client, args[1], args[0], level, config, cache, llm_log),
+                enumerate(groups)
+            ))
+
+    return items
+
+
+def generate_reduce_summary(client: OpenAI, maps: list, config: dict,
+                            cache: LLMCache = None, llm_log: list = None) -> str:
     """
     生成 Reduce 摘要
 
+    分段总结总量超出 summarizer.reduce_input_tokens 时，先逐级合并再做最终整合。
+
     Args:
         client: OpenAI 客户端
         maps: Map 结果列表
         config: 配置字典
+        cache: LLM 响应缓存（可选）
+        llm_log: 请求统计列表（可选），用于导出性能指标
 
     Returns:
         完整摘要文本
     """
     summarizer_config = config["summarizer"]
 
-    maps_text = format_maps_for_reduce(maps)
-    prompt = REDUCE_PROMPT_TEMPLATE.format(maps=maps_text)
+    failed = [m for m in maps if "error" in m]
+    if failed:
+        print(f"  ⚠ {len(failed)} 个分段摘要生成失败，不纳入 Reduce: "
+              f"{', '.join(m['time_range'] for m in failed)}")
+        maps = [m for m in maps if "error" not in m]
+    if not maps:
+        raise RuntimeError("所有分段摘要均生成失败，无法执行 Reduce")
 
     print(f"[Reduce] 整合 {len(maps)} 个分段摘要...")
+    reduce_inputs = tree_reduce_maps(client, maps, config, cache, llm_log)
+
+    maps_text = format_maps_for_reduce(reduce_inputs)
+    prompt = REDUCE_PROMPT_TEMPLATE.format(maps=maps_text)
+
+    print(f"\n[Reduce] 最终整合 {len(reduce_inputs)} 个分段")
     print(f"  输入长度: {len(prompt)} 字符")
 
     try:
-        # Reduce 阶段需要更长的超时时间
-        reduce_timeout = summarizer_config.get("reduce_timeout", 300)  # 默认 5 分钟
+        reduce_timeout = summarizer_config.get("reduce_timeout", 300)
         print(f"  等待 LLM 响应（超时: {reduce_timeout}s）...")
 
-        response = client.chat.completions.create(
-            model=summarizer_config["model"],
-            messages=[
-                {"role": "system", "content": "你是专业的播客内容整合分析助手。"},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=summarizer_config["reduce_max_tokens"],
-            temperature=summarizer_config.get("temperature", 0.3),
-            timeout=reduce_timeout
+        summary = call_reduce_llm(
+            client, prompt, summarizer_config["reduce_max_tokens"], config, cache, llm_log
         )
-
-        summary = response.choices[0].message.content.strip()
         print(f"  ✓ 生成成功 ({len(summary)} 字符)")
 
         return summary
@@ -152,6 +377,19 @@ def generate_reduce_summary(client: OpenAI, maps: list, config: dict) -> str:
         raise
 
 
+def quality_check_failed_maps(maps: list) -> list:
+    """
+    列出未纳入总结的分段（Map 阶段重试后仍失败）
+
+    Returns:
+        质检问题列表
+    """
+    return [
+        f"{m['time_range']} 的分段摘要生成失败（{m['error']}），该时间段未纳入总结"
+        for m in maps if "error" in m
+    ]
+
+
 def quality_check_timestamps(summary: str, transcript: dict) -> list:
     """
     质检时间戳是否越界
@@ -195,88 +433,132 @@ def quality_check_timestamps(summary: str, transcript: dict) -> list:
     return issues
 
 
-def extract_structured_data(summary: str) -> dict:
+def quality_check_quotes(summary: str, maps: list, transcript, config: dict,
+                         output_dir: str = "outputs") -> list:
+    """
+    质检引文：核验 Map 结果与摘要中的引文是否出现在转写中、标注时间是否正确
+
+    Args:
+        summary: 摘要文本
+        maps: Map 结果列表
+        transcript: 转写结果
+        config: 配置字典
+        output_dir: 输出目录（写入 quote_check.json）
+
+    Returns:
+        问题列表
+    """
+    print(f"\n[质检] 核验引文...")
+    results = quote_verifier.check_outputs(transcript, maps, summary, config)
+    quote_verifier.save_report(results, output_dir)
+
+    issues = [
+        quote_verifier.describe_issue(r)
+        for r in results if r["status"] in ("not_found", "misplaced")
+    ]
+    for issue in issues:
+        print(f"  ⚠ {issue}")
+
+    if not issues:
+        print(f"  ✓ {len(results)} 条引文均能在转写中找到")
+
+    return issues
+
+
+def extract_structured_data(summary: str, tree: dict = None) -> dict:
     """
     从摘要中提取结构化数据
 
     Args:
         summary: 摘要文本
+        tree: 已解析的章节树（为空时解析 summary）
 
     Returns:
         结构化数据字典
     """
-    data = {
-        "quick_overview": [],
-        "timeline": [],
-        "key_points": {},
-        "conclusions": [],
-        "glossary": []
-    }
+    if tree is None:
+        tree = summary_parser.parse_summary(summary, render_html=False)
+    return summary_parser.structured_data(tree)
 
-    # 提取一屏速览
-    overview_match = re.search(r'## 一屏速览.*?\n(.*?)(?=\n##|\Z)', summary, re.DOTALL)
-    if overview_match:
-        points = re.findall(r'[-*] (.+)', overview_match.group(1))
-        data["quick_overview"] = points
-
-    # 提取时间轴
-    timeline_match = re.search(r'## 时间轴目录.*?\n(.*?)(?=\n##|\Z)', summary, re.DOTALL)
-    if timeline_match:
-        timeline_items = re.findall(r'[-*] \[([^\]]+)\] (.+)', timeline_match.group(1))
-        data["timeline"] = [{"time": t[0], "title": t[1]} for t in timeline_items]
-
-    # 提取深度要点（简化版）
-    points_match = re.search(r'## 深度要点.*?\n(.*?)(?=\n## [^#]|\Z)', summary, re.DOTALL)
-    if points_match:
-        sections = re.findall(r'### (.+?)\n(.*?)(?=\n###|\Z)', points_match.group(1), re.DOTALL)
-        for section_title, section_content in sections:
-            points = re.findall(r'[-*] (.+)', section_content)
-            data["key_points"][section_title] = points
-
-    # 提取结论
-    conclusion_match = re.search(r'## 结论/启示/行动建议.*?\n(.*?)(?=\n##|\Z)', summary, re.DOTALL)
-    if conclusion_match:
-        conclusions = re.findall(r'[-*] (.+)', conclusion_match.group(1))
-        data["conclusions"] = conclusions
-
-    # 提取术语表
-    glossary_match = re.search(r'## 人名/组织/术语表.*?\n(.*?)(?=\n##|\Z)', summary, re.DOTALL)
-    if glossary_match:
-        terms = re.findall(r'[-*] \*\*([^*]+)\*\*[^-\n]*', glossary_match.group(1))
-        data["glossary"] = terms
-
-    return data
-
-
-def save_results(summary: str, structured_data: dict, qc_issues: list):
-    """保存结果"""
-    outputs_dir = Path("outputs")
 
-    # 保存 Markdown
-    summary_md_path = outputs_dir / "summary.md"
+def format_summary_md(summary: str, qc_issues: list) -> str:
+    """summary.md 的内容：摘要 + 质检提醒"""
     summary_with_qc = summary
     if qc_issues:
         summary_with_qc += "\n\n---\n\n## ⚠ 质检提醒\n\n"
         for issue in qc_issues:
             summary_with_qc += f"- {issue}\n"
+    return summary_with_qc
+
+
+def save_results(summary: str, structured_data: dict, qc_issues: list, output_dir: str = "outputs",
+                 tree: dict = None):
+    """
+    保存结果
+
+    章节树随 summary.json 保存，HTML 阶段直接从树渲染，不必再次解析 summary.md。
+
+    Args:
+        tree: summary.md 内容的章节树（为空时在此解析）
+    """
+    outputs_dir = Path(output_dir)
+
+    # 保存 Markdown
+    summary_md_path = outputs_dir / "summary.md"
+    summary_with_qc = format_summary_md(summary, qc_issues)
+    if tree is None:
+        tree = summary_parser.parse_summary(summary_with_qc)
 
     with open(summary_md_path, "w", encoding="utf-8") as f:
         f.write(summary_with_qc)
     print(f"\n[保存] 完整摘要: {summary_md_path}")
 
-    # 保存结构化 JSON
+    # 保存结构化 JSON（在 summary.md 之后写入，HTML 阶段据 mtime 判断章节树是否最新）
     summary_json_path = outputs_dir / "summary.json"
     json_data = {
         "structured": structured_data,
         "qc_issues": qc_issues,
-        "full_text": summary
+        "full_text": summary,
+        "tree": tree
     }
     with open(summary_json_path, "w", encoding="utf-8") as f:
         json.dump(json_data, f, ensure_ascii=False, indent=2)
     print(f"[保存] 结构化数据: {summary_json_path}")
 
 
+def stage_manifest(config: dict, output_dir: str = "outputs") -> StageManifest:
+    """Reduce 阶段指纹：Map 结果与转写结果 + Reduce 生成参数 + 提示词"""
+    output_path = Path(output_dir)
+    return StageManifest(
+        "reduce_and_qc", output_dir,
+        inputs=[output_path / "maps.json", output_path / "transcript.json"],
+        outputs=[output_path / "summary.md", output_path / "summary.json", output_path / "quote_check.json"],
+        config=config,
+        config_keys=[
+            "summarizer.model", "summarizer.temperature", "summarizer.reduce_max_tokens",
+            "summarizer.reduce_intermediate_max_tokens", "summarizer.reduce_input_tokens",
+            "summarizer.reduce_fan_in", "summarizer.reduce_max_sections", "qc",
+            *llm_stream.GUARD_CONFIG_KEYS
+        ],
+        extra={"prompt": text_digest(
+            REDUCE_SYSTEM_PROMPT + REDUCE_PROMPT_TEMPLATE + INTERMEDIATE_REDUCE_PROMPT_TEMPLATE
+        )}
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Reduce 与质检")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="跳过 LLM 响应缓存读取（新结果仍会写入缓存）")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     try:
         print("=" * 60)
         print("Reduce 与质检")
@@ -284,50 +566,36 @@ def main():
 
         # 加载数据
         config = load_config()
-        maps = load_maps()
-        transcript = load_transcript()
-
-        # 初始化客户端
-        summarizer_config = config["summarizer"]
-        # Reduce 阶段需要更长的超时时间
-        reduce_timeout = summarizer_config.get("reduce_timeout", 300)  # 默认 5 分钟
-        http_client_kwargs = {
-            "base_url": summarizer_config["base_url"],
-            "timeout": reduce_timeout,
-            "follow_redirects": True
-        }
-        proxy_url = (
-            summarizer_config.get("proxy")
-            or summarizer_config.get("http_proxy")
-            or summarizer_config.get("https_proxy")
-        )
-        if proxy_url:
-            http_client_kwargs["proxy"] = proxy_url
+
+        manifest = stage_manifest(config, args.output_dir)
+        if not args.force and manifest.is_fresh():
+            print(manifest.skip_message())
+            print(f"  下一步: python generate_wechat_html.py")
+            return
+
+        start = time.time()
+        maps = load_maps(args.output_dir)
+        transcript = load_transcript(args.output_dir)
+        llm_log = []
+        cache = build_cache(config, bypass=args.no_cache)
 
         with ExitStack() as stack:
-            http_client = stack.enter_context(httpx.Client(**http_client_kwargs))
-            client = stack.enter_context(
-                OpenAI(
-                    base_url=summarizer_config["base_url"],
-                    api_key=summarizer_config["api_key"],
-                    http_client=http_client
-                )
-            )
-
-            print(f"\n[连接] LLM 服务: {summarizer_config['base_url']}")
-            print(f"  模型: {summarizer_config['model']}")
-            if proxy_url:
-                print(f"  代理: {proxy_url}")
+            # 初始化客户端（Reduce 阶段需要更长的超时时间，默认 5 分钟）
+            summarizer_config = config["summarizer"]
+            client = open_llm_client(stack, config, summarizer_config.get("reduce_timeout", 300))
 
             # 生成 Reduce 摘要
-            summary = generate_reduce_summary(client, maps, config)
+            summary = generate_reduce_summary(client, maps, config, cache, llm_log)
 
             # 质检时间戳
-            qc_issues = quality_check_timestamps(summary, transcript)
+            qc_issues = quality_check_failed_maps(maps)
+            qc_issues += quality_check_timestamps(summary, transcript)
+            qc_issues += quality_check_quotes(summary, maps, transcript, config, args.output_dir)
 
             # 提取结构化数据
             print("\n[提取] 结构化数据...")
-            structured_data = extract_structured_data(summary)
+            tree = summary_parser.parse_summary(format_summary_md(summary, qc_issues))
+            structured_data = extract_structured_data(summary, tree)
             print(f"  速览点: {len(structured_data['quick_overview'])}")
             print(f"  时间轴: {len(structured_data['timeline'])} 项")
             print(f"  主题数: {len(structured_data['key_points'])}")
@@ -335,7 +603,15 @@ def main():
             print(f"  术语: {len(structured_data['glossary'])}")
 
             # 保存结果
-            save_results(summary, structured_data, qc_issues)
+            save_results(summary, structured_data, qc_issues, args.output_dir, tree)
+            manifest.record()
+            metrics.record_stage(args.output_dir, "reduce_and_qc", {
+                "wall_seconds": round(time.time() - start, 2),
+                "qc_issues": len(qc_issues),
+                **metrics.llm_summary(llm_log)
+            }, config)
+
+        cache.report()
 
         # 总结
         print(f"\n{'=' * 60}")
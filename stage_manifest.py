@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+阶段指纹
+功能：记录每个阶段的输入文件哈希与其依赖的配置项，重跑时若指纹未变且产物仍在，
+     则跳过该阶段直接复用已有产物
+"""
+
+import json
+import hashlib
+from pathlib import Path
+
+
+def get_config_value(config: dict, dotted_key: str):
+    """按 "section.key" 形式读取配置，不存在时返回 None"""
+    value = config
+    for part in dotted_key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def file_digest(path: Path, known: dict = None) -> str:
+    """
+    计算文件 SHA-256
+
+    Args:
+        path: 文件路径
+        known: 上次记录的 {size, mtime, sha256}；大小与修改时间均未变时直接复用，避免重复读取大文件
+
+    Returns:
+        十六进制摘要
+    """
+    stat = path.stat()
+    if known and known.get("size") == stat.st_size and known.get("mtime") == stat.st_mtime:
+        return known["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageManifest:
+    """
+    单个阶段的指纹清单，保存在 <output_dir>/.manifests/<stage>.json
+    """
+
+    def __init__(self, stage: str, output_dir: str, inputs: list, outputs: list,
+                 config: dict, config_keys: list, extra: dict = None):
+        """
+        Args:
+            stage: 阶段名
+            output_dir: 输出目录
+            inputs: 输入文件路径列表
+            outputs: 产物路径列表
+            config: 配置字典
+            config_keys: 该阶段实际依赖的配置项（"section" 或 "section.key"）
+            extra: 其他影响结果的内容（如提示词模板、固定参数）
+        """
+        self.stage = stage
+        self.path = Path(output_dir) / ".manifests" / f"{stage}.json"
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.config_values = {key: get_config_value(config, key) for key in config_keys}
+        self.extra = extra or {}
+        # 阶段运行前的输入指纹：record() 写入的是阶段实际读取到的输入，而不是写入时的文件
+        self._input_records = self._hash_inputs(self._load())
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _hash_inputs(self, previous: dict) -> dict:
+        known = previous.get("inputs", {})
+        records = {}
+        for path in self.inputs:
+            if not path.exists():
+                continue
+            stat = path.stat()
+            records[str(path)] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": file_digest(path, known.get(str(path)))
+            }
+        return records
+
+    def fingerprint(self, input_records: dict) -> str:
+        payload = json.dumps(
+            {
+                "stage": self.stage,
+                "inputs": {p: r["sha256"] for p, r in input_records.items()},
+                "config": self.config_values,
+                "extra": self.extra
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_fresh(self) -> bool:
+        """输入、依赖配置均未变化且产物齐全时返回 True"""
+        if not all(p.exists() for p in self.inputs) or len(self._input_records) < len(set(self.inputs)):
+            return False
+
+        previous = self._load()
+        if not previous or previous.get("fingerprint") != self.fingerprint(self._input_records):
+            return False
+
+        return all(p.exists() for p in self.outputs)
+
+    def record(self):
+        """
+        阶段成功后写入指纹
+
+        记录创建清单时（阶段运行前）的输入哈希；阶段运行期间输入文件被改动时不写入指纹
+        并删除旧清单，下次运行重新执行该阶段。
+        """
+        current = self._hash_inputs({"inputs": self._input_records})
+        changed = [
+            path for path, record in self._input_records.items()
+            if current.get(path, {}).get("sha256") != record["sha256"]
+        ]
+        if changed:
+            print(f"  警告：{self.stage} 运行期间输入文件发生变化（{', '.join(changed)}），"
+                  f"不记录阶段指纹，下次运行将重新执行")
+            self.path.unlink(missing_ok=True)
+            return
+
+        # 运行前尚不存在的输入（如流式流水线中由本阶段生成的文件）以当前文件为准
+        input_records = {**current, **self._input_records}
+
+        manifest = {
+            "stage": self.stage,
+            "fingerprint": self.fingerprint(input_records),
+            "inputs": input_records,
+            "config": self.config_values,
+            "outputs": [str(p) for p in self.outputs]
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+
+    def skip_message(self) -> str:
+        return f"[跳过] {self.stage}: 输入与配置未变化，复用已有产物"
+
+
+def text_digest(text: str) -> str:
+    """文本（如提示词模板）的短哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式转写 + Map 摘要脚本
+功能：边转写边分块，每完成一个分块立即提交 Map 摘要，
+     使 GPU 转写与 LLM 摘要并行执行（总耗时约为 max(ASR, Map) 而非 ASR + Map）
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_router
+import metrics
+from llm_cache import build_cache
+from progress_file import PROGRESS_FILE_NAME
+import transcribe
+import chunk_and_map
+from transcribe import load_config, transcribe_audio, save_transcript, transcribe_metrics
+from chunk_and_map import ChunkBuilder, summarize_chunk, save_map_results, open_llm_client, map_stage_metrics
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="流式转写 + Map 摘要")
+    parser.add_argument("audio", help="WAV 音频文件，如 audio/demo_16k.wav（--in-memory 时可直接传入 .m4a）")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="通过 ffmpeg 管道直接解码到内存，不读写中间 WAV 文件")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="跳过 LLM 响应缓存读取（新结果仍会写入缓存）")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        print("=" * 60)
+        print("流式转写 + Map 摘要")
+        print("=" * 60)
+
+        config = load_config()
+        if args.in_memory:
+            config["asr"]["in_memory"] = True
+        cache = build_cache(config, bypass=args.no_cache)
+        summarizer_config = config["summarizer"]
+        max_concurrency = llm_router.total_concurrency(config)
+
+        builder = ChunkBuilder.from_config(config)
+        print(f"[分块] 目标大小: {builder.target_tokens} tokens，重叠: {builder.overlap_tokens} tokens")
+
+        start = time.time()
+        with ExitStack() as stack:
+            client = open_llm_client(stack, config, summarizer_config.get("timeout", 120))
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=max_concurrency))
+            futures = []
+
+            def submit(chunk: dict):
+                futures.append(
+                    executor.submit(summarize_chunk, client, chunk, len(futures), config, cache)
+                )
+
+            def on_segment(seg: dict):
+                chunk = builder.add(seg)
+                if chunk is not None:
+                    submit(chunk)
+
+            # 转写过程中每完成一个分块就提交 Map
+            transcript = transcribe_audio(
+                args.audio, config, on_segment=on_segment,
+                progress_path=Path(args.output_dir) / PROGRESS_FILE_NAME
+            )
+            asr_elapsed = time.time() - start
+            save_transcript(transcript, Path(args.output_dir) / "transcript.json")
+
+            last_chunk = builder.finish()
+            if last_chunk is not None:
+                submit(last_chunk)
+
+            print(f"\n[等待] 转写完成（{asr_elapsed:.1f}s），等待剩余 Map 请求...")
+            maps = [future.result() for future in futures]
+
+        total_elapsed = time.time() - start
+
+        save_map_results(maps, args.output_dir)
+        # 两个阶段重叠执行，Map 的墙钟耗时记为整个流水线的耗时
+        metrics.record_stage(
+            args.output_dir, "transcribe", transcribe_metrics(transcript, asr_elapsed, config), config
+        )
+        metrics.record_stage(args.output_dir, "chunk_and_map", map_stage_metrics(maps, total_elapsed), config)
+
+        # 记录与分步执行相同的阶段指纹，后续 make run 可跳过这两个阶段
+        transcribe.stage_manifest(args.audio, config, args.output_dir).record()
+        success_count = sum(1 for m in maps if "error" not in m)
+        if success_count == len(maps):
+            chunk_and_map.stage_manifest(config, args.output_dir).record()
+        cache.report()
+
+        print(f"\n{'=' * 60}")
+        print(f"✓ 流式转写与 Map 阶段完成")
+        print(f"  转写耗时: {asr_elapsed:.1f}s，总耗时: {total_elapsed:.1f}s")
+        print(f"  片段数: {len(transcript['segments'])}，分块数: {len(maps)}")
+        print(f"  成功: {success_count}/{len(maps)}")
+        print(f"  下一步: python reduce_and_qc.py")
+        print(f"{'=' * 60}")
+
+    except Exception as e:
+        print(f"\n✗ 处理失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
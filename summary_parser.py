@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+摘要解析
+功能：逐行扫描一次 summary.md，构建章节树（速览、时间轴、深度要点、引文、结论、术语表等），
+     树随 summary.json 一起保存；结构化提取与 HTML 生成都从树读取，不再反复扫描全文
+
+章节树结构：
+  {
+    "version": 1,
+    "title": "播客总结",                  # 第一个一级标题
+    "preamble_html": "...",               # 第一个二级标题之前的内容
+    "sections": [
+      {
+        "title": "一屏速览（3-5点）",
+        "kind": "overview",               # 见 SECTION_KINDS，无法识别时为 "other"
+        "items": ["..."],                 # 本节（不含小节）的列表项
+        "quotes": [{"text": "...", "time": "12:31-12:50"}],
+        "subsections": [{"title": "...", "items": [...], "quotes": [...]}],
+        "html": "..."                     # 本节渲染后的 HTML（含标题，未加样式）
+      }
+    ]
+  }
+"""
+
+import re
+
+import markdown2
+
+
+TREE_VERSION = 1
+
+MARKDOWN_EXTRAS = ["tables", "fenced-code-blocks"]
+
+# 二级标题前缀 → 章节类型
+SECTION_KINDS = [
+    ("一屏速览", "overview"),
+    ("时间轴目录", "timeline"),
+    ("深度要点", "topics"),
+    ("结论/启示/行动建议", "conclusions"),
+    ("人名/组织/术语表", "glossary"),
+    ("⚠ 质检提醒", "qc")
+]
+
+ITEM_PATTERN = re.compile(r'^\s*[-*] (.+)$')
+QUOTE_PATTERN = re.compile(r'^\s*>\s*["“「](.+?)["”」]\s*(?:\[([^\]]+)\])?')
+TIMELINE_PATTERN = re.compile(r'^\[([^\]]+)\] (.+)$')
+GLOSSARY_PATTERN = re.compile(r'^\*\*([^*]+)\*\*')
+
+
+def section_kind(title: str) -> str:
+    """按标题前缀识别章节类型"""
+    for prefix, kind in SECTION_KINDS:
+        if title.startswith(prefix):
+            return kind
+    return "other"
+
+
+def _new_block(title: str) -> dict:
+    return {"title": title, "items": [], "quotes": []}
+
+
+def parse_summary(md_text: str, render_html: bool = True) -> dict:
+    """
+    解析摘要 Markdown 为章节树（单遍逐行扫描）
+
+    Args:
+        md_text: 摘要 Markdown
+        render_html: 是否同时把每个章节渲染为 HTML（HTML 阶段直接使用）
+
+    Returns:
+        章节树
+    """
+    tree = {"version": TREE_VERSION, "title": None, "sections": []}
+    preamble_lines = []
+    section = None
+    block = None          # 当前收集列表项与引文的位置：章节本身或其最后一个小节
+    section_lines = []
+    in_fence = False
+
+    def close_section():
+        if section is not None and render_html:
+            section["html"] = markdown2.markdown("\n".join(section_lines), extras=MARKDOWN_EXTRAS)
+
+    for line in md_text.split("\n"):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+
+        if not in_fence:
+            if tree["title"] is None and line.startswith("# "):
+                tree["title"] = line[2:].strip()
+                continue
+
+            if line.startswith("## "):
+                close_section()
+                title = line[3:].strip()
+                section = dict(_new_block(title), kind=section_kind(title), subsections=[])
+                tree["sections"].append(section)
+                block = section
+                section_lines = [line]
+                continue
+
+            if line.startswith("### ") and section is not None:
+                block = _new_block(line[4:].strip())
+                section["subsections"].append(block)
+                section_lines.append(line)
+                continue
+
+            if block is not None:
+                quote = QUOTE_PATTERN.match(line)
+                if quote:
+                    block["quotes"].append({"text": quote.group(1).strip(), "time": quote.group(2)})
+                else:
+                    item = ITEM_PATTERN.match(line)
+                    if item:
+                        block["items"].append(item.group(1).strip())
+
+        if section is None:
+            preamble_lines.append(line)
+        else:
+            section_lines.append(line)
+
+    close_section()
+    if render_html:
+        preamble = "\n".join(preamble_lines)
+        tree["preamble_html"] = markdown2.markdown(preamble, extras=MARKDOWN_EXTRAS) if preamble.strip() else ""
+
+    return tree
+
+
+def sections_of_kind(tree: dict, kind: str) -> list:
+    return [s for s in tree["sections"] if s["kind"] == kind]
+
+
+def structured_data(tree: dict) -> dict:
+    """
+    从章节树提取结构化数据（与 summary.json 中 structured 字段的格式一致）
+
+    Returns:
+        {quick_overview, timeline, key_points, conclusions, glossary}
+    """
+    data = {
+        "quick_overview": [],
+        "timeline": [],
+        "key_points": {},
+        "conclusions": [],
+        "glossary": []
+    }
+
+    for section in sections_of_kind(tree, "overview"):
+        data["quick_overview"].extend(section["items"])
+
+    for section in sections_of_kind(tree, "timeline"):
+        for item in section["items"]:
+            match = TIMELINE_PATTERN.match(item)
+            if match:
+                data["timeline"].append({"time": match.group(1), "title": match.group(2)})
+
+    for section in sections_of_kind(tree, "topics"):
+        for sub in section["subsections"]:
+            data["key_points"][sub["title"]] = sub["items"]
+
+    for section in sections_of_kind(tree, "conclusions"):
+        data["conclusions"].extend(section["items"])
+
+    for section in sections_of_kind(tree, "glossary"):
+        for item in section["items"]:
+            match = GLOSSARY_PATTERN.match(item)
+            if match:
+                data["glossary"].append(match.group(1))
+
+    return data
+
+
+def all_quotes(tree: dict) -> list:
+    """按出现顺序返回全部引文"""
+    quotes = []
+    for section in tree["sections"]:
+        quotes.extend(section["quotes"])
+        for sub in section["subsections"]:
+            quotes.extend(sub["quotes"])
+    return quotes
+
+
+def is_current(tree: dict) -> bool:
+    """缓存的章节树是否可直接用于渲染（版本一致且包含 HTML）"""
+    return (
+        isinstance(tree, dict)
+        and tree.get("version") == TREE_VERSION
+        and "preamble_html" in tree
+        and all("html" in s for s in tree.get("sections", []))
+    )
@@ -5,11 +5,31 @@
 功能：使用 faster-whisper 将音频转写为带时间戳的文本
 """
 
+import os
 import sys
 import json
+import time
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import yaml
-from faster_whisper import WhisperModel
+import httpx
+import numpy as np
+from faster_whisper import WhisperModel, decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+import metrics
+import transcript_store
+from prep_audio import SAMPLE_RATE, decode_audio_pcm, write_wav
+from progress_file import ProgressWriter, PROGRESS_FILE_NAME
+from stage_manifest import StageManifest
+
+
+# 进程池中每个 worker 各自持有的模型
+_worker_model = None
+
+# 显式固定 VAD 最短语音时长：faster-whisper 1.1 起默认值由 250ms 改为 0，会保留更多极短的噪声片段
+VAD_MIN_SPEECH_MS = 250
 
 
 def load_config():
@@ -22,24 +42,17 @@ def load_config():
         return yaml.safe_load(f)
 
 
-def transcribe_audio(audio_path: str, config: dict) -> dict:
+def load_model(asr_config: dict, cpu_threads: int = None) -> WhisperModel:
     """
-    转写音频文件
+    加载 Whisper 模型
 
     Args:
-        audio_path: WAV 音频文件路径
-        config: 配置字典
+        asr_config: config.yaml 中的 asr 配置
+        cpu_threads: CPU 推理线程数（默认取 asr.cpu_threads，0 表示由 CTranslate2 自动决定）
 
     Returns:
-        转写结果字典
+        WhisperModel 实例
     """
-    audio_file = Path(audio_path)
-
-    if not audio_file.exists():
-        raise FileNotFoundError(f"音频文件不存在: {audio_path}")
-
-    asr_config = config["asr"]
-
     # 确定使用本地模型还是在线模型
     model_path = asr_config.get("model_path")
     if model_path and Path(model_path).exists():
@@ -55,26 +68,134 @@ def transcribe_audio(audio_path: str, config: dict) -> dict:
     print(f"  计算类型: {asr_config['compute_type']}")
 
     # 初始化 Whisper 模型
-    model = WhisperModel(
+    return WhisperModel(
         model_size_or_path=model_source,
         device=asr_config["device"],
         compute_type=asr_config["compute_type"],
+        cpu_threads=cpu_threads if cpu_threads is not None else asr_config.get("cpu_threads", 0),
         download_root="models"  # 指定下载目录
     )
 
+
+def load_audio(audio_path: str, asr_config: dict) -> np.ndarray:
+    """
+    将音频加载为 16kHz 单声道 float32 数组
+
+    asr.in_memory 为 true 时直接通过 ffmpeg 管道解码原始音频（可为 .m4a），
+    不经过中间 WAV 文件；asr.keep_wav 为 true 时另存一份 WAV 便于调试。
+
+    Args:
+        audio_path: 音频文件路径
+        asr_config: config.yaml 中的 asr 配置
+
+    Returns:
+        float32 音频数组
+    """
+    if not asr_config.get("in_memory", False):
+        return decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
+
+    audio = decode_audio_pcm(audio_path)
+    if asr_config.get("keep_wav", False):
+        audio_file = Path(audio_path)
+        write_wav(audio, audio_file.parent / f"{audio_file.stem}_16k.wav")
+    return audio
+
+
+def decode(model: WhisperModel, audio, asr_config: dict):
+    """
+    用已加载的模型解码音频
+
+    asr.batch_size 大于 1 时使用 faster-whisper 的 BatchedInferencePipeline（与 model 共用同一份权重）：
+    先按 VAD 把音频切成不超过 30 秒的语音窗口，每 batch_size 个窗口合并为一次 CTranslate2 前向计算，
+    片段按原顺序返回且时间戳已是全局时间。批量模式依赖 VAD 切分，总是启用 vad_filter；
+    窗口之间相互独立，不以前文为提示（condition_on_previous_text），也没有温度回退。
+
+    Args:
+        model: Whisper 模型
+        audio: 音频文件路径或 16kHz float32 数组
+        asr_config: config.yaml 中的 asr 配置
+
+    Returns:
+        (片段生成器, 转写信息)，与 WhisperModel.transcribe 相同
+    """
+    options = {
+        "language": asr_config.get("language", "zh"),
+        "beam_size": asr_config.get("beam_size", 5)
+    }
+
+    batch_size = asr_config.get("batch_size", 1)
+    if batch_size <= 1:
+        return model.transcribe(
+            audio,
+            vad_filter=asr_config.get("vad_filter", True),
+            vad_parameters={"min_speech_duration_ms": VAD_MIN_SPEECH_MS},
+            **options
+        )
+
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:
+        raise RuntimeError("asr.batch_size 需要 faster-whisper>=1.1.0（pip install -U faster-whisper）")
+
+    if not asr_config.get("vad_filter", True):
+        print("  提示：批量解码按 VAD 切分音频，忽略 vad_filter: false")
+    print(f"  批量解码: 每批 {batch_size} 个语音窗口")
+    return BatchedInferencePipeline(model=model).transcribe(
+        audio,
+        vad_filter=True,
+        # 与 BatchedInferencePipeline 的默认切分相同（窗口上限由管线设为 30 秒），只固定最短语音时长
+        vad_parameters={"min_silence_duration_ms": 160, "min_speech_duration_ms": VAD_MIN_SPEECH_MS},
+        # 默认不预测时间戳 token，每个语音窗口只输出一个长达 30 秒的片段
+        without_timestamps=False,
+        batch_size=batch_size,
+        **options
+    )
+
+
+def transcribe_audio(audio_path: str, config: dict, on_segment=None,
+                     model: WhisperModel = None, progress_path: str = None) -> dict:
+    """
+    转写音频文件
+
+    Args:
+        audio_path: WAV 音频文件路径（asr.in_memory 为 true 时可直接传入原始音频）
+        config: 配置字典
+        on_segment: 每解码出一个片段就调用的回调（可选），参数为片段字典
+        model: 已加载的 Whisper 模型（可选，常驻服务复用同一模型时传入）
+        progress_path: 进度文件路径（可选），转写过程中定期原子写入已解码时长、RTF 与 ETA
+
+    Returns:
+        转写结果字典
+    """
+    audio_file = Path(audio_path)
+
+    if not audio_file.exists():
+        raise FileNotFoundError(f"音频文件不存在: {audio_path}")
+
+    asr_config = config["asr"]
+    if model is None and asr_config.get("num_workers", 1) > 1:
+        return transcribe_sharded(audio_path, config, on_segment=on_segment, progress_path=progress_path)
+
+    if model is None:
+        model = load_model(asr_config)
+
+    progress = None
+    if progress_path is not None:
+        progress = ProgressWriter(progress_path, audio_file, asr_config.get("progress_interval", 2.0))
+
+    # 内存模式下直接把 PCM 数组交给模型，否则由 faster-whisper 读取 WAV 文件
+    audio = load_audio(audio_path, asr_config) if asr_config.get("in_memory", False) else str(audio_file)
+
     print(f"\n[转写] 处理文件: {audio_file.name}")
     print("  这可能需要几分钟，请耐心等待...")
 
     # 执行转写
-    segments, info = model.transcribe(
-        str(audio_file),
-        language=asr_config.get("language", "zh"),
-        vad_filter=asr_config.get("vad_filter", True),
-        beam_size=5
-    )
+    segments, info = decode(model, audio, asr_config)
 
     print(f"\n[检测] 语言: {info.language}")
     print(f"  时长: {info.duration:.2f} 秒")
+    if progress is not None:
+        progress.set_duration(info.duration)
 
     # 构建结果
     result = {
@@ -83,28 +204,252 @@ def transcribe_audio(audio_path: str, config: dict) -> dict:
         "segments": []
     }
 
-    # 收集所有片段
+    # 收集所有片段（segments 是惰性生成器，解码在迭代时进行）
     print("\n[收集] 转写片段:")
-    for seg in segments:
-        segment_data = {
-            "id": seg.id,
-            "start": round(seg.start, 2),
-            "end": round(seg.end, 2),
+    try:
+        for seg in segments:
+            # 按接收顺序编号（批量解码的片段不保证带连续的 id）
+            segment_data = {
+                "id": len(result["segments"]) + 1,
+                "start": round(seg.start, 2),
+                "end": round(seg.end, 2),
+                "text": seg.text.strip()
+            }
+            result["segments"].append(segment_data)
+            if on_segment is not None:
+                on_segment(segment_data)
+            if progress is not None:
+                progress.update(seg.end, len(result["segments"]))
+
+            # 显示前 5 条和最后 1 条
+            seg_id = segment_data["id"]
+            if seg_id < 5 or seg_id == result["segments"][-1]["id"]:
+                print(f"  [{seg_id}] {seg.start:.2f}s - {seg.end:.2f}s: {seg.text[:50]}...")
+            elif seg_id == 5:
+                print("  ...")
+    except Exception as e:
+        if progress is not None:
+            progress.fail(str(e))
+        raise
+
+    if progress is not None:
+        progress.finish()
+
+    print(f"\n  共 {len(result['segments'])} 个片段")
+
+    return result
+
+
+def find_split_points(audio: np.ndarray, num_shards: int) -> list:
+    """
+    在静音处寻找切分点，将音频分为 num_shards 段
+
+    以均分位置为目标，选择离目标最近的 VAD 静音间隙中点作为切分点，
+    避免把一句话切成两半；找不到静音间隙时退回均分位置。
+
+    Args:
+        audio: 16kHz 单声道 float32 音频
+        num_shards: 分段数
+
+    Returns:
+        切分点列表（采样点下标，不含首尾）
+    """
+    speech = get_speech_timestamps(
+        audio, VadOptions(min_silence_duration_ms=500, min_speech_duration_ms=VAD_MIN_SPEECH_MS)
+    )
+    gaps = [
+        (prev["end"] + cur["start"]) // 2
+        for prev, cur in zip(speech, speech[1:])
+    ]
+
+    points = []
+    for k in range(1, num_shards):
+        target = len(audio) * k // num_shards
+        lower = points[-1] if points else 0
+        candidates = [g for g in gaps if g > lower]
+        point = min(candidates, key=lambda g: abs(g - target)) if candidates else target
+        if point <= lower:
+            point = target
+        if lower < point < len(audio):
+            points.append(point)
+
+    return points
+
+
+def _init_shard_worker(asr_config: dict, cpu_threads: int):
+    """进程池初始化：每个 worker 加载一份模型"""
+    global _worker_model
+    _worker_model = load_model(asr_config, cpu_threads=cpu_threads)
+
+
+def _transcribe_shard(args: tuple) -> tuple:
+    """
+    在 worker 中转写一个音频分段
+
+    Args:
+        args: (分段序号, 分段起始秒数, 音频数组, asr 配置)
+
+    Returns:
+        (检测语言, 片段列表)，片段时间已换算为全局时间
+    """
+    index, offset, audio, asr_config = args
+    segments, info = decode(_worker_model, audio, asr_config)
+
+    results = [
+        {
+            "start": round(seg.start + offset, 2),
+            "end": round(seg.end + offset, 2),
             "text": seg.text.strip()
         }
-        result["segments"].append(segment_data)
+        for seg in segments
+    ]
+    print(f"  [分段 {index + 1}] 完成: {len(results)} 个片段")
+    return info.language, results
 
-        # 显示前 5 条和最后 1 条
-        if seg.id < 5 or seg.id == result["segments"][-1]["id"]:
-            print(f"  [{seg.id}] {seg.start:.2f}s - {seg.end:.2f}s: {seg.text[:50]}...")
-        elif seg.id == 5:
-            print("  ...")
 
-    print(f"\n  共 {len(result['segments'])} 个片段")
+def transcribe_sharded(audio_path: str, config: dict, on_segment=None, progress_path: str = None) -> dict:
+    """
+    多进程分段转写
+
+    在静音处把音频切成 asr.num_workers 段，由进程池并行转写（每个进程独立加载模型，
+    平分 asr.cpu_threads），再按顺序拼接片段、换算全局时间戳并重新编号。
+
+    Args:
+        audio_path: WAV 音频文件路径
+        config: 配置字典
+        on_segment: 每拼接一个片段就调用的回调（可选），参数为片段字典
+        progress_path: 进度文件路径（可选），按分段完成顺序更新
+
+    Returns:
+        转写结果字典（与 transcribe_audio 相同）
+    """
+    asr_config = config["asr"]
+    num_workers = asr_config["num_workers"]
+    total_threads = asr_config.get("cpu_threads") or os.cpu_count() or num_workers
+    cpu_threads = max(1, total_threads // num_workers)
+
+    print(f"\n[转写] 分段并行处理文件: {Path(audio_path).name}")
+    print(f"  进程数: {num_workers}，每进程线程数: {cpu_threads}")
+
+    progress = None
+    if progress_path is not None:
+        progress = ProgressWriter(progress_path, audio_path, asr_config.get("progress_interval", 2.0))
+
+    audio = load_audio(audio_path, asr_config)
+    duration = len(audio) / SAMPLE_RATE
+    if progress is not None:
+        progress.set_duration(duration)
+
+    bounds = [0] + find_split_points(audio, num_workers) + [len(audio)]
+    shards = [
+        (i, start / SAMPLE_RATE, audio[start:end], asr_config)
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+    ]
+    for i, _, shard_audio, _ in shards:
+        start = bounds[i] / SAMPLE_RATE
+        print(f"  分段 {i + 1}: {start:.2f}s - {start + len(shard_audio) / SAMPLE_RATE:.2f}s")
+
+    result = {
+        "language": asr_config.get("language", "zh"),
+        "duration": round(duration, 2),
+        "segments": []
+    }
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_shard_worker,
+        initargs=(asr_config, cpu_threads)
+    ) as executor:
+        # executor.map 按分段顺序返回结果，可直接拼接
+        try:
+            for index, (language, segments) in enumerate(executor.map(_transcribe_shard, shards)):
+                if index == 0:
+                    result["language"] = language
+                for seg in segments:
+                    segment_data = {"id": len(result["segments"]) + 1, **seg}
+                    result["segments"].append(segment_data)
+                    if on_segment is not None:
+                        on_segment(segment_data)
+                if progress is not None:
+                    progress.update(bounds[index + 1] / SAMPLE_RATE, len(result["segments"]))
+        except Exception as e:
+            if progress is not None:
+                progress.fail(str(e))
+            raise
+
+    if progress is not None:
+        progress.finish()
+
+    print(f"\n[检测] 语言: {result['language']}")
+    print(f"  时长: {duration:.2f} 秒")
+    print(f"  共 {len(result['segments'])} 个片段")
 
     return result
 
 
+def transcribe_via_server(audio_path: str, config: dict, server_url: str) -> dict:
+    """
+    通过常驻 ASR 服务（asr_server.py）转写，省去每次加载模型的开销
+
+    Args:
+        audio_path: 音频文件路径（服务端需能访问同一路径）
+        config: 配置字典
+        server_url: 服务地址，如 http://127.0.0.1:8765
+
+    Returns:
+        转写结果字典（与 transcribe_audio 相同）
+    """
+    asr_config = config["asr"]
+    payload = {
+        "audio_path": str(Path(audio_path).resolve()),
+        "in_memory": asr_config.get("in_memory", False)
+    }
+
+    print(f"[转写] 提交到 ASR 服务: {server_url}")
+    print(f"  文件: {payload['audio_path']}")
+
+    # 转写时长与音频长度相关，不设读取超时
+    timeout = httpx.Timeout(10.0, read=None)
+    response = httpx.post(f"{server_url.rstrip('/')}/transcribe", json=payload, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"ASR 服务返回错误 ({response.status_code}): {response.text}")
+
+    result = response.json()
+    print(f"\n[检测] 语言: {result['language']}")
+    print(f"  时长: {result['duration']:.2f} 秒")
+    print(f"  共 {len(result['segments'])} 个片段")
+    return result
+
+
+def stage_manifest(audio_path: str, config: dict, output_dir: str = "outputs") -> StageManifest:
+    """转写阶段指纹：输入音频 + 影响转写结果的 asr 配置"""
+    return StageManifest(
+        "transcribe", output_dir,
+        inputs=[audio_path],
+        outputs=[Path(output_dir) / "transcript.json"],
+        config=config,
+        config_keys=[
+            "asr.model_size", "asr.model_path", "asr.compute_type",
+            "asr.language", "asr.vad_filter", "asr.num_workers", "asr.batch_size",
+            "asr.beam_size"
+        ]
+    )
+
+
+def transcribe_metrics(transcript: dict, wall_seconds: float, config: dict) -> dict:
+    """转写阶段的性能指标；实时率 RTF = 墙钟耗时 / 音频时长（info.duration）"""
+    duration = transcript["duration"]
+    return {
+        "wall_seconds": round(wall_seconds, 2),
+        "audio_seconds": duration,
+        "rtf": round(wall_seconds / duration, 4) if duration else None,
+        "segments": len(transcript["segments"]),
+        "num_workers": config["asr"].get("num_workers", 1),
+        "batch_size": config["asr"].get("batch_size", 1),
+        "model": config["asr"].get("model_path") or config["asr"]["model_size"]
+    }
+
+
 def save_transcript(transcript: dict, output_path: str):
     """保存转写结果"""
     output_file = Path(output_path)
@@ -113,27 +458,66 @@ def save_transcript(transcript: dict, output_path: str):
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(transcript, f, ensure_ascii=False, indent=2)
 
-    print(f"\n[保存] 转写结果: {output_file}")
+    # 列式副本供后续阶段内存映射读取；JSON 保留用于导出与人工查看
+    col_dir = output_file.parent / transcript_store.COLUMNAR_DIR_NAME
+    transcript_store.save_columnar(transcript, col_dir)
 
+    print(f"\n[保存] 转写结果: {output_file}（列式: {col_dir}）")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="语音转写",
+        epilog="示例: python transcribe.py audio/demo_16k.wav"
+    )
+    parser.add_argument("audio", help="WAV 音频文件（--in-memory 时可直接传入 .m4a 等原始音频）")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="通过 ffmpeg 管道直接解码到内存，不读写中间 WAV 文件")
+    parser.add_argument("--server", metavar="URL",
+                        help="使用常驻 ASR 服务转写（默认取 asr.server_url），如 http://127.0.0.1:8765")
+    parser.add_argument("--output-dir", default="outputs", help="输出目录（默认 outputs）")
+    parser.add_argument("--force", action="store_true", help="忽略阶段指纹，强制重新执行")
+    return parser.parse_args()
 
-def main():
-    if len(sys.argv) < 2:
-        print("用法: python transcribe.py <WAV音频文件>")
-        print("示例: python transcribe.py audio/demo_16k.wav")
-        sys.exit(1)
 
-    audio_path = sys.argv[1]
+def main():
+    args = parse_args()
+    audio_path = args.audio
 
     try:
         # 加载配置
         config = load_config()
-
-        # 执行转写
-        transcript = transcribe_audio(audio_path, config)
+        if args.in_memory:
+            config["asr"]["in_memory"] = True
+
+        manifest = stage_manifest(audio_path, config, args.output_dir)
+        if not args.force and manifest.is_fresh():
+            print(manifest.skip_message())
+            print(f"  下一步: python chunk_and_map.py")
+            return
+
+        # 执行转写：优先使用常驻 ASR 服务，不可达时退回本地加载模型
+        start = time.time()
+        server_url = args.server or config["asr"].get("server_url")
+        transcript = None
+        if server_url:
+            try:
+                transcript = transcribe_via_server(audio_path, config, server_url)
+            except httpx.ConnectError:
+                print(f"  警告：无法连接 ASR 服务 {server_url}，改为本地转写")
+        if transcript is None:
+            transcript = transcribe_audio(
+                audio_path, config, progress_path=Path(args.output_dir) / PROGRESS_FILE_NAME
+            )
 
         # 保存结果
-        output_path = "outputs/transcript.json"
+        output_path = Path(args.output_dir) / "transcript.json"
         save_transcript(transcript, output_path)
+        manifest.record()
+        metrics.record_stage(
+            args.output_dir, "transcribe", transcribe_metrics(transcript, time.time() - start, config), config
+        )
 
         print(f"\n[OK] 转写完成")
         print(f"  总时长: {transcript['duration']:.2f} 秒 ({transcript['duration']/60:.1f} 分钟)")
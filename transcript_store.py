@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转写结果列式存储
+功能：将 transcript.json 另存为列式目录 transcript.col/（id/start/end 为 NumPy 数组，
+     文本为连续 UTF-8 字节块 + 偏移数组），读取时内存映射、按需解码，各阶段共用同一加载接口
+
+目录结构：
+  transcript.col/
+    meta.json     语言、时长、片段数
+    ids.npy       int32   片段 id
+    starts.npy    float64 起始秒
+    ends.npy      float64 结束秒
+    offsets.npy   int64   每个片段文本在 text.bin 中的起始字节（长度为 片段数+1）
+    text.bin      所有片段文本按顺序拼接的 UTF-8 字节
+
+用法：
+  python transcript_store.py convert outputs/transcript.json   # JSON → 列式
+  python transcript_store.py export outputs/transcript.col     # 列式 → JSON
+"""
+
+import sys
+import json
+import mmap
+import shutil
+from pathlib import Path
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+COLUMNAR_DIR_NAME = "transcript.col"
+JSON_NAME = "transcript.json"
+FORMAT_VERSION = 1
+
+
+def save_columnar(transcript: dict, col_dir: str):
+    """
+    保存为列式目录（先写临时目录再替换，读取方不会看到写了一半的数据）
+
+    Args:
+        transcript: 转写结果字典
+        col_dir: 列式目录路径
+    """
+    col_dir = Path(col_dir)
+    tmp_dir = col_dir.with_name(col_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    segments = transcript["segments"]
+    encoded = [seg["text"].encode("utf-8") for seg in segments]
+    offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    np.save(tmp_dir / "ids.npy", np.array([seg["id"] for seg in segments], dtype=np.int32))
+    np.save(tmp_dir / "starts.npy", np.array([seg["start"] for seg in segments], dtype=np.float64))
+    np.save(tmp_dir / "ends.npy", np.array([seg["end"] for seg in segments], dtype=np.float64))
+    np.save(tmp_dir / "offsets.npy", offsets)
+    with open(tmp_dir / "text.bin", "wb") as f:
+        f.write(b"".join(encoded))
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "language": transcript.get("language"),
+        "duration": transcript.get("duration", 0),
+        "segment_count": len(segments)
+    }
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(col_dir, ignore_errors=True)
+    tmp_dir.rename(col_dir)
+
+
+class SegmentView(Sequence):
+    """片段序列视图：按下标访问时才解码对应片段，返回与 JSON 相同的字典"""
+
+    def __init__(self, transcript: "ColumnarTranscript"):
+        self._t = transcript
+
+    def __len__(self):
+        return len(self._t.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._t.segment(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._t.segment(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._t.segment(i)
+
+
+class ColumnarTranscript(Mapping):
+    """
+    内存映射的转写结果
+
+    与 transcript.json 解析出的字典接口一致（transcript["duration"]、
+    transcript["segments"][i]["text"] 等），同时暴露 ids/starts/ends 数组供向量化访问。
+    """
+
+    def __init__(self, col_dir: str):
+        col_dir = Path(col_dir)
+        with open(col_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.ids = np.load(col_dir / "ids.npy", mmap_mode="r")
+        self.starts = np.load(col_dir / "starts.npy", mmap_mode="r")
+        self.ends = np.load(col_dir / "ends.npy", mmap_mode="r")
+        self.offsets = np.load(col_dir / "offsets.npy", mmap_mode="r")
+
+        # 空文件无法 mmap
+        with open(col_dir / "text.bin", "rb") as f:
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+        self._data = {
+            "language": self.meta["language"],
+            "duration": self.meta["duration"],
+            "segments": SegmentView(self)
+        }
+
+    def text(self, index: int) -> str:
+        """第 index 个片段的文本"""
+        return self._text[int(self.offsets[index]):int(self.offsets[index + 1])].decode("utf-8")
+
+    def segment(self, index: int) -> dict:
+        """第 index 个片段（与 JSON 中的片段字典相同）"""
+        return {
+            "id": int(self.ids[index]),
+            "start": float(self.starts[index]),
+            "end": float(self.ends[index]),
+            "text": self.text(index)
+        }
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def to_dict(self) -> dict:
+        """转换为普通字典（用于导出 JSON）"""
+        return {
+            "language": self["language"],
+            "duration": self["duration"],
+            "segments": list(self["segments"])
+        }
+
+
+def _columnar_is_current(col_dir: Path, json_path: Path) -> bool:
+    if not (col_dir / "meta.json").exists():
+        return False
+    if not json_path.exists():
+        return True
+    # JSON 被手动修改或重新生成后，旧的列式数据作废
+    return (col_dir / "meta.json").stat().st_mtime >= json_path.stat().st_mtime
+
+
+def load_transcript(output_dir: str = "outputs", convert: bool = True):
+    """
+    加载转写结果（各阶段共用）
+
+    优先读取列式目录；只有 transcript.json 时解析 JSON 并顺便生成列式目录，
+    下次加载即可直接内存映射。
+
+    Args:
+        output_dir: 输出目录
+        convert: 是否顺便生成列式目录（进度查看等只读场景传 False，不写任何文件）
+
+    Returns:
+        ColumnarTranscript（或无法写列式目录时的 JSON 字典），两者接口一致
+    """
+    output_dir = Path(output_dir)
+    col_dir = output_dir / COLUMNAR_DIR_NAME
+    json_path = output_dir / JSON_NAME
+
+    if _columnar_is_current(col_dir, json_path):
+        return ColumnarTranscript(col_dir)
+
+    if not json_path.exists():
+        raise FileNotFoundError(f"未找到 {json_path}，请先运行 transcribe.py")
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+
+    if not convert:
+        return transcript
+
+    try:
+        save_columnar(transcript, col_dir)
+    except OSError as e:
+        print(f"  警告：生成列式转写文件失败（{e}），继续使用 JSON")
+        return transcript
+
+    return ColumnarTranscript(col_dir)
+
+
+def load_transcript_meta(output_dir: str = "outputs") -> dict:
+    """
+    只读取语言、时长与片段数（列式目录可用时不加载片段，且不写任何文件）
+
+    Returns:
+        {language, duration, segment_count}；转写结果不存在时返回 None
+    """
+    output_dir = Path(output_dir)
+    col_dir = output_dir / COLUMNAR_DIR_NAME
+    json_path = output_dir / JSON_NAME
+
+    if _columnar_is_current(col_dir, json_path):
+        with open(col_dir / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    if not json_path.exists():
+        return None
+
+    transcript = load_transcript(output_dir, convert=False)
+    return {
+        "language": transcript["language"],
+        "duration": transcript["duration"],
+        "segment_count": len(transcript["segments"])
+    }
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "export"):
+        print("用法:")
+        print("  python transcript_store.py convert <transcript.json>   # 生成列式目录")
+        print("  python transcript_store.py export <transcript.col>     # 导出为 JSON")
+        sys.exit(1)
+
+    command, path = sys.argv[1], Path(sys.argv[2])
+
+    try:
+        if command == "convert":
+            with open(path, "r", encoding="utf-8") as f:
+                transcript = json.load(f)
+            col_dir = path.parent / COLUMNAR_DIR_NAME
+            save_columnar(transcript, col_dir)
+            print(f"✓ 已生成列式转写: {col_dir}（{len(transcript['segments'])} 个片段）")
+        else:
+            transcript = ColumnarTranscript(path).to_dict()
+            json_path = path.parent / JSON_NAME
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(transcript, f, ensure_ascii=False, indent=2)
+            print(f"✓ 已导出 JSON: {json_path}（{len(transcript['segments'])} 个片段）")
+
+    except Exception as e:
+        print(f"\n✗ 处理失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()